@@ -1,9 +1,13 @@
 import streamlit as st
 import os
-import tempfile
 import base64
 from datetime import datetime
-from cybergen_template import insert_text_into_template, copy_document_to_template, parse_document
+from generation import generate_from_text, generate_from_document, generate_merged
+from cybergen_template import MergePart
+from import_range import parse_range_spec
+from preview import DocumentPreview
+from job_control import JobControl, default_timeout, describe_progress
+from scratch import ScratchQuotaExceeded, estimate_job_bytes, get_scratch
 
 # Set page configuration
 st.set_page_config(
@@ -12,6 +16,26 @@ st.set_page_config(
     layout="wide"
 )
 
+# Progress bar for a generation job, with a Cancel button and the configured deadline
+def start_progress(key):
+    progress_bar = st.progress(0.0, text="Starting...")
+    
+    def update(snapshot):
+        fraction, status = describe_progress(snapshot)
+        progress_bar.progress(fraction, text=status)
+    
+    # Pressing Cancel reruns the script, which interrupts the job at its next progress update
+    st.button("Cancel", key=f"cancel_{key}")
+    return JobControl(progress=update, timeout=default_timeout())
+
+# Merge parts in document order: the optional text first, then each upload. Each
+# part is only created when the merge reaches it, so its buffer is never held longer
+def iter_merge_parts(cover_text, uploaded_files):
+    if cover_text.strip():
+        yield MergePart.from_text(cover_text)
+    for uploaded_file in uploaded_files:
+        yield MergePart(uploaded_file.getbuffer(), source_name=uploaded_file.name)
+
 # Function to create a download link for a file
 def get_download_link(file_path, link_text="Download Document"):
     with open(file_path, "rb") as file:
@@ -28,7 +52,7 @@ def main():
     # Sidebar navigation
     option = st.sidebar.radio(
         "Choose an option:",
-        ["Enter Text Directly", "Import Document"]
+        ["Enter Text Directly", "Import Document", "Merge Sources"]
     )
     
     # Default template path
@@ -65,24 +89,29 @@ def main():
         if st.button("Generate Document"):
             if user_text:
                 with st.spinner("Generating document..."):
-                    # Create a temporary file
-                    temp_dir = tempfile.mkdtemp()
-                    output_path = os.path.join(temp_dir, output_filename)
-                    
-                    # Use the function from cybergen_template.py
-                    document_path = insert_text_into_template(user_text, template_path=template_path, output_filename=output_path)
-                    
-                    if document_path:
-                        st.success(f"Document successfully created!")
-                        st.markdown(get_download_link(document_path, "Download Document"), unsafe_allow_html=True)
-                        st.info("""
-                        Note: 
-                        - Text has been formatted according to heading detection rules.
-                        - All paragraphs have standard spacing after them.
-                        - Headings are kept with their following paragraphs across page breaks.
-                        """)
-                    else:
-                        st.error("Error creating document. Please try again.")
+                    try:
+                        # A scratch directory for this job, removed however the job ends
+                        with get_scratch().job_dir("text", estimate_job_bytes(template_path, user_text)) as job_dir:
+                            output_path = os.path.join(job_dir, output_filename)
+                            
+                            # Thread-safe generation: errors come back as a structured result
+                            result = generate_from_text(user_text, template_path=template_path, output_path=output_path,
+                                                        control=start_progress("text"))
+                            document_path = result.output_path
+                            
+                            if result.ok:
+                                st.success(f"Document successfully created!")
+                                st.markdown(get_download_link(document_path, "Download Document"), unsafe_allow_html=True)
+                                st.info("""
+                                Note: 
+                                - Text has been formatted according to heading detection rules.
+                                - All paragraphs have standard spacing after them.
+                                - Headings are kept with their following paragraphs across page breaks.
+                                """)
+                            else:
+                                st.error(f"Error creating document: {str(result.error)}")
+                    except ScratchQuotaExceeded as e:
+                        st.error(str(e))
             else:
                 st.warning("Please enter some text first.")
     
@@ -97,11 +126,8 @@ def main():
             file_details = {"Filename": uploaded_file.name, "File size": f"{uploaded_file.size} bytes"}
             st.write(file_details)
             
-            # Save the uploaded file temporarily
-            temp_dir = tempfile.mkdtemp()
-            temp_file_path = os.path.join(temp_dir, uploaded_file.name)
-            with open(temp_file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # Read the upload in place; the parsers accept the buffer without a temp copy
+            source_buffer = uploaded_file.getbuffer()
             
             # Output filename
             output_filename = st.text_input("Output filename (leave blank for default):")
@@ -110,33 +136,132 @@ def main():
             elif not output_filename.lower().endswith('.docx'):
                 output_filename += '.docx'
             
-            # Optional: Show preview of document content
+            # Optional: import only part of the document
+            import_options = {}
+            with st.expander("Import only part of the document"):
+                if uploaded_file.name.lower().endswith('.pdf'):
+                    page_spec = st.text_input("Pages to import (e.g. 12-40, 45):")
+                    if page_spec.strip():
+                        import_options["pages"] = page_spec
+                else:
+                    paragraph_spec = st.text_input("Paragraphs to import (e.g. 5-20):")
+                    start_heading = st.text_input("Start at heading:")
+                    end_heading = st.text_input("Stop before heading:")
+                    if paragraph_spec.strip():
+                        import_options["paragraphs"] = paragraph_spec
+                    if start_heading.strip():
+                        import_options["start_heading"] = start_heading
+                    if end_heading.strip():
+                        import_options["end_heading"] = end_heading
+            
+            range_error = None
+            for key in ("pages", "paragraphs"):
+                if key in import_options:
+                    try:
+                        parse_range_spec(import_options[key])
+                    except ValueError as e:
+                        range_error = str(e)
+            if range_error:
+                st.error(range_error)
+                return
+            
+            # Keep one preview per upload so extracted pages survive reruns
+            preview_key = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+            if st.session_state.get("preview_key") != preview_key:
+                st.session_state.preview_key = preview_key
+                st.session_state.preview = DocumentPreview(uploaded_file.name)
+            preview = st.session_state.preview
+            
+            # Optional: Show preview of document content, one page at a time
             if st.checkbox("Show document content preview"):
-                document_text = parse_document(temp_file_path)
+                try:
+                    page_count = preview.page_count(source_buffer)
+                    if page_count is not None:
+                        page_number = st.number_input(f"Preview page (of {page_count}):", min_value=1, max_value=max(page_count, 1), value=1, step=1)
+                    else:
+                        page_number = st.number_input("Preview screen:", min_value=1, value=1, step=1)
+                    document_text = preview.get_page(source_buffer, int(page_number))
+                except Exception as e:
+                    document_text = None
+                    st.warning(f"Could not extract text from the document: {str(e)}")
                 if document_text:
                     st.text_area("Document content:", document_text, height=200, disabled=True)
-                else:
-                    st.warning("Could not extract text from the document.")
+                elif document_text is not None:
+                    st.warning("No text found on this page.")
             
             # Process button
             if st.button("Generate Document"):
                 with st.spinner("Processing document..."):
-                    output_path = os.path.join(temp_dir, output_filename)
-                    
-                    # Use the function from cybergen_template.py
-                    document_path = copy_document_to_template(temp_file_path, template_path=template_path, output_filename=output_path)
-                    
-                    if document_path:
-                        st.success(f"Document successfully created!")
-                        st.markdown(get_download_link(document_path, "Download Document"), unsafe_allow_html=True)
-                        st.info("""
-                        Note: 
-                        - Text has been formatted according to heading detection rules.
-                        - All paragraphs have standard spacing after them.
-                        - Headings are kept with their following paragraphs across page breaks.
-                        """)
-                    else:
-                        st.error("Error creating document. Please try again.")
+                    try:
+                        with get_scratch().job_dir("document", estimate_job_bytes(template_path, source_buffer)) as job_dir:
+                            output_path = os.path.join(job_dir, output_filename)
+                            
+                            # Thread-safe generation: errors come back as a structured result
+                            result = generate_from_document(source_buffer, template_path=template_path, output_path=output_path, source_name=uploaded_file.name, page_texts=preview.page_texts,
+                                                            control=start_progress("document"), **import_options)
+                            document_path = result.output_path
+                            
+                            if result.ok:
+                                st.success(f"Document successfully created!")
+                                st.markdown(get_download_link(document_path, "Download Document"), unsafe_allow_html=True)
+                                st.info("""
+                                Note: 
+                                - Text has been formatted according to heading detection rules.
+                                - All paragraphs have standard spacing after them.
+                                - Headings are kept with their following paragraphs across page breaks.
+                                """)
+                            else:
+                                st.error(f"Error creating document: {str(result.error)}")
+                    except ScratchQuotaExceeded as e:
+                        st.error(str(e))
+    
+    elif option == "Merge Sources":
+        st.header("Merge Sources")
+        st.info("""
+        Combine a cover letter, Word annexes and PDF appendices into one document.
+        - The text below (if any) comes first, followed by the files in the order they were uploaded.
+        - Each source starts on a new page and is formatted as it would be on its own.
+        """)
+        
+        cover_text = st.text_area("Cover letter text (optional):", height=200)
+        uploaded_files = st.file_uploader("Choose Word or PDF documents", type=["docx", "doc", "pdf"],
+                                          accept_multiple_files=True)
+        
+        if uploaded_files:
+            st.write("Merge order:")
+            for position, uploaded_file in enumerate(uploaded_files, start=1):
+                st.write(f"{position}. {uploaded_file.name} ({uploaded_file.size} bytes)")
+        
+        # Output filename
+        output_filename = st.text_input("Output filename (leave blank for default):", key="merge_output_name")
+        if not output_filename:
+            output_filename = "merged_document.docx"
+        elif not output_filename.lower().endswith('.docx'):
+            output_filename += '.docx'
+        
+        # Process button
+        if st.button("Generate Document", key="merge_button"):
+            if cover_text.strip() or uploaded_files:
+                with st.spinner("Merging documents..."):
+                    try:
+                        with get_scratch().job_dir("merge", estimate_job_bytes(
+                                template_path, cover_text, *(f.size for f in uploaded_files or []))) as job_dir:
+                            output_path = os.path.join(job_dir, output_filename)
+                            
+                            # The template is loaded once and every source is streamed into it in turn
+                            result = generate_merged(iter_merge_parts(cover_text, uploaded_files or []),
+                                                     template_path=template_path, output_path=output_path,
+                                                     control=start_progress("merge"))
+                            
+                            if result.ok:
+                                st.success(f"Document successfully created!")
+                                st.markdown(get_download_link(result.output_path, "Download Document"), unsafe_allow_html=True)
+                            else:
+                                st.error(f"Error creating document: {str(result.error)}")
+                    except ScratchQuotaExceeded as e:
+                        st.error(str(e))
+            else:
+                st.warning("Please enter some text or upload at least one document first.")
 
 if __name__ == "__main__":
     main() 
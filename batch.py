@@ -0,0 +1,361 @@
+import heapq
+import os
+import queue
+import sys
+import time
+import uuid
+import zipfile
+
+import PyPDF2
+
+from generation import DEFAULT_TEMPLATE, GenerationError, GenerationResult, generate_from_document
+from source_io import open_source, pdf_page_count
+from docx_stream import main_document_part
+from worker_pool import WorkerSupervisor
+from checkpoint import DONE, FAILED, CheckpointManifest, file_digest
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.doc')
+DEFAULT_MANIFEST_NAME = "batch-manifest.jsonl"
+DEFAULT_MAX_RETRIES = 2
+# Failures worth retrying straight away; the others would fail the same way again
+RETRYABLE_ERRORS = frozenset(["internal", "deadline"])
+
+# Rough per-unit costs (seconds) used to rank jobs; only their ratios matter for scheduling
+FIXED_JOB_COST = 0.05
+PDF_PAGE_COST = 0.02
+DOCX_XML_BYTE_COST = 0.1 / (1024 * 1024)
+FALLBACK_BYTE_COST = 0.05 / (1024 * 1024)
+
+
+def estimate_job_cost(source_file):
+    """
+    Cheaply estimate how long importing a source will take, without parsing its content.
+
+    PDFs are costed by the page count from the trailer; Word files by the
+    uncompressed size of the main document part, read from the zip directory
+    (embedded media does not count, since it is never parsed).
+
+    Args:
+        source_file (str): Path to the source document
+
+    Returns:
+        float: Estimated cost in (approximate) seconds
+    """
+    ext = os.path.splitext(source_file.lower())[1]
+    try:
+        if ext == '.pdf':
+            with open_source(source_file) as stream:
+                return FIXED_JOB_COST + PDF_PAGE_COST * pdf_page_count(PyPDF2.PdfReader(stream))
+        if ext in ('.docx', '.doc'):
+            with zipfile.ZipFile(source_file) as package:
+                xml_size = package.getinfo(main_document_part(package)).file_size
+            return FIXED_JOB_COST + DOCX_XML_BYTE_COST * xml_size
+    except Exception:
+        pass
+    # Unreadable or unknown sources: fall back to the file size
+    return FIXED_JOB_COST + FALLBACK_BYTE_COST * os.path.getsize(source_file)
+
+
+def schedule_longest_first(costs, workers):
+    """
+    Assign jobs to workers longest-first, each to the currently least loaded worker (LPT).
+
+    Args:
+        costs (list): Cost of each job
+        workers (int): Number of workers
+
+    Returns:
+        tuple: (dispatch order as job indices, per-worker predicted load, predicted makespan)
+    """
+    order = sorted(range(len(costs)), key=lambda index: costs[index], reverse=True)
+    loads = [(0.0, worker) for worker in range(workers)]
+    for index in order:
+        load, worker = heapq.heappop(loads)
+        heapq.heappush(loads, (load + costs[index], worker))
+    per_worker = [load for load, _ in sorted(loads, key=lambda item: item[1])]
+    return order, per_worker, max(per_worker) if per_worker else 0.0
+
+
+def simulate_makespan(durations, order, workers):
+    """
+    Makespan of list scheduling: jobs are taken in `order` by whichever worker frees up first.
+
+    Args:
+        durations (list): Duration of each job
+        order (list): Dispatch order as job indices
+        workers (int): Number of workers
+
+    Returns:
+        float: Time at which the last job finishes
+    """
+    free_at = [0.0] * workers
+    heapq.heapify(free_at)
+    for index in order:
+        heapq.heappush(free_at, heapq.heappop(free_at) + durations[index])
+    return max(free_at) if free_at else 0.0
+
+
+def _timed_document_job(source_file, template_path, output_path, profile=None):
+    started = time.time()
+    result = generate_from_document(source_file, template_path, output_path=output_path, profile=profile)
+    return started, time.time(), result
+
+
+def _output_paths(source_files, output_dir):
+    """One output per source, named after it; repeated names get a numeric suffix."""
+    paths, used = [], set()
+    for source_file in source_files:
+        stem = os.path.splitext(os.path.basename(source_file))[0]
+        name, suffix = f"{stem}.docx", 1
+        while name in used:
+            suffix += 1
+            name = f"{stem}_{suffix}.docx"
+        used.add(name)
+        paths.append(os.path.join(output_dir, name))
+    return paths
+
+
+class BatchReport:
+    """
+    Timing report of a batch run.
+
+    Attributes:
+        results (list): GenerationResult per source, in input order
+        wall_time (float): Seconds from first dispatch to last completion
+        busy_time (float): Seconds all workers together spent running jobs
+        workers (int): Number of worker slots the jobs ran on
+        predicted_lpt (float): Makespan predicted from the cost estimates, longest-first
+        predicted_fifo (float): Makespan predicted from the cost estimates, input order
+        replayed_lpt (float): Longest-first makespan replayed with the measured durations
+        replayed_fifo (float): Input-order makespan replayed with the measured durations
+        skipped (int): Sources already converted by an earlier run, per the checkpoint manifest
+        retries (int): Jobs run again after a failure
+    """
+
+    def __init__(self, results, wall_time, busy_time, workers, predicted_lpt, predicted_fifo, replayed_lpt,
+                 replayed_fifo, skipped=0, retries=0):
+        self.results = results
+        self.wall_time = wall_time
+        self.busy_time = busy_time
+        self.workers = workers
+        self.predicted_lpt = predicted_lpt
+        self.predicted_fifo = predicted_fifo
+        self.replayed_lpt = replayed_lpt
+        self.replayed_fifo = replayed_fifo
+        self.skipped = skipped
+        self.retries = retries
+
+    def utilization(self):
+        """
+        Fraction of the workers' capacity (wall time x workers) spent running jobs.
+
+        Pool workers are recycled after a number of jobs, so one worker slot runs
+        under several process ids; utilization is therefore reported for the pool
+        as a whole rather than per process.
+        """
+        capacity = self.wall_time * self.workers
+        return self.busy_time / capacity if capacity else 0.0
+
+    def summary(self):
+        failed = sum(1 for result in self.results if not result.ok)
+        lines = [
+            f"{len(self.results)} jobs, {failed} failed, wall time {self.wall_time:.2f}s",
+            f"{self.skipped} already converted by an earlier run, {self.retries} retried",
+            f"makespan predicted: longest-first {self.predicted_lpt:.2f}s vs FIFO {self.predicted_fifo:.2f}s",
+            f"makespan replayed with measured durations: longest-first {self.replayed_lpt:.2f}s "
+            f"vs FIFO {self.replayed_fifo:.2f}s",
+            f"{self.workers} workers busy {self.busy_time:.2f}s of {self.wall_time * self.workers:.2f}s "
+            f"({self.utilization():.0%} utilization)",
+        ]
+        return "\n".join(lines)
+
+
+def _error_record(error):
+    return {"message": str(error), "stage": error.stage, "kind": error.kind}
+
+
+def run_batch(source_files, output_dir, template_path=DEFAULT_TEMPLATE, workers=None, supervisor=None, profile=None,
+              manifest_path=None, max_retries=DEFAULT_MAX_RETRIES):
+    """
+    Import a batch of sources, dispatching the most expensive jobs first.
+
+    With a checkpoint manifest the batch can be resumed: sources whose content was
+    already converted with the same template into an output that still exists are
+    skipped, and failed sources are tried again until they have failed
+    1 + max_retries times in total. Failures that may be transient ('internal',
+    'deadline') are also retried straight away.
+
+    Args:
+        source_files (list): Paths of the source documents
+        output_dir (str): Directory for the generated documents
+        template_path (str): Path to the template document
+        workers (int): Number of worker processes (ignored if a supervisor is given)
+        supervisor (WorkerSupervisor): Running pool to use; a new one is started if None
+        profile (bool): Profile every job (True), none (False), or sample per CYBERGEN_PROFILE (None)
+        manifest_path (str): Checkpoint manifest to resume from and append to, or None for none
+        max_retries (int): Retries per source after its first failure, across runs
+
+    Returns:
+        BatchReport: Results, pool utilization and makespan comparisons
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    source_files = list(source_files)
+    output_paths = _output_paths(source_files, output_dir)
+    results = [None] * len(source_files)
+    failures = [0] * len(source_files)
+    skipped = 0
+
+    manifest = source_hashes = template_hash = None
+    if manifest_path:
+        manifest = CheckpointManifest(manifest_path)
+        template_hash = file_digest(template_path)
+        source_hashes = []
+        for index, source_file in enumerate(source_files):
+            try:
+                source_hash = file_digest(source_file)
+            except OSError:
+                # Unreadable sources are not checkpointed; the job reports the error
+                source_hash = None
+            source_hashes.append(source_hash)
+            entry = manifest.entry(source_hash, template_hash, output_paths[index]) if source_hash else None
+            if entry is None:
+                continue
+            if manifest.is_done(source_hash, template_hash, output_paths[index]):
+                results[index] = GenerationResult(uuid.uuid4().hex[:12], output_path=os.path.abspath(output_paths[index]))
+                skipped += 1
+            elif entry.status == FAILED:
+                failures[index] = entry.failures
+                if entry.failures > max_retries:
+                    error = entry.error or {}
+                    results[index] = GenerationResult(uuid.uuid4().hex[:12], error=GenerationError(
+                        error.get("message", "failed in an earlier run"), error.get("stage", "build"),
+                        error.get("kind", "internal")))
+
+    pending = [index for index in range(len(source_files)) if results[index] is None]
+    costs = [estimate_job_cost(source_files[index]) for index in pending]
+    durations = [0.0] * len(source_files)
+    busy_time = 0.0
+    retries = 0
+    wall_time = predicted_lpt = predicted_fifo = 0.0
+    order = fifo_order = []
+
+    own_supervisor = supervisor is None and bool(pending)
+    if own_supervisor:
+        supervisor = WorkerSupervisor(workers=workers, template_paths=(template_path,)).start()
+
+    try:
+        if pending:
+            worker_count = supervisor.workers
+            pending_order, _, predicted_lpt = schedule_longest_first(costs, worker_count)
+            order = [pending[position] for position in pending_order]
+            fifo_order = pending
+            predicted_fifo = simulate_makespan(costs, list(range(len(pending))), worker_count)
+
+            finished = queue.Queue()
+
+            def submit(index):
+                supervisor.apply_async(
+                    _timed_document_job, (source_files[index], template_path, output_paths[index], profile),
+                    callback=lambda outcome: finished.put((index, outcome, None)),
+                    error_callback=lambda exc: finished.put((index, None, exc)),
+                )
+
+            started = time.time()
+            # The pool hands each queued job to the next free worker, so submitting in
+            # longest-first order gives LPT list scheduling
+            for index in order:
+                submit(index)
+            outstanding = len(order)
+            while outstanding:
+                try:
+                    index, outcome, exc = finished.get(timeout=manifest.sync_interval if manifest else None)
+                except queue.Empty:
+                    # Nothing finished for a while: make the records so far durable
+                    manifest.sync()
+                    continue
+                outstanding -= 1
+                if exc is not None:
+                    result = GenerationResult(uuid.uuid4().hex[:12], error=GenerationError.from_exception(exc, "build"))
+                else:
+                    job_start, job_end, result = outcome
+                    durations[index] += job_end - job_start
+                    busy_time += job_end - job_start
+                results[index] = result
+                if not result.ok:
+                    failures[index] += 1
+                if manifest is not None and source_hashes[index]:
+                    manifest.record(source_files[index], source_hashes[index], template_hash, output_paths[index],
+                                    DONE if result.ok else FAILED,
+                                    None if result.ok else _error_record(result.error))
+                if not result.ok and result.error.kind in RETRYABLE_ERRORS and failures[index] <= max_retries:
+                    retries += 1
+                    outstanding += 1
+                    submit(index)
+            wall_time = time.time() - started
+    finally:
+        if own_supervisor:
+            supervisor.close()
+        if manifest is not None:
+            manifest.close()
+
+    worker_count = supervisor.workers if supervisor is not None else (workers or os.cpu_count() or 1)
+    return BatchReport(
+        results,
+        wall_time,
+        busy_time,
+        worker_count,
+        predicted_lpt,
+        predicted_fifo,
+        replayed_lpt=simulate_makespan(durations, order, worker_count),
+        replayed_fifo=simulate_makespan(durations, fifo_order, worker_count),
+        skipped=skipped,
+        retries=retries,
+    )
+
+
+def collect_sources(paths):
+    """Expand directories into the supported documents they contain, sorted by name."""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    sources.append(os.path.join(path, name))
+        else:
+            sources.append(path)
+    return sources
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Format a batch of Word/PDF documents with the CyberGen template")
+    parser.add_argument("sources", nargs="+", help="source documents or directories")
+    parser.add_argument("-o", "--output-dir", default="formatted", help="directory for the generated documents")
+    parser.add_argument("-t", "--template", default=DEFAULT_TEMPLATE, help="template document")
+    parser.add_argument("-w", "--workers", type=int, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a cProfile and tracemalloc report for every job (default: sample per CYBERGEN_PROFILE)")
+    parser.add_argument("--profile-dir", help="directory for the profile reports")
+    parser.add_argument("--manifest",
+                        help=f"checkpoint manifest to resume from (default: {DEFAULT_MANIFEST_NAME} in the output directory)")
+    parser.add_argument("--no-resume", action="store_true", help="convert everything, without a checkpoint manifest")
+    parser.add_argument("--retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help=f"retries per failed source, counted across runs (default: {DEFAULT_MAX_RETRIES})")
+    args = parser.parse_args()
+    if args.profile_dir:
+        # Set before the workers start, so they inherit it
+        os.environ["CYBERGEN_PROFILE_DIR"] = args.profile_dir
+
+    manifest_path = None
+    if not args.no_resume:
+        manifest_path = args.manifest or os.path.join(args.output_dir, DEFAULT_MANIFEST_NAME)
+    report = run_batch(collect_sources(args.sources), args.output_dir, args.template, args.workers,
+                       profile=True if args.profile else None, manifest_path=manifest_path, max_retries=args.retries)
+    for result in report.results:
+        if not result.ok:
+            print(f"FAILED: {result.error}")
+        if result.profile_path:
+            print(f"profiled: {result.profile_path}")
+    print(report.summary())
+    sys.exit(1 if any(not result.ok for result in report.results) else 0)
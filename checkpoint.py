@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+DONE = "done"
+FAILED = "failed"
+# Records appended between fsyncs; a crash loses at most these, and their jobs are redone
+DEFAULT_SYNC_EVERY = 32
+# Seconds after which the next record, or the owner's idle sync(), fsyncs the pending records
+DEFAULT_SYNC_INTERVAL = 2.0
+HASH_CHUNK = 1024 * 1024
+
+
+def file_digest(path):
+    """
+    SHA-256 of a file's content, read in chunks.
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CheckpointEntry:
+    """
+    What the manifest knows about one (source content, template, output) combination.
+
+    Attributes:
+        status (str): DONE or FAILED, from the latest record
+        failures (int): Failed attempts recorded so far
+        error (dict): 'message', 'stage' and 'kind' of the latest failure, or None
+    """
+
+    __slots__ = ("status", "failures", "error")
+
+    def __init__(self):
+        self.status = None
+        self.failures = 0
+        self.error = None
+
+
+class CheckpointManifest:
+    """
+    Append-only record of finished batch jobs, so an interrupted batch can resume.
+
+    Each line is a JSON record of a source's content hash, the template's hash, the
+    output path and the outcome. Records are written (and flushed to the OS) as jobs
+    finish, and fsynced in batches rather than once per job: when `sync_every`
+    records are pending, or when a record is written `sync_interval` seconds or
+    more after the last fsync. The interval is only checked as records are
+    written, so owners that can go quiet call sync() whenever nothing has finished
+    for `sync_interval` seconds (run_batch and the watch-folder daemon do), which
+    bounds how long the last records of a burst stay unsynced. A crash can lose
+    only the records since the last fsync, and those jobs are simply run again:
+    outputs are replaced atomically, so redoing a job is harmless. A torn last line
+    from a crash mid-write is ignored when the manifest is read back.
+
+    Use as a context manager, or call close().
+    """
+
+    def __init__(self, path, sync_every=DEFAULT_SYNC_EVERY, sync_interval=DEFAULT_SYNC_INTERVAL):
+        """
+        Args:
+            path (str): Manifest file; created if missing, otherwise replayed and appended to
+            sync_every (int): Records per fsync
+            sync_interval (float): Seconds after which the next record fsyncs the pending ones;
+                also how often the owner should call sync() while idle
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.syncs = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        created = not os.path.exists(path)
+        valid_size = self._replay() if not created else 0
+        self._file = open(path, "ab")
+        if self._file.tell() != valid_size:
+            # Drop a torn record left by a crash, so new records start on a clean line
+            self._file.truncate(valid_size)
+            self._file.seek(valid_size)
+        if created:
+            # Make the new file's directory entry durable too
+            self._sync_directory(directory)
+
+    @staticmethod
+    def _sync_directory(directory):
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _replay(self):
+        """Load the records already in the file; returns the size of its intact part."""
+        valid_size = 0
+        with open(self.path, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                    key = (record["hash"], record["template"], record["output"])
+                    status = record["status"]
+                except (ValueError, KeyError, TypeError):
+                    break
+                self._apply(key, status, record.get("error"))
+                valid_size += len(line)
+        return valid_size
+
+    def _apply(self, key, status, error):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = CheckpointEntry()
+        entry.status = status
+        if status == FAILED:
+            entry.failures += 1
+            entry.error = error
+        else:
+            entry.error = None
+
+    def entry(self, source_hash, template_hash, output_path):
+        """
+        Returns:
+            CheckpointEntry: What is known about this job, or None if it never finished
+        """
+        return self._entries.get((source_hash, template_hash, os.path.abspath(output_path)))
+
+    def is_done(self, source_hash, template_hash, output_path):
+        """True if this exact job completed and its output is still there."""
+        entry = self.entry(source_hash, template_hash, output_path)
+        return entry is not None and entry.status == DONE and os.path.exists(output_path)
+
+    def record(self, source_path, source_hash, template_hash, output_path, status, error=None):
+        """
+        Append the outcome of a job. Thread-safe.
+
+        Args:
+            source_path (str): Source file, for people reading the manifest
+            source_hash (str): file_digest of the source
+            template_hash (str): file_digest of the template
+            output_path (str): Output document
+            status (str): DONE or FAILED
+            error (dict): For failures, the error's 'message', 'stage' and 'kind'
+        """
+        output_path = os.path.abspath(output_path)
+        record = {"source": source_path, "hash": source_hash, "template": template_hash, "output": output_path,
+                  "status": status, "time": round(time.time(), 3)}
+        if error is not None:
+            record["error"] = error
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._apply((source_hash, template_hash, output_path), status, error)
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def _sync(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self.syncs += 1
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """Make every record written so far durable."""
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,63 +1,145 @@
-import docx
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_UNDERLINE
 import os
+import time
 from datetime import datetime
-import PyPDF2  # For PDF text extraction
+from source_io import is_buffer_source, source_extension, open_source
+from pdf_page_cache import get_default_page_cache
+from pdf_backends import choose_backend
+from docx_stream import iter_docx_paragraphs, iter_docx_blocks, SourceTable
+from import_range import parse_range_spec, select_paragraphs
+from template_cache import load_template
+from job_control import ProgressWriter
+from profiling import profile_job, input_size
+from memory_budget import (estimate_source_memory, estimate_text_memory, plan_ingestion, plan_part_ingestion,
+                           template_memory)
+from text_stream import iter_stripped_pieces, join_chunks, iter_text_lines
+from docx_media import MediaTransfer
+from docx_tables import TableImporter
+from pipeline import should_pipeline, iter_pdf_text_pipelined, timed_pages
 
-def extract_text_from_pdf(file_path):
+def iter_pdf_text(file_path, pages=None, page_cache=None, page_texts=None, control=None, keep=True,
+                  backend=None):
     """
-    Extract text content from a PDF file.
+    Yield the text of each selected PDF page in order, extracting pages as they are reached.
+    
+    The PDF is read through a memory map (or directly from an in-memory buffer) and
+    pages are resolved lazily, so only the pages being extracted are decoded.
+    Page text is looked up in the persistent page cache before extracting.
+    The extraction library is picked by pdf_backends.choose_backend.
     
     Args:
-        file_path (str): Path to the PDF file
-        
-    Returns:
-        str: Extracted text content
+        file_path: Path to the PDF file, or a bytes/memoryview/mmap buffer of it
+        pages: Pages to extract, as a range like "12-40" or 1-based page numbers; None for all
+        page_cache: PageTextCache to use, None for the default cache, False to disable
+        page_texts (dict): Text already extracted (e.g. by a preview), keyed by zero-based
+            page number; those pages are reused
+        control (JobControl): Receives progress and may cancel the extraction between pages
+        keep (bool): Add newly extracted pages to page_texts; pass False to hold only one page at a time
+        backend (str): Extraction backend name, "auto", or None for CYBERGEN_PDF_BACKEND
+        
+    Yields:
+        str: The text of each page
     """
-    try:
+    if not is_buffer_source(file_path):
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         
         if not file_path.lower().endswith('.pdf'):
             raise ValueError("File must be a PDF")
+    
+    if page_cache is None:
+        page_cache = get_default_page_cache()
+    
+    if page_texts is None:
+        page_texts = {}
+    
+    extractor = choose_backend(file_path, backend)
+    with open_source(file_path) as stream:
+        # Missing pages come out of `texts` in the same order as page_numbers
+        page_numbers, texts = extractor.iter_pages(stream, pages, page_texts, page_cache or None)
+        try:
+            if control is not None:
+                control.set_stage("extracting", pages_total=len(page_numbers))
+                control.pages_extracted += sum(1 for page_num in page_numbers if page_num in page_texts)
+            for page_num in page_numbers:
+                text = page_texts.get(page_num)
+                if text is None:
+                    text = next(texts)
+                    if keep:
+                        page_texts[page_num] = text
+                    if control is not None:
+                        control.page_extracted()
+                yield text
+        finally:
+            texts.close()
+
+def read_pdf_text(file_path, pages=None, page_cache=None, page_texts=None, control=None):
+    """
+    Extract text content from a PDF file, raising on errors.
+    
+    Args:
+        file_path: Path to the PDF file, or a bytes/memoryview/mmap buffer of it
+        pages: Pages to extract, as a range like "12-40" or 1-based page numbers; None for all
+        page_cache: PageTextCache to use, None for the default cache, False to disable
+        page_texts (dict): Text already extracted (e.g. by a preview), keyed by zero-based
+            page number; those pages are reused and newly extracted pages are added
+        control (JobControl): Receives progress and may cancel the extraction between pages
         
-        text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n\n"
+    Returns:
+        str: Extracted text content
+    """
+    return "\n\n".join(iter_pdf_text(file_path, pages, page_cache, page_texts, control)).strip()
+
+def extract_text_from_pdf(file_path, pages=None, page_cache=None, page_texts=None):
+    """
+    Extract text content from a PDF file.
+    
+    Args:
+        file_path: Path to the PDF file, or a bytes/memoryview/mmap buffer of it
+        pages: Pages to extract, as a range like "12-40" or 1-based page numbers; None for all
+        page_cache: PageTextCache to use, None for the default cache, False to disable
+        page_texts (dict): Text already extracted, keyed by zero-based page number
         
-        return text.strip()
+    Returns:
+        str: Extracted text content, or None if extraction failed
+    """
+    try:
+        return read_pdf_text(file_path, pages=pages, page_cache=page_cache, page_texts=page_texts)
     
     except Exception as e:
         print(f"Error extracting text from PDF: {str(e)}")
         return None
 
-def extract_text_from_docx(file_path):
+def extract_text_from_docx(file_path, paragraphs=None, start_heading=None, end_heading=None):
     """
     Extract text content from a Word document.
     
+    The document body is streamed straight from the zip, so memory use does not
+    depend on the size of the file or its embedded media.
+    
     Args:
-        file_path (str): Path to the Word document
+        file_path: Path to the Word document, or a bytes/memoryview/mmap buffer of it
+        paragraphs: Paragraphs to extract, as a range like "5-20" or 1-based numbers of non-empty paragraphs
+        start_heading (str): Start at the paragraph with this heading text
+        end_heading (str): Stop before the paragraph with this heading text
         
     Returns:
         str: Extracted text content
     """
     try:
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File not found: {file_path}")
-        
-        if not file_path.lower().endswith(('.docx', '.doc')):
-            raise ValueError("File must be a Word document (.doc or .docx)")
+        if not is_buffer_source(file_path):
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"File not found: {file_path}")
+            
+            if not file_path.lower().endswith(('.docx', '.doc')):
+                raise ValueError("File must be a Word document (.doc or .docx)")
         
-        doc = docx.Document(file_path)
         full_text = []
         
-        for para in doc.paragraphs:
-            if para.text.strip():  # Only add non-empty paragraphs
-                full_text.append(para.text)
+        # Only non-empty paragraphs inside the requested range are returned
+        for para in select_paragraphs(iter_docx_paragraphs(file_path), paragraphs, start_heading, end_heading):
+            full_text.append(para.text)
         
         return '\n'.join(full_text)
     
@@ -65,29 +147,34 @@ def extract_text_from_docx(file_path):
         print(f"Error extracting text from document: {str(e)}")
         return None
 
-def parse_document(file_path):
+def parse_document(file_path, source_name=None, pages=None, paragraphs=None, start_heading=None, end_heading=None):
     """
     Parse an existing document and return its text content.
     
     Args:
-        file_path (str): Path to the document file
+        file_path: Path to the document file, or an in-memory buffer of it
+        source_name (str): Original filename, used to detect the type of a buffer
+        pages: PDF pages to parse, as a range like "12-40" or 1-based page numbers
+        paragraphs: Word paragraphs to parse, as a range like "5-20" or 1-based numbers
+        start_heading (str): Word documents only: start at the paragraph with this heading text
+        end_heading (str): Word documents only: stop before the paragraph with this heading text
     
     Returns:
         str: The text content of the document
     """
     try:
-        if not os.path.exists(file_path):
+        if not is_buffer_source(file_path) and not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         
         # Check file extension to determine parsing method
-        file_ext = os.path.splitext(file_path.lower())[1]
+        file_ext = source_extension(file_path, source_name)
         
         if file_ext == '.pdf':
             # Parse PDF file
-            return extract_text_from_pdf(file_path)
+            return extract_text_from_pdf(file_path, pages=pages)
         elif file_ext in ('.docx', '.doc'):
             # Parse Word document
-            return extract_text_from_docx(file_path)
+            return extract_text_from_docx(file_path, paragraphs, start_heading, end_heading)
         else:
             raise ValueError("File must be a Word document (.doc or .docx) or a PDF (.pdf)")
     
@@ -216,50 +303,92 @@ def add_space_after_paragraph(paragraph, is_heading=False):
     
     return paragraph
 
-def copy_document_to_template(source_file, template_path="cybergen-template.docx", output_filename="generated_document.docx"):
+def save_document(doc, output_filename, control=None, stats=None):
     """
-    Copies content from a source document to a template, preserving formatting.
+    Saves a document, reporting the bytes written to an optional JobControl.
+    
+    If the save fails or the job is cancelled while writing, the partially
+    written file is removed.
     
     Args:
-        source_file (str): Path to the source document (Word or PDF)
-        template_path (str): Path to the template document
-        output_filename (str): Name for the output document
+        doc (docx.Document): The document to save
+        output_filename (str): Path of the output file
+        control (JobControl): Receives progress and may cancel the save
+        stats (PipelineStats): Receives the throughput of the 'save' stage
+    """
+    started = time.perf_counter()
+    if control is None:
+        doc.save(output_filename)
+    else:
+        control.set_stage("saving")
+        try:
+            with open(output_filename, 'wb') as output_file:
+                doc.save(ProgressWriter(output_file, control))
+        except BaseException:
+            if os.path.exists(output_filename):
+                os.unlink(output_filename)
+            raise
+        control.set_stage("done")
+    if stats is not None:
+        save = stats.stage("save", "bytes")
+        save.busy += time.perf_counter() - started
+        save.items += os.path.getsize(output_filename)
+
+def _check_source(source_file, source_name=None, pages=None, paragraphs=None):
+    """
+    Validate a source and its import ranges before any work is done.
     
     Returns:
-        str: Path to the created document
+        str: The source's extension ('.docx', '.doc' or '.pdf')
     """
-    try:
-        # Check if files exist
-        if not os.path.exists(template_path):
-            raise FileNotFoundError(f"Template file not found: {template_path}")
-        if not os.path.exists(source_file):
-            raise FileNotFoundError(f"Source file not found: {source_file}")
-        
-        # Load the template document
-        template_doc = docx.Document(template_path)
-        
-        # Set margins to ensure spacing on every page
-        set_document_margins(template_doc, top=1.5, bottom=1.5)
-        
-        # Add current date to the first page
-        add_current_date(template_doc)
-        
-        # Determine file type
-        file_ext = os.path.splitext(source_file.lower())[1]
-        
-        if file_ext in ('.docx', '.doc'):
-            # For Word documents, copy content preserving formatting
-            source_doc = docx.Document(source_file)
-            
-            # Copy each paragraph
-            for para in source_doc.paragraphs:
-                if para.text.strip():  # Skip empty paragraphs
+    # Check if the source exists
+    if not is_buffer_source(source_file) and not os.path.exists(source_file):
+        raise FileNotFoundError(f"Source file not found: {source_file}")
+    
+    # Determine file type
+    file_ext = source_extension(source_file, source_name)
+    if file_ext not in ('.docx', '.doc', '.pdf'):
+        raise ValueError("File must be a Word document (.doc or .docx) or a PDF (.pdf)")
+    
+    # Reject malformed ranges before any work is done
+    for selection in (pages, paragraphs):
+        if isinstance(selection, str):
+            parse_range_spec(selection)
+    
+    return file_ext
+
+def _append_source(doc, source_file, file_ext, pages=None, paragraphs=None, start_heading=None, end_heading=None,
+                   page_texts=None, control=None, streaming=False, pipeline=None, stats=None):
+    """
+    Append the content of a Word or PDF source to a document, streaming it in.
+    
+    Arguments are as for build_document_from_source; `streaming` is the memory
+    plan's decision for this source.
+    """
+    if file_ext in ('.docx', '.doc'):
+        if control is not None:
+            control.set_stage("rendering")
+        
+        # For Word documents, copy content preserving formatting.
+        # Paragraphs and tables are streamed one at a time instead of loading the whole source.
+        selected = select_paragraphs(iter_docx_blocks(source_file, media=True), paragraphs, start_heading, end_heading)
+        with MediaTransfer(doc, source_file) as media:
+            tables = TableImporter(doc, media)
+            for para in selected:
+                if isinstance(para, SourceTable):
+                    # Tables are carried over whole, as cloned XML subtrees
+                    tables.add(para.element)
+                    if control is not None:
+                        control.paragraph_emitted()
+                    continue
+                
+                if para.has_content:  # Skip empty paragraphs
                     # Check if this paragraph is a heading
                     heading_status = is_heading(para.text)
                     is_bold = any(run.bold for run in para.runs) if para.runs else False
                     
                     # Add paragraph to template
-                    new_para = template_doc.add_paragraph()
+                    new_para = doc.add_paragraph()
                     
                     # Copy text with formatting
                     for run in para.runs:
@@ -270,6 +399,10 @@ def copy_document_to_template(source_file, template_path="cybergen-template.docx
                         new_run.underline = run.underline if not heading_status else WD_UNDERLINE.SINGLE
                         # Set font size based on heading status
                         new_run.font.size = Pt(14) if heading_status else Pt(12.5)
+                        # Carry over images and embedded objects, moving their parts as raw bytes
+                        for item in run.media or ():
+                            if media.import_element(item):
+                                new_run._r.append(item)
                     
                     # Set alignment based on heading status
                     new_para.alignment = WD_ALIGN_PARAGRAPH.CENTER if heading_status else WD_ALIGN_PARAGRAPH.JUSTIFY
@@ -284,112 +417,409 @@ def copy_document_to_template(source_file, template_path="cybergen-template.docx
                         new_run.bold = True if heading_status else False
                         new_run.underline = WD_UNDERLINE.SINGLE if heading_status else None
                     
-        elif file_ext == '.pdf':
-            # For PDFs, we extract text and maintain paragraph structure
-            text_content = extract_text_from_pdf(source_file)
-            if text_content:
-                paragraphs = text_content.split('\n\n')
-                last_para = None
+                    if control is not None:
+                        control.paragraph_emitted()
                 
-                for paragraph in paragraphs:
-                    if paragraph.strip():
-                        # Check if this paragraph is a heading
-                        heading_status = is_heading(paragraph)
-                        
-                        # Add paragraph with appropriate formatting
-                        p = template_doc.add_paragraph()
-                        run = p.add_run(paragraph)
-                        
-                        # Apply formatting based on heading status
-                        run.font.size = Pt(14) if heading_status else Pt(12.5)
-                        run.bold = True if heading_status else False
-                        run.underline = WD_UNDERLINE.SINGLE if heading_status else None
-                        p.alignment = WD_ALIGN_PARAGRAPH.CENTER if heading_status else WD_ALIGN_PARAGRAPH.JUSTIFY
-                        
-                        # Add proper spacing after paragraph using Word's standard
-                        add_space_after_paragraph(p, is_heading=heading_status)
-                        
-                        # Store this paragraph to check if it needs to be kept with the next
-                        last_para = p
-        
-        # Set widow/orphan control for the whole document to prevent single lines
-        for paragraph in template_doc.paragraphs:
-            paragraph.paragraph_format.widow_control = True
+    elif file_ext == '.pdf':
+        # For PDFs, we extract text and maintain paragraph structure
+        pipelined = should_pipeline(source_file, pages, page_texts, pipeline)
+        if pipelined or streaming or stats is not None:
+            # Split paragraphs out of the pages as they are extracted. Over the memory
+            # budget a single page of text is held at a time; pipelined, the next pages
+            # are extracted in a worker process while this one is rendered
+            if pipelined:
+                page_stream = iter_pdf_text_pipelined(source_file, pages=pages, page_texts=page_texts,
+                                                      control=control, keep=not streaming, stats=stats)
+            else:
+                page_stream = iter_pdf_text(source_file, pages=pages, page_texts=page_texts, control=control,
+                                            keep=not streaming)
+                if stats is not None:
+                    page_stream = timed_pages(page_stream, stats)
+            paragraphs = iter_stripped_pieces(join_chunks(page_stream, '\n\n'), '\n\n')
+        else:
+            text_content = read_pdf_text(source_file, pages=pages, page_texts=page_texts, control=control)
+            paragraphs = text_content.split('\n\n') if text_content else []
+            if control is not None:
+                control.set_stage("rendering")
+        last_para = None
+        
+        for paragraph in paragraphs:
+            if paragraph.strip():
+                # Check if this paragraph is a heading
+                heading_status = is_heading(paragraph)
+                
+                # Add paragraph with appropriate formatting
+                p = doc.add_paragraph()
+                run = p.add_run(paragraph)
+                
+                # Apply formatting based on heading status
+                run.font.size = Pt(14) if heading_status else Pt(12.5)
+                run.bold = True if heading_status else False
+                run.underline = WD_UNDERLINE.SINGLE if heading_status else None
+                p.alignment = WD_ALIGN_PARAGRAPH.CENTER if heading_status else WD_ALIGN_PARAGRAPH.JUSTIFY
+                
+                # Add proper spacing after paragraph using Word's standard
+                add_space_after_paragraph(p, is_heading=heading_status)
+                
+                # Store this paragraph to check if it needs to be kept with the next
+                last_para = p
+                
+                if control is not None:
+                    control.paragraph_emitted()
+
+def build_document_from_source(source_file, template_path="cybergen-template.docx", source_name=None,
+                               pages=None, paragraphs=None, start_heading=None, end_heading=None, page_texts=None,
+                               control=None, memory_budget=None, pipeline=None, stats=None):
+    """
+    Builds a template document filled with the content of a source document, without saving it.
+    
+    Unlike copy_document_to_template, errors are raised rather than printed, and nothing
+    is written to disk, so it is safe to call from several threads at once.
+    
+    Args:
+        source_file: Path to the source document (Word or PDF), or an in-memory buffer of it
+        template_path (str): Path to the template document
+        source_name (str): Original filename, used to detect the type of a buffer
+        pages: PDF pages to import, as a range like "12-40" or 1-based page numbers
+        paragraphs: Word paragraphs to import, as a range like "5-20" or 1-based numbers
+        start_heading (str): Word documents only: start at the paragraph with this heading text
+        end_heading (str): Word documents only: stop before the paragraph with this heading text
+        page_texts (dict): PDF only: page text already extracted (e.g. by a preview), keyed by
+            zero-based page number, so those pages are not extracted again
+        control (JobControl): Receives progress and may cancel or time out the build
+        memory_budget (int): Peak memory allowed for the job in bytes; None reads
+            CYBERGEN_JOB_MEMORY_MB, 0 means unlimited
+        pipeline (bool): PDF only: extract pages in a worker process while earlier pages are
+            rendered (True), on this thread (False), or decide from the page count and
+            CYBERGEN_PIPELINE (None)
+        stats (PipelineStats): PDF only: receives the throughput of the 'extract' and 'render' stages
+    
+    Returns:
+        docx.Document: The filled-in document
+    
+    Raises:
+        MemoryBudgetExceeded: If the source is estimated not to fit in the memory budget
+    """
+    # Check if files exist
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"Template file not found: {template_path}")
+    file_ext = _check_source(source_file, source_name, pages, paragraphs)
+    
+    # Pre-flight memory check: sources too big to hold in memory are streamed, and
+    # sources too big even for that are rejected before anything is loaded
+    streaming = plan_ingestion(estimate_source_memory(source_file, file_ext, template_path, pages), memory_budget)
+    
+    if control is not None:
+        control.set_stage("loading")
+    
+    # Load the template document (a private copy of the cached, already parsed template)
+    template_doc = load_template(template_path)
+    
+    # Set margins to ensure spacing on every page
+    set_document_margins(template_doc, top=1.5, bottom=1.5)
+    
+    # Add current date to the first page
+    add_current_date(template_doc)
+    
+    _append_source(template_doc, source_file, file_ext, pages, paragraphs, start_heading, end_heading,
+                   page_texts, control, streaming, pipeline, stats)
+    
+    # Set widow/orphan control for the whole document to prevent single lines
+    for paragraph in template_doc.paragraphs:
+        paragraph.paragraph_format.widow_control = True
+    
+    return template_doc
+
+def copy_document_to_template(source_file, template_path="cybergen-template.docx", output_filename="generated_document.docx", source_name=None,
+                              pages=None, paragraphs=None, start_heading=None, end_heading=None, page_texts=None,
+                              control=None, pipeline=None, stats=None):
+    """
+    Copies content from a source document to a template, preserving formatting.
+    
+    Only the selected part of the source is processed: pages outside `pages` are
+    never extracted and paragraphs outside the paragraph/heading range are never copied.
+    
+    Args:
+        source_file: Path to the source document (Word or PDF), or an in-memory buffer of it
+        template_path (str): Path to the template document
+        output_filename (str): Name for the output document
+        source_name (str): Original filename, used to detect the type of a buffer
+        pages: PDF pages to import, as a range like "12-40" or 1-based page numbers
+        paragraphs: Word paragraphs to import, as a range like "5-20" or 1-based numbers
+        start_heading (str): Word documents only: start at the paragraph with this heading text
+        end_heading (str): Word documents only: stop before the paragraph with this heading text
+        page_texts (dict): PDF only: page text already extracted (e.g. by a preview), keyed by
+            zero-based page number, so those pages are not extracted again
+        control (JobControl): Receives progress and may cancel or time out the job
+        pipeline (bool): PDF only: extract pages in a worker process while earlier pages are
+            rendered; None decides from the page count and CYBERGEN_PIPELINE
+        stats (PipelineStats): Receives the throughput of each stage (extract, render, save)
+    
+    Returns:
+        str: Path to the created document
+    """
+    try:
+        template_doc = build_document_from_source(source_file, template_path, source_name, pages=pages, paragraphs=paragraphs,
+                                                  start_heading=start_heading, end_heading=end_heading, page_texts=page_texts,
+                                                  control=control, pipeline=pipeline, stats=stats)
         
         # Save the document
-        template_doc.save(output_filename)
+        save_document(template_doc, output_filename, control, stats)
         return os.path.abspath(output_filename)
     
     except Exception as e:
         print(f"Error copying document: {str(e)}")
         return None
 
-def insert_text_into_template(input_text, template_path="cybergen-template.docx", output_filename="generated_document.docx"):
+def _append_text(doc, input_text, control=None):
+    """
+    Append the user's text to a document as formatted paragraphs, line by line.
+    
+    Arguments are as for build_document_from_text.
+    """
+    # Style copied onto new paragraphs from the document's second paragraph, looked
+    # up once rather than rebuilding the paragraph list for every line
+    body_style = None
+    
+    # Simply append each paragraph to the document as its line arrives; a line is
+    # only final once the next one has been read, since the last line is stripped
+    for paragraph in iter_text_lines(input_text):
+        # Check if this paragraph is a heading
+        heading_status = is_heading(paragraph)
+        
+        # Add paragraph with appropriate formatting
+        p = doc.add_paragraph()
+        if body_style is None:
+            paragraphs = doc.paragraphs
+            if len(paragraphs) > 1:
+                body_style = paragraphs[1].style
+        if body_style is not None:
+            # Copy style from an existing paragraph if available
+            p.style = body_style
+        
+        # Add run with appropriate formatting
+        run = p.add_run(paragraph)
+        run.font.size = Pt(14) if heading_status else Pt(12.5)
+        run.bold = True if heading_status else False
+        run.underline = WD_UNDERLINE.SINGLE if heading_status else None
+        p.alignment = WD_ALIGN_PARAGRAPH.CENTER if heading_status else WD_ALIGN_PARAGRAPH.JUSTIFY
+        
+        # Add proper spacing after paragraph using Word's standard
+        add_space_after_paragraph(p, is_heading=heading_status)
+        
+        if control is not None:
+            control.paragraph_emitted()
+
+def build_document_from_text(input_text, template_path="cybergen-template.docx", control=None, memory_budget=None):
+    """
+    Builds a template document filled with the user's text, without saving it.
+    
+    Unlike insert_text_into_template, errors are raised rather than printed, and nothing
+    is written to disk, so it is safe to call from several threads at once.
+    
+    Paragraphs are emitted as lines arrive, so the input can be a stream too large
+    to hold as one string.
+    
+    Args:
+        input_text: The text content to be inserted: a str, an iterable of lines, or a
+            text stream (e.g. an open file); all give the same output as the joined text
+        template_path (str): Path to the template document
+        control (JobControl): Receives progress and may cancel or time out the build
+        memory_budget (int): Peak memory allowed for the job in bytes; None reads
+            CYBERGEN_JOB_MEMORY_MB, 0 means unlimited
+    
+    Returns:
+        docx.Document: The filled-in document
+    
+    Raises:
+        MemoryBudgetExceeded: If the text is estimated not to fit in the memory budget
+    """
+    # Check if template exists
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"Template file not found: {template_path}")
+    
+    # Pre-flight memory check: reject text too big to format before anything is loaded
+    # (the size of streamed input is not known up front)
+    if isinstance(input_text, str):
+        plan_ingestion(estimate_text_memory(input_text, template_path), memory_budget)
+    
+    if control is not None:
+        control.set_stage("loading")
+    
+    # Load the template document (a private copy of the cached, already parsed template)
+    doc = load_template(template_path)
+    
+    # Set margins to ensure spacing on every page
+    set_document_margins(doc, top=1.5, bottom=1.5)
+    
+    # Add current date to the first page
+    add_current_date(doc)
+    
+    if control is not None:
+        control.set_stage("rendering")
+    
+    _append_text(doc, input_text, control)
+    
+    # Set widow/orphan control for the whole document
+    for paragraph in doc.paragraphs:
+        paragraph.paragraph_format.widow_control = True
+    
+    return doc
+
+def insert_text_into_template(input_text, template_path="cybergen-template.docx", output_filename="generated_document.docx",
+                              control=None):
     """
     Inserts the user's text into the template document.
     
     Args:
-        input_text (str): The text content to be inserted
+        input_text: The text content to be inserted: a str, an iterable of lines, or a
+            text stream such as an open file
         template_path (str): Path to the template document
         output_filename (str): Name for the output document
+        control (JobControl): Receives progress and may cancel or time out the job
     
     Returns:
         str: Path to the created document
     """
     try:
-        # Check if template exists
-        if not os.path.exists(template_path):
-            raise FileNotFoundError(f"Template file not found: {template_path}")
-        
-        # Load the template document
-        doc = docx.Document(template_path)
-        
-        # Set margins to ensure spacing on every page
-        set_document_margins(doc, top=1.5, bottom=1.5)
-        
-        # Add current date to the first page
-        add_current_date(doc)
-        
-        # Process the input text
-        paragraphs = input_text.strip().split('\n')
-        
-        # Simply append each paragraph to the document
-        for i, paragraph in enumerate(paragraphs):
-            if paragraph.strip():  # Skip empty paragraphs
-                # Check if this paragraph is a heading
-                heading_status = is_heading(paragraph)
-                
-                # Add paragraph with appropriate formatting
-                p = doc.add_paragraph()
-                if len(doc.paragraphs) > 1:
-                    # Copy style from an existing paragraph if available
-                    p.style = doc.paragraphs[1].style
-                
-                # Add run with appropriate formatting
-                run = p.add_run(paragraph)
-                run.font.size = Pt(14) if heading_status else Pt(12.5)
-                run.bold = True if heading_status else False
-                run.underline = WD_UNDERLINE.SINGLE if heading_status else None
-                p.alignment = WD_ALIGN_PARAGRAPH.CENTER if heading_status else WD_ALIGN_PARAGRAPH.JUSTIFY
-                
-                # Add proper spacing after paragraph using Word's standard
-                add_space_after_paragraph(p, is_heading=heading_status)
-        
-        # Set widow/orphan control for the whole document
-        for paragraph in doc.paragraphs:
-            paragraph.paragraph_format.widow_control = True
+        doc = build_document_from_text(input_text, template_path, control=control)
         
         # Save the document
-        doc.save(output_filename)
+        save_document(doc, output_filename, control)
         return os.path.abspath(output_filename)
     
     except Exception as e:
         print(f"Error creating document: {str(e)}")
         return None
 
-def main():
+class MergePart:
+    """
+    One source of a merged document: pasted text, or a Word/PDF document with its import options.
+    
+    Attributes:
+        text: The text content (a str, an iterable of lines or a text stream), or None
+        source_file: Path to a Word or PDF source, or an in-memory buffer of it, or None
+        source_name (str): Original filename, used to detect the type of a buffer
+        import_options (dict): pages, paragraphs, start_heading, end_heading or page_texts,
+            as accepted by build_document_from_source
+    """
+    
+    __slots__ = ("text", "source_file", "source_name", "import_options")
+    
+    def __init__(self, source_file=None, source_name=None, text=None, **import_options):
+        if (source_file is None) == (text is None):
+            raise ValueError("A merge part needs either a source document or text")
+        self.text = text
+        self.source_file = source_file
+        self.source_name = source_name
+        self.import_options = import_options
+    
+    @classmethod
+    def from_text(cls, text):
+        """A part made of the user's text, formatted as build_document_from_text would."""
+        return cls(text=text)
+    
+    def __repr__(self):
+        if self.text is not None:
+            return "MergePart(text)"
+        name = self.source_name or (self.source_file if isinstance(self.source_file, str) else "buffer")
+        return f"MergePart({name!r})"
+
+def build_merged_document(parts, template_path="cybergen-template.docx", control=None, memory_budget=None,
+                          page_breaks=True, pipeline=None, stats=None):
+    """
+    Builds one template document from several sources in order, without saving it.
+    
+    The template is loaded once and each part (text, a Word annex, a PDF appendix,
+    ...) is streamed into it in turn, exactly as it would be formatted on its own.
+    Parts are read from `parts` only when reached and no reference is kept once
+    a part has been consumed, so pass an iterator (e.g. a generator that opens each
+    upload as it is reached) to let every source be freed before the next is read:
+    memory then grows with the output, plus only the largest single source.
+    
+    Each part is checked against the memory budget when it is reached, counting the
+    output already built, and is streamed if holding it in memory would not fit.
+    
+    Args:
+        parts: Iterable of MergePart, in document order
+        template_path (str): Path to the template document
+        control (JobControl): Receives progress and may cancel or time out the build
+        memory_budget (int): Peak memory allowed for the job in bytes; None reads
+            CYBERGEN_JOB_MEMORY_MB, 0 means unlimited
+        page_breaks (bool): Start each part after the first on a new page
+        pipeline (bool): PDF parts: extract pages in a worker process; None decides per part
+        stats (PipelineStats): Receives the throughput of the 'extract' and 'render' stages
+    
+    Returns:
+        docx.Document: The merged document
+    
+    Raises:
+        MemoryBudgetExceeded: If a part is estimated not to fit in what is left of the budget
+        ValueError: If there are no parts, or a part is not a supported source
+    """
+    # Check if template exists
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"Template file not found: {template_path}")
+    
+    if control is not None:
+        control.set_stage("loading")
+    
+    # Load the template document once for all parts
+    doc = load_template(template_path)
+    
+    # Set margins to ensure spacing on every page
+    set_document_margins(doc, top=1.5, bottom=1.5)
+    
+    # Add current date to the first page
+    add_current_date(doc)
+    
+    built = template_memory(template_path)
+    part_count = 0
+    for part in parts:
+        if part.text is not None:
+            if isinstance(part.text, str):
+                estimate = estimate_text_memory(part.text)
+                plan_part_ingestion(estimate, built, memory_budget)
+                built += estimate.streaming
+        else:
+            file_ext = _check_source(part.source_file, part.source_name, part.import_options.get("pages"),
+                                     part.import_options.get("paragraphs"))
+            estimate = estimate_source_memory(part.source_file, file_ext, pages=part.import_options.get("pages"))
+            streaming = plan_part_ingestion(estimate, built, memory_budget)
+            built += estimate.streaming
+            # Once consumed, an upload buffer no longer counts; what it added to the output does
+            if is_buffer_source(part.source_file):
+                built -= memoryview(part.source_file).nbytes
+        
+        if part_count and page_breaks:
+            doc.add_page_break()
+        
+        if part.text is not None:
+            if control is not None:
+                control.set_stage("rendering")
+            _append_text(doc, part.text, control)
+        else:
+            _append_source(doc, part.source_file, file_ext, control=control, streaming=streaming,
+                           pipeline=pipeline, stats=stats, **part.import_options)
+        part_count += 1
+        # Drop this part (and its source) before the next one is read
+        part = None
+    
+    if not part_count:
+        raise ValueError("Nothing to merge: no sources were given")
+    
+    # Set widow/orphan control for the whole document to prevent single lines
+    for paragraph in doc.paragraphs:
+        paragraph.paragraph_format.widow_control = True
+    
+    return doc
+
+def main(profile=None):
     """
     Main function to handle user interaction and document processing.
+    
+    Args:
+        profile (bool): Profile every document (True), none (False), or sample per CYBERGEN_PROFILE (None)
     """
     print("CyberGen Document Formatter")
     print("==========================")
@@ -425,7 +855,11 @@ def main():
             elif not output_name.lower().endswith('.docx'):
                 output_name += '.docx'
                 
-            document_path = insert_text_into_template(input_text, template_path=template_path, output_filename=output_name)
+            with profile_job(profile=profile, kind="text", input_size=input_size(input_text),
+                             template=template_path) as job_profile:
+                document_path = insert_text_into_template(input_text, template_path=template_path, output_filename=output_name)
+            if job_profile is not None:
+                print(f"Profile written to: {job_profile.report_path}")
             if document_path:
                 print(f"\nDocument successfully created at: {document_path}")
                 print("Note: Text has been formatted according to heading detection rules.")
@@ -446,7 +880,11 @@ def main():
                 output_name += '.docx'
             
             # Use the new function to copy content preserving formatting
-            document_path = copy_document_to_template(file_path, template_path=template_path, output_filename=output_name)
+            with profile_job(profile=profile, kind="document", source=file_path, input_size=input_size(file_path),
+                             template=template_path) as job_profile:
+                document_path = copy_document_to_template(file_path, template_path=template_path, output_filename=output_name)
+            if job_profile is not None:
+                print(f"Profile written to: {job_profile.report_path}")
             if document_path:
                 print(f"\nDocument successfully created at: {document_path}")
                 print("Note: Text has been formatted according to heading detection rules.")
@@ -461,4 +899,5 @@ def main():
             print("\nInvalid choice. Please try again.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    import sys
+    main(profile=True if "--profile" in sys.argv[1:] else None) 
\ No newline at end of file
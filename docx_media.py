@@ -0,0 +1,261 @@
+import hashlib
+import posixpath
+import threading
+import zipfile
+
+from lxml import etree
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import Part, XmlPart
+from docx.parts.image import ImagePart
+
+from source_io import open_source
+from docx_stream import REL_NS, main_document_part
+
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+WP_DOCPR = "{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}docPr"
+
+# Relationships whose targets are opaque binary parts with no relationships of
+# their own, so they can be moved as raw bytes. Anything else (charts, diagrams,
+# ...) would need its whole part graph copied, and is dropped as before.
+# External targets (links) are always carried over.
+RAW_PART_RELTYPES = {RT.IMAGE, RT.OLE_OBJECT, RT.PACKAGE}
+
+# Digests of template media, keyed by the identity of the blob. Every copy of a
+# cached template shares the prototype's blobs, so each is hashed only once.
+_template_digests = {}
+_template_digests_lock = threading.Lock()
+_TEMPLATE_DIGESTS_MAX = 1024
+
+
+def _digest(blob):
+    return hashlib.sha256(blob).digest()
+
+
+def _template_digest(blob):
+    key = id(blob)
+    entry = _template_digests.get(key)
+    if entry is not None and entry[0] is blob:
+        return entry[1]
+    digest = _digest(blob)
+    with _template_digests_lock:
+        if len(_template_digests) >= _TEMPLATE_DIGESTS_MAX:
+            _template_digests.clear()
+        # Keep the blob alive with its digest so the id is never reused for another blob
+        _template_digests[key] = (blob, digest)
+    return digest
+
+
+def _partname_template(partname):
+    """'/word/media/image3.png' -> '/word/media/image%d.png'"""
+    directory, filename = posixpath.split(partname)
+    stem, ext = posixpath.splitext(filename)
+    stem = stem.rstrip("0123456789") or "part"
+    return posixpath.join(directory, stem.replace("%", "%%") + "%d" + ext.replace("%", "%%"))
+
+
+class MediaTransfer:
+    """
+    Carries images and embedded objects from a .docx source into a generated document.
+
+    Media parts are copied as raw bytes straight from the source zip, never decoded.
+    Each blob is hashed once and deduplicated against everything already in the
+    output package, including the template's own media, so a letterhead or signature
+    that also appears in the template, or repeats in the source, is stored once.
+
+    The source package is opened on first use, so documents without media cost nothing.
+    Use as a context manager, or call close().
+    """
+
+    def __init__(self, doc, source):
+        """
+        Args:
+            doc (docx.Document): The document being generated
+            source: Path to the .docx source, or an in-memory buffer of it
+        """
+        self._doc = doc
+        self._source = source
+        self._stream_context = None
+        self._package = None
+        self._rels = None
+        self._content_types = None
+        self._by_digest = None
+        self._partnames = None
+        self._next_docpr_id = None
+        # Source rId -> output rId
+        self._rids = {}
+        self.parts_added = 0
+        self.parts_reused = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._package is not None:
+            self._package.close()
+            self._package = None
+        if self._stream_context is not None:
+            self._stream_context.__exit__(None, None, None)
+            self._stream_context = None
+
+    def _open(self):
+        self._stream_context = open_source(self._source)
+        self._package = zipfile.ZipFile(self._stream_context.__enter__())
+        main_part = main_document_part(self._package)
+        main_dir, main_name = posixpath.split(main_part)
+
+        self._rels = {}
+        try:
+            rels = etree.fromstring(self._package.read(posixpath.join(main_dir, "_rels", main_name + ".rels")))
+        except KeyError:
+            rels = None
+        if rels is not None:
+            for rel in rels.iter("{%s}Relationship" % REL_NS):
+                external = rel.get("TargetMode") == "External"
+                target = rel.get("Target")
+                if not external:
+                    target = posixpath.normpath(posixpath.join(main_dir, target) if not target.startswith("/")
+                                                else target.lstrip("/"))
+                self._rels[rel.get("Id")] = (rel.get("Type"), target, external)
+
+        types = etree.fromstring(self._package.read("[Content_Types].xml"))
+        self._content_types = {
+            "defaults": {item.get("Extension").lower(): item.get("ContentType")
+                         for item in types.iter("{%s}Default" % CT_NS)},
+            "overrides": {item.get("PartName").lstrip("/"): item.get("ContentType")
+                          for item in types.iter("{%s}Override" % CT_NS)},
+        }
+
+    def read_related_part(self, reltype):
+        """
+        Read a part the source document relates to, e.g. its styles.
+
+        Args:
+            reltype (str): Relationship type of the part
+
+        Returns:
+            bytes: The part's content, or None if the source has no such part
+        """
+        if self._package is None:
+            self._open()
+            self._index_output()
+        for rel_type, target, external in self._rels.values():
+            if rel_type == reltype and not external:
+                try:
+                    return self._package.read(target)
+                except KeyError:
+                    return None
+        return None
+
+    def _index_output(self):
+        """Hash the binary parts already in the output package (the template's media)."""
+        self._by_digest = {}
+        self._partnames = set()
+        for part in self._doc.part.package.iter_parts():
+            self._partnames.add(part.partname)
+            if not isinstance(part, XmlPart) and part.blob:
+                self._by_digest.setdefault(_template_digest(part.blob), part)
+        # Drawing ids must be unique across the whole package: headers and footers
+        # (e.g. the template's logo) count as well as the body
+        docpr_ids = [int(docpr.get("id"))
+                     for part in self._doc.part.package.iter_parts() if isinstance(part, XmlPart)
+                     for docpr in part.element.iter(WP_DOCPR)
+                     if (docpr.get("id") or "").isdigit()]
+        self._next_docpr_id = max(docpr_ids, default=0) + 1
+
+    def _content_type(self, member):
+        content_type = self._content_types["overrides"].get(member)
+        if content_type is None:
+            ext = posixpath.splitext(member)[1].lstrip(".").lower()
+            content_type = self._content_types["defaults"].get(ext, "application/octet-stream")
+        return content_type
+
+    def _new_partname(self, member):
+        template = _partname_template("/" + member)
+        n = 1
+        while template % n in self._partnames:
+            n += 1
+        partname = PackURI(template % n)
+        self._partnames.add(partname)
+        return partname
+
+    def _can_import(self, rid):
+        rel = self._rels.get(rid)
+        if rel is None:
+            return False
+        reltype, target, external = rel
+        if external:
+            return True
+        if reltype not in RAW_PART_RELTYPES:
+            return False
+        try:
+            self._package.getinfo(target)
+        except KeyError:
+            return False
+        return True
+
+    def _import_rel(self, rid):
+        new_rid = self._rids.get(rid)
+        if new_rid is not None:
+            return new_rid
+        reltype, target, external = self._rels[rid]
+        if external:
+            new_rid = self._doc.part.relate_to(target, reltype, is_external=True)
+        else:
+            blob = self._package.read(target)
+            digest = _digest(blob)
+            part = self._by_digest.get(digest)
+            if part is None:
+                partname = self._new_partname(target)
+                content_type = self._content_type(target)
+                if reltype == RT.IMAGE:
+                    part = ImagePart(partname, content_type, blob)
+                else:
+                    part = Part(partname, content_type, blob, self._doc.part.package)
+                self._by_digest[digest] = part
+                self.parts_added += 1
+            else:
+                self.parts_reused += 1
+            new_rid = self._doc.part.relate_to(part, reltype)
+        self._rids[rid] = new_rid
+        return new_rid
+
+    def import_element(self, element):
+        """
+        Point the relationship references of a copied element at the output package.
+
+        The media each reference targets is added to the output (or reused when an
+        identical blob is already there), and drawing ids are renumbered so they
+        stay unique in the output document.
+
+        Args:
+            element: A copy of a source element (e.g. w:drawing or a whole w:tbl), modified in place
+
+        Returns:
+            bool: False if the element references something that cannot be carried over,
+                in which case it should be left out
+        """
+        if self._package is None:
+            self._open()
+            self._index_output()
+        prefix = "{%s}" % R_NS
+        references = [
+            (node, name, value)
+            for node in element.iter()
+            if isinstance(node.tag, str)
+            for name, value in node.attrib.items()
+            if name.startswith(prefix)
+        ]
+        # Check everything first, so a dropped element never leaves orphaned parts behind
+        if not all(self._can_import(value) for _, _, value in references):
+            return False
+        for node, name, value in references:
+            node.set(name, self._import_rel(value))
+        for docpr in element.iter(WP_DOCPR):
+            docpr.set("id", str(self._next_docpr_id))
+            self._next_docpr_id += 1
+        return True
@@ -0,0 +1,260 @@
+import copy
+import posixpath
+import zipfile
+
+from lxml import etree
+from docx.enum.text import WD_UNDERLINE
+
+from source_io import open_source
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+
+
+def _w(tag):
+    return "{%s}%s" % (W_NS, tag)
+
+
+W_BODY = _w("body")
+W_P = _w("p")
+W_R = _w("r")
+W_HYPERLINK = _w("hyperlink")
+W_TBL = _w("tbl")
+W_SDT = _w("sdt")
+W_SECTPR = _w("sectPr")
+W_RPR = _w("rPr")
+W_VAL = _w("val")
+W_T = _w("t")
+W_BR = _w("br")
+MC_ALTERNATE_CONTENT = "{http://schemas.openxmlformats.org/markup-compatibility/2006}AlternateContent"
+
+# Run children that carry media: DrawingML pictures, VML pictures, OLE objects
+# and alternate content (e.g. text boxes with a VML fallback)
+MEDIA_TAGS = (_w("drawing"), _w("pict"), _w("object"), MC_ALTERNATE_CONTENT)
+
+# Body-level elements we get end events for; everything else is cleared along with them
+BODY_LEVEL_TAGS = (W_P, W_TBL, W_SDT, W_SECTPR)
+
+# Run inner-content elements and their text equivalents, mirroring python-docx
+RUN_TEXT_TAGS = {
+    _w("tab"): "\t",
+    _w("ptab"): "\t",
+    _w("cr"): "\n",
+    _w("noBreakHyphen"): "-",
+}
+
+
+class SourceRun:
+    """A run read from a streamed source, with the formatting (and media) that gets carried over."""
+
+    __slots__ = ("text", "bold", "italic", "underline", "media")
+
+    def __init__(self, text, bold=None, italic=None, underline=None, media=None):
+        self.text = text
+        self.bold = bold
+        self.italic = italic
+        self.underline = underline
+        self.media = media
+
+
+class SourceParagraph:
+    """A body paragraph read from a streamed source, exposing `text` and `runs` like python-docx."""
+
+    __slots__ = ("text", "runs", "has_media")
+
+    def __init__(self, text, runs, has_media=False):
+        self.text = text
+        self.runs = runs
+        self.has_media = has_media
+
+    @property
+    def has_content(self):
+        """True if the paragraph has text or media to carry over."""
+        return self.has_media or bool(self.text.strip())
+
+
+class SourceTable:
+    """
+    A body-level table read from a streamed source, as a detached copy of its w:tbl element.
+
+    Tables have no paragraph `text` of their own (python-docx's Document.paragraphs
+    skips them too), so paragraph numbering and heading matching ignore them.
+    """
+
+    __slots__ = ("element",)
+
+    text = ""
+    runs = ()
+    has_content = True
+
+    def __init__(self, element):
+        self.element = element
+
+
+def _on_off(element):
+    """Value of a boolean run property like w:b, using python-docx's tri-state semantics."""
+    if element is None:
+        return None
+    val = element.get(W_VAL)
+    if val is None:
+        return True
+    return val in ("1", "true", "on")
+
+
+def _underline(element):
+    """Value of w:u mapped the same way as python-docx's Font.underline."""
+    if element is None:
+        return None
+    val = element.get(W_VAL)
+    if val is None:
+        return None
+    if val == "single":
+        return True
+    if val == "none":
+        return False
+    try:
+        return WD_UNDERLINE.from_xml(val)
+    except (KeyError, ValueError):
+        return None
+
+
+def _run_text(r):
+    parts = []
+    for child in r:
+        tag = child.tag
+        if tag == W_T:
+            parts.append(child.text or "")
+        elif tag == W_BR:
+            # Only text-wrapping breaks are text; page and column breaks are not
+            if child.get(_w("type"), "textWrapping") == "textWrapping":
+                parts.append("\n")
+        elif tag in RUN_TEXT_TAGS:
+            parts.append(RUN_TEXT_TAGS[tag])
+    return "".join(parts)
+
+
+def read_paragraph(p, media=False):
+    """
+    Convert a w:p element to a SourceParagraph.
+
+    `text` includes hyperlink text and `runs` holds only the direct w:r children,
+    matching python-docx's Paragraph.text and Paragraph.runs.
+
+    Args:
+        p: A w:p lxml element
+        media (bool): Also keep copies of the drawings and embedded objects in each run
+
+    Returns:
+        SourceParagraph: The paragraph's text and runs
+    """
+    runs = []
+    text_parts = []
+    has_media = False
+    for child in p:
+        if child.tag == W_R:
+            rPr = child.find(W_RPR)
+            if rPr is not None:
+                run = SourceRun(
+                    _run_text(child),
+                    bold=_on_off(rPr.find(_w("b"))),
+                    italic=_on_off(rPr.find(_w("i"))),
+                    underline=_underline(rPr.find(_w("u"))),
+                )
+            else:
+                run = SourceRun(_run_text(child))
+            if media:
+                # Copied, since the streamed element is cleared once the paragraph has been read
+                run.media = [copy.deepcopy(item) for item in child if item.tag in MEDIA_TAGS] or None
+                has_media = has_media or run.media is not None
+            runs.append(run)
+            text_parts.append(run.text)
+        elif child.tag == W_HYPERLINK:
+            text_parts.extend(_run_text(r) for r in child.iterfind(W_R))
+    return SourceParagraph("".join(text_parts), runs, has_media)
+
+
+def main_document_part(package):
+    """
+    Locate the main document part of a .docx package from its package relationships.
+
+    Args:
+        package (zipfile.ZipFile): The opened .docx package
+
+    Returns:
+        str: Zip member name of the main document part (usually 'word/document.xml')
+    """
+    try:
+        rels = etree.fromstring(package.read("_rels/.rels"))
+        for rel in rels.iter("{%s}Relationship" % REL_NS):
+            if rel.get("Type") == OFFICE_DOCUMENT_REL:
+                return posixpath.normpath(rel.get("Target").lstrip("/"))
+    except KeyError:
+        pass
+    return "word/document.xml"
+
+
+def iter_body_elements(source):
+    """
+    Stream the body-level elements of a .docx document one at a time.
+
+    The main document part is decompressed and parsed incrementally straight from
+    the zip, and each element is cleared (together with anything before it) once the
+    consumer asks for the next one, so memory stays bounded regardless of the size
+    of the document or its embedded media.
+
+    Args:
+        source: Path to the .docx file, or an in-memory buffer of it
+
+    Yields:
+        lxml element: Each w:p, w:tbl, w:sdt or w:sectPr child of w:body, in order
+    """
+    with open_source(source) as stream, zipfile.ZipFile(stream) as package:
+        with package.open(main_document_part(package)) as xml:
+            for _, elem in etree.iterparse(xml, events=("end",), tag=BODY_LEVEL_TAGS, huge_tree=True):
+                parent = elem.getparent()
+                if parent is None or parent.tag != W_BODY:
+                    # Nested element (e.g. a paragraph in a table cell); freed with its ancestor
+                    continue
+                yield elem
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+
+def iter_docx_blocks(source, media=False):
+    """
+    Stream the body paragraphs and tables of a .docx document, in document order.
+
+    Args:
+        source: Path to the .docx file, or an in-memory buffer of it
+        media (bool): Also keep copies of the drawings and embedded objects in each run
+
+    Yields:
+        SourceParagraph or SourceTable: Each top-level paragraph or table
+    """
+    for elem in iter_body_elements(source):
+        if elem.tag == W_P:
+            yield read_paragraph(elem, media)
+        elif elem.tag == W_TBL:
+            # Copied, since the streamed element is cleared once it has been read
+            yield SourceTable(copy.deepcopy(elem))
+
+
+def iter_docx_paragraphs(source, media=False):
+    """
+    Stream the body paragraphs of a .docx document with their run formatting.
+
+    Yields the same paragraphs as python-docx's Document.paragraphs without
+    building the document tree.
+
+    Args:
+        source: Path to the .docx file, or an in-memory buffer of it
+        media (bool): Also keep copies of the drawings and embedded objects in each run
+
+    Yields:
+        SourceParagraph: Each top-level body paragraph, in document order
+    """
+    for elem in iter_body_elements(source):
+        if elem.tag == W_P:
+            yield read_paragraph(elem, media)
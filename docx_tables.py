@@ -0,0 +1,251 @@
+from lxml import etree
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import parse_xml
+
+from docx_stream import W_NS, W_R, W_RPR, W_VAL, MEDIA_TAGS
+from docx_media import R_NS
+
+# CyberGen body text size (12.5pt), in the half-points w:sz uses
+BODY_FONT_HALF_POINTS = "25"
+
+
+def _w(tag):
+    return "{%s}%s" % (W_NS, tag)
+
+
+W_SZ = _w("sz")
+W_STYLE = _w("style")
+W_STYLE_ID = _w("styleId")
+W_TBLPR = _w("tblPr")
+W_TBLSTYLE = _w("tblStyle")
+W_BASED_ON = _w("basedOn")
+
+# w:rPr children that must come after w:sz (CT_RPr is a sequence)
+RPR_AFTER_SZ = frozenset(_w(tag) for tag in (
+    "szCs", "highlight", "u", "effect", "bdr", "shd", "fitText", "vertAlign", "rtl", "cs",
+    "em", "lang", "eastAsianLayout", "specVanish", "oMath", "rPrChange",
+))
+
+# References into source parts that are not carried over (notes, comments) and
+# source list numbering, which would otherwise attach to the template's lists
+DROPPED_TAGS = frozenset(_w(tag) for tag in (
+    "footnoteReference", "endnoteReference", "commentReference",
+    "commentRangeStart", "commentRangeEnd", "numPr",
+))
+
+
+def _set_font_size(rPr, half_points):
+    sz = rPr.find(W_SZ)
+    if sz is None:
+        sz = etree.Element(W_SZ)
+        for child in rPr:
+            if child.tag in RPR_AFTER_SZ:
+                child.addprevious(sz)
+                break
+        else:
+            rPr.append(sz)
+    sz.set(W_VAL, half_points)
+
+
+class TableImporter:
+    """
+    Carries tables over from a .docx source by cloning their w:tbl subtrees.
+
+    Each table is appended to the output body as one subtree instead of being
+    rebuilt cell by cell through python-docx. A single pass over the copy finds
+    every run and run-properties element so the CyberGen body font size can be
+    applied, along with the media and references that need fixing up. Table
+    styles the template lacks are copied from the source's styles part.
+    """
+
+    def __init__(self, doc, media, half_points=BODY_FONT_HALF_POINTS):
+        """
+        Args:
+            doc (docx.Document): The document being generated
+            media (MediaTransfer): Media transfer for the same source, used for images in cells
+            half_points (str): Font size applied to every run, in half-points
+        """
+        self._doc = doc
+        self._media = media
+        self._half_points = half_points
+        self._source_styles = None
+        self._known_styles = None
+        self.tables_added = 0
+
+    def _style_ids(self):
+        if self._known_styles is None:
+            self._known_styles = {
+                style.get(W_STYLE_ID) for style in self._doc.styles.element.iterchildren(W_STYLE)
+            }
+        return self._known_styles
+
+    def _import_style(self, style_id):
+        """Copy a table style (and the styles it is based on) from the source if the template lacks it."""
+        known = self._style_ids()
+        if style_id in known:
+            return True
+        if self._source_styles is None:
+            blob = self._media.read_related_part(RT.STYLES)
+            self._source_styles = {}
+            if blob is not None:
+                for style in etree.fromstring(blob).iterchildren(W_STYLE):
+                    self._source_styles[style.get(W_STYLE_ID)] = style
+        style = self._source_styles.get(style_id)
+        if style is None:
+            return False
+        known.add(style_id)
+        based_on = style.find(W_BASED_ON)
+        if based_on is not None:
+            self._import_style(based_on.get(W_VAL))
+        self._doc.styles.element.append(parse_xml(etree.tostring(style)))
+        return True
+
+    def prepare(self, tbl):
+        """
+        Adapt a copied w:tbl element to the output document, in place.
+
+        Args:
+            tbl: A detached copy of a source w:tbl element
+        """
+        runs, rprs, media, dropped, linked = [], [], [], [], []
+        rel_prefix = "{%s}" % R_NS
+        for node in tbl.iter():
+            tag = node.tag
+            if tag == W_R:
+                runs.append(node)
+            elif tag == W_RPR:
+                rprs.append(node)
+            elif tag in MEDIA_TAGS:
+                media.append(node)
+            elif tag in DROPPED_TAGS:
+                dropped.append(node)
+            elif (any(name.startswith(rel_prefix) for name in node.attrib)
+                  and not any(ancestor.tag in MEDIA_TAGS for ancestor in node.iterancestors())):
+                # e.g. hyperlinks; references inside media are fixed up with the media element
+                linked.append(node)
+
+        for node in dropped:
+            node.getparent().remove(node)
+        # Media nested in other media (e.g. alternate content) is handled with its outermost element
+        for node in media:
+            if node.getparent() is not None and any(ancestor.tag in MEDIA_TAGS for ancestor in node.iterancestors()):
+                continue
+            if not self._media.import_element(node):
+                node.getparent().remove(node)
+        for node in linked:
+            if not self._media.import_element(node):
+                for name in [name for name in node.attrib if name.startswith(rel_prefix)]:
+                    del node.attrib[name]
+
+        for run in runs:
+            if len(run) and run[0].tag == W_RPR:
+                continue
+            rPr = etree.Element(W_RPR)
+            run.insert(0, rPr)
+            rprs.append(rPr)
+        for rPr in rprs:
+            _set_font_size(rPr, self._half_points)
+
+        tbl_style = tbl.find(f"{W_TBLPR}/{W_TBLSTYLE}")
+        if tbl_style is not None and not self._import_style(tbl_style.get(W_VAL)):
+            tbl_style.getparent().remove(tbl_style)
+
+    def add(self, tbl):
+        """
+        Adapt a copied w:tbl element and append it to the end of the output document.
+
+        Args:
+            tbl: A detached copy of a source w:tbl element
+        """
+        self.prepare(tbl)
+        self._doc.element.body._insert_tbl(tbl)
+        self.tables_added += 1
+
+
+def _benchmark_source(path, rows, cols):
+    """Write a .docx whose body is one rows x cols table with styled runs."""
+    import docx
+
+    doc = docx.Document()
+    doc.add_paragraph("BENCHMARK TABLE:")
+    cell = (
+        '<w:tc><w:tcPr><w:tcW w:w="1000" w:type="dxa"/></w:tcPr><w:p><w:r><w:rPr><w:b/></w:rPr>'
+        '<w:t>r{row}c{col}</w:t></w:r><w:r><w:t xml:space="preserve"> value</w:t></w:r></w:p></w:tc>'
+    )
+    body = "".join(
+        "<w:tr>" + "".join(cell.format(row=row, col=col) for col in range(cols)) + "</w:tr>"
+        for row in range(rows)
+    )
+    doc.element.body._insert_tbl(parse_xml(
+        f'<w:tbl xmlns:w="{W_NS}"><w:tblPr><w:tblStyle w:val="TableGrid"/><w:tblW w:w="0" w:type="auto"/></w:tblPr>'
+        f'<w:tblGrid>{"<w:gridCol/>" * cols}</w:tblGrid>{body}</w:tbl>'
+    ))
+    doc.add_paragraph("After the table.")
+    doc.save(path)
+
+
+def _rebuild_cell_by_cell(source_path, template_path):
+    """The python-docx way: recreate each table through the document API, cell by cell."""
+    import docx
+    from docx.shared import Pt
+    from template_cache import load_template
+
+    source = docx.Document(source_path)
+    doc = load_template(template_path)
+    for table in source.tables:
+        rows, cols = len(table.rows), len(table.columns)
+        new_table = doc.add_table(rows=rows, cols=cols)
+        for row_index, row in enumerate(table.rows):
+            new_cells = new_table.rows[row_index].cells
+            for col_index, cell in enumerate(row.cells):
+                paragraph = new_cells[col_index].paragraphs[0]
+                for run in cell.paragraphs[0].runs:
+                    new_run = paragraph.add_run(run.text)
+                    new_run.bold = run.bold
+                    new_run.font.size = Pt(12.5)
+    return doc
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+    import time
+
+    from cybergen_template import build_document_from_source
+
+    parser = argparse.ArgumentParser(description="Benchmark table carry-over from Word sources")
+    parser.add_argument("--rows", type=int, default=1000, help="table rows")
+    parser.add_argument("--cols", type=int, default=10, help="table columns")
+    parser.add_argument("--template", default="cybergen-template.docx", help="template document")
+    parser.add_argument("--compare", action="store_true",
+                        help="also time a cell-by-cell python-docx rebuild (minutes for 10k cells)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source_path = os.path.join(directory, "table_source.docx")
+        _benchmark_source(source_path, args.rows, args.cols)
+        cells = args.rows * args.cols
+
+        started = time.perf_counter()
+        doc = build_document_from_source(source_path, args.template)
+        clone_time = time.perf_counter() - started
+        assert len(doc.tables) == 1 and len(doc.tables[0].rows) == args.rows
+
+        rebuild_time = None
+        if args.compare:
+            started = time.perf_counter()
+            _rebuild_cell_by_cell(source_path, args.template)
+            rebuild_time = time.perf_counter() - started
+
+        output_path = os.path.join(directory, "table_output.docx")
+        started = time.perf_counter()
+        doc.save(output_path)
+        save_time = time.perf_counter() - started
+
+    print(f"{cells} cells ({args.rows} x {args.cols}):")
+    print(f"  full import with subtree cloning: {clone_time:.2f}s")
+    if rebuild_time is not None:
+        print(f"  cell-by-cell python-docx rebuild (tables only): {rebuild_time:.2f}s "
+              f"({rebuild_time / clone_time:.1f}x slower)")
+    print(f"  saving the output: {save_time:.2f}s")
@@ -0,0 +1,479 @@
+import difflib
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import zipfile
+
+from lxml import etree
+
+from docx_stream import W_NS, main_document_part
+from docx_media import R_NS, WP_DOCPR
+
+DEFAULT_TEMPLATE = "cybergen-template.docx"
+DEFAULT_CORPUS = ("README.md", "ppt openai.docx", "ppt openai.pdf")
+TEXT_EXTENSIONS = (".txt", ".md")
+DOCUMENT_EXTENSIONS = (".docx", ".doc", ".pdf")
+DEFAULT_REPEAT = 3
+DEFAULT_MIN_SPEEDUP = 1.0
+DEFAULT_MIN_MEMORY_SAVING = 1.0
+DIFF_CONTEXT = 2
+MAX_DIFF_LINES = 40
+
+W14_NS = "http://schemas.microsoft.com/office/word/2010/wordml"
+PREFIXES = {
+    W_NS: "w",
+    R_NS: "r",
+    W14_NS: "w14",
+    "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing": "wp",
+    "http://schemas.openxmlformats.org/drawingml/2006/main": "a",
+    "http://schemas.openxmlformats.org/drawingml/2006/picture": "pic",
+    "http://www.w3.org/XML/1998/namespace": "xml",
+}
+
+
+def _w(tag):
+    return "{%s}%s" % (W_NS, tag)
+
+
+W_P, W_R, W_RPR, W_T = _w("p"), _w("r"), _w("rPr"), _w("t")
+W_BOOKMARK_START, W_BOOKMARK_END = _w("bookmarkStart"), _w("bookmarkEnd")
+
+# Markup Word adds while editing that has no effect on the rendered document
+IGNORED_TAGS = frozenset(_w(tag) for tag in ("proofErr", "lastRenderedPageBreak", "noProof"))
+IGNORED_ATTRIBUTES = frozenset(["{%s}paraId" % W14_NS, "{%s}textId" % W14_NS])
+
+
+def _name(qualified):
+    """'{namespace}local' -> 'prefix:local', so canonical lines are readable."""
+    if not qualified.startswith("{"):
+        return qualified
+    namespace, local = qualified[1:].split("}", 1)
+    prefix = PREFIXES.get(namespace)
+    return f"{prefix}:{local}" if prefix else qualified
+
+
+class _Canonicalizer:
+    """Renders document.xml as indented lines, one element per line, in a stable form."""
+
+    def __init__(self):
+        # Relationship ids and drawing ids only have to be unique, so they are
+        # numbered in order of first appearance
+        self._ids = {}
+        self._go_back = set()
+
+    def _id(self, kind, value):
+        key = (kind, value)
+        if key not in self._ids:
+            self._ids[key] = f"{kind}{sum(1 for known in self._ids if known[0] == kind) + 1}"
+        return self._ids[key]
+
+    def _attributes(self, element):
+        items = []
+        for name, value in element.attrib.items():
+            if name in IGNORED_ATTRIBUTES or (name.startswith("{%s}" % W_NS) and name[len(W_NS) + 2:].startswith("rsid")):
+                continue
+            if name.startswith("{%s}" % R_NS):
+                value = self._id("rel", value)
+            elif element.tag == WP_DOCPR and name == "id":
+                value = self._id("drawing", value)
+            items.append(f"{_name(name)}={value}")
+        return " ".join(sorted(items))
+
+    def _element(self, element, depth, lines):
+        if not isinstance(element.tag, str) or element.tag in IGNORED_TAGS:
+            return
+        if element.tag in (W_BOOKMARK_START, W_BOOKMARK_END):
+            # Word's own cursor bookmark
+            if element.get(_w("name")) == "_GoBack" or element.get(_w("id")) in self._go_back:
+                return
+        if element.tag == W_P:
+            self._paragraph(element, depth, lines)
+            return
+        attributes = self._attributes(element)
+        text = (element.text or "").strip() if len(element) == 0 else ""
+        line = "  " * depth + _name(element.tag)
+        if attributes:
+            line += " " + attributes
+        if text:
+            line += f" {text!r}"
+        lines.append(line)
+        for child in element:
+            self._element(child, depth + 1, lines)
+
+    def _properties(self, rpr):
+        """Run properties as one string; no properties and an empty w:rPr are the same."""
+        if rpr is None:
+            return ""
+        lines = []
+        for child in rpr:
+            self._element(child, 0, lines)
+        return "; ".join(sorted(lines))
+
+    def _paragraph(self, paragraph, depth, lines):
+        attributes = self._attributes(paragraph)
+        lines.append("  " * depth + "w:p" + (" " + attributes if attributes else ""))
+        # Adjacent runs with the same properties are merged, so run splitting never shows
+        pending_format, pending_text = None, []
+
+        def flush():
+            if pending_text:
+                lines.append("  " * (depth + 1) + f"run [{pending_format}] {''.join(pending_text)!r}")
+            pending_text.clear()
+
+        for child in paragraph:
+            if child.tag == W_R:
+                run_format = self._properties(child.find(W_RPR))
+                for item in child:
+                    if item.tag == W_RPR or not isinstance(item.tag, str) or item.tag in IGNORED_TAGS:
+                        continue
+                    if item.tag == W_T:
+                        if run_format != pending_format:
+                            flush()
+                            pending_format = run_format
+                        pending_text.append(item.text or "")
+                    else:
+                        # Tabs, breaks, drawings... are kept as elements of their own
+                        flush()
+                        pending_format = None
+                        nested = []
+                        self._element(item, depth + 2, nested)
+                        if nested:
+                            lines.append("  " * (depth + 1) + f"run [{run_format}]")
+                            lines.extend(nested)
+            else:
+                nested = []
+                self._element(child, depth + 1, nested)
+                if not nested:
+                    # Ignored markup between runs (proofing marks, Word's cursor
+                    # bookmark) must not keep them from being merged
+                    continue
+                flush()
+                pending_format = None
+                lines.extend(nested)
+        flush()
+
+    def canonicalize(self, root):
+        self._go_back = {
+            bookmark.get(_w("id")) for bookmark in root.iter(W_BOOKMARK_START)
+            if bookmark.get(_w("name")) == "_GoBack"
+        }
+        lines = []
+        self._element(root, 0, lines)
+        return lines
+
+
+def canonicalize_document(path):
+    """
+    Canonical form of a .docx file's main document part, for semantic comparison.
+
+    Adjacent runs with identical formatting are merged, attributes are sorted,
+    revision ids, proofing marks and Word's cursor bookmark are dropped, and
+    relationship and drawing ids are renumbered in order of appearance. Two
+    documents that render the same produce the same lines.
+
+    Args:
+        path (str): Path to the .docx file
+
+    Returns:
+        list: One line per element, indented by depth
+    """
+    with zipfile.ZipFile(path) as package:
+        root = etree.fromstring(package.read(main_document_part(package)))
+    return _Canonicalizer().canonicalize(root)
+
+
+def diff_documents(reference_path, candidate_path, context=DIFF_CONTEXT):
+    """
+    Semantic diff of two generated documents.
+
+    Returns:
+        list: Unified diff lines of their canonical forms (empty if they are equivalent)
+    """
+    return list(difflib.unified_diff(canonicalize_document(reference_path), canonicalize_document(candidate_path),
+                                     "reference", "candidate", n=context, lineterm=""))
+
+
+# Runs in a fresh interpreter inside the engine's tree, so each engine imports its own
+# modules and its peak RSS is its own
+_ENGINE_SCRIPT = r"""
+import contextlib, io, json, os, sys, time
+sys.path.insert(0, os.getcwd())
+
+def rss():
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def peak_rss():
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+kind, source, template, output, repeat, result_path = sys.argv[1:]
+with contextlib.redirect_stdout(io.StringIO()):
+    import cybergen_template as engine
+    if kind == "text":
+        with open(source, encoding="utf-8") as file:
+            text = file.read()
+        run = lambda path: engine.insert_text_into_template(text, template, path)
+    else:
+        run = lambda path: engine.copy_document_to_template(source, template, path)
+    base = rss() or peak_rss()
+    times, error = [], None
+    for attempt in range(int(repeat)):
+        path = output if attempt == 0 else f"{output}.{attempt}.docx"
+        started = time.perf_counter()
+        created = run(path)
+        times.append(time.perf_counter() - started)
+        if not created:
+            error = "engine returned no document"
+            break
+        if attempt:
+            os.unlink(path)
+with open(result_path, "w") as file:
+    json.dump({"seconds": min(times), "memory": max(peak_rss() - base, 0), "error": error}, file)
+"""
+
+
+def run_engine(engine_dir, kind, source, output_path, template_path=DEFAULT_TEMPLATE, repeat=DEFAULT_REPEAT):
+    """
+    Generate one document with the engine in `engine_dir`, in a fresh process.
+
+    Args:
+        engine_dir (str): Source tree whose cybergen_template module is the engine
+        kind (str): 'text' (source is a text file) or 'document' (a Word/PDF file)
+        source (str): Path to the input
+        output_path (str): Where to write the document
+        template_path (str): Template document, the same for every engine
+        repeat (int): Runs to time; the fastest is reported
+
+    Returns:
+        dict: 'seconds' (fastest run), 'memory' (peak RSS growth over the imported engine, bytes)
+            and 'error' (None on success)
+    """
+    fd, result_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        process = subprocess.run(
+            [sys.executable, "-c", _ENGINE_SCRIPT, kind, os.path.abspath(source), os.path.abspath(template_path),
+             os.path.abspath(output_path), str(repeat), result_path],
+            cwd=engine_dir, capture_output=True, text=True,
+        )
+        if process.returncode != 0:
+            lines = process.stderr.strip().splitlines()
+            return {"seconds": None, "memory": None, "error": lines[-1] if lines else f"exit code {process.returncode}"}
+        with open(result_path) as file:
+            return json.load(file)
+    finally:
+        os.unlink(result_path)
+
+
+def export_revision(revision, directory):
+    """
+    Write the tree of a git revision (e.g. the last release) into a directory.
+
+    Args:
+        revision (str): Any git revision
+        directory (str): Existing directory to extract into
+
+    Returns:
+        str: The directory
+    """
+    archive = subprocess.run(["git", "archive", "--format=tar", revision], capture_output=True, check=True).stdout
+    with tempfile.TemporaryFile() as file:
+        file.write(archive)
+        file.seek(0)
+        with tarfile.open(fileobj=file) as tar:
+            tar.extractall(directory)
+    return directory
+
+
+def corpus_items(paths):
+    """
+    Expand files and directories into (kind, path) items: .txt/.md files are text
+    inputs, Word and PDF files are documents.
+    """
+    items = []
+    for path in paths:
+        names = sorted(os.path.join(path, name) for name in os.listdir(path)) if os.path.isdir(path) else [path]
+        for name in names:
+            ext = os.path.splitext(name.lower())[1]
+            if ext in TEXT_EXTENSIONS:
+                items.append(("text", name))
+            elif ext in DOCUMENT_EXTENSIONS:
+                items.append(("document", name))
+    return items
+
+
+class GateReport:
+    """
+    Outcome of an equivalence gate run.
+
+    Attributes:
+        items (list): Per input: dict with 'source', 'kind', 'equivalent', 'diff',
+            'reference' and 'candidate' (the run_engine results)
+        min_speedup (float): Required reference/candidate time ratio, or None
+        min_memory_saving (float): Required reference/candidate peak memory ratio, or None
+    """
+
+    def __init__(self, items, min_speedup, min_memory_saving):
+        self.items = items
+        self.min_speedup = min_speedup
+        self.min_memory_saving = min_memory_saving
+
+    def _total(self, engine, key, combine):
+        values = [item[engine][key] for item in self.items if item[engine][key] is not None]
+        return combine(values) if values else None
+
+    @property
+    def speedup(self):
+        """Total reference time over total candidate time."""
+        reference, candidate = self._total("reference", "seconds", sum), self._total("candidate", "seconds", sum)
+        return reference / candidate if reference and candidate else None
+
+    @property
+    def memory_saving(self):
+        """Largest reference memory growth over largest candidate memory growth."""
+        reference, candidate = self._total("reference", "memory", max), self._total("candidate", "memory", max)
+        if reference is None or candidate is None:
+            return None
+        return reference / max(candidate, 1)
+
+    @property
+    def equivalent(self):
+        return all(item["equivalent"] for item in self.items)
+
+    @property
+    def fast_enough(self):
+        """
+        True if the candidate is faster or lighter by the configured factor.
+        """
+        checks = []
+        if self.min_speedup is not None:
+            checks.append(self.speedup is not None and self.speedup >= self.min_speedup)
+        if self.min_memory_saving is not None:
+            checks.append(self.memory_saving is not None and self.memory_saving >= self.min_memory_saving)
+        return any(checks) if checks else True
+
+    @property
+    def passed(self):
+        return self.equivalent and self.fast_enough
+
+    def summary(self):
+        def seconds(value):
+            return "failed" if value is None else f"{value * 1000:.0f}ms"
+
+        def megabytes(value):
+            return "-" if value is None else f"{value / (1024 * 1024):.1f}MB"
+
+        lines = []
+        for item in self.items:
+            reference, candidate = item["reference"], item["candidate"]
+            status = "same" if item["equivalent"] else "DIFFERENT"
+            lines.append(f"{status:<9} {item['source']}: time {seconds(reference['seconds'])} -> "
+                         f"{seconds(candidate['seconds'])}, memory {megabytes(reference['memory'])} -> "
+                         f"{megabytes(candidate['memory'])}")
+            for engine in ("reference", "candidate"):
+                if item[engine]["error"]:
+                    lines.append(f"  {engine} failed: {item[engine]['error']}")
+            shown = item["diff"][:MAX_DIFF_LINES]
+            lines.extend("  " + line for line in shown)
+            if len(item["diff"]) > len(shown):
+                lines.append(f"  ... {len(item['diff']) - len(shown)} more diff lines")
+        speedup, saving = self.speedup, self.memory_saving
+        lines.append(f"speedup {'-' if speedup is None else f'{speedup:.2f}x'} (required {self.min_speedup}), "
+                     f"memory saving {'-' if saving is None else f'{saving:.2f}x'} "
+                     f"(required {self.min_memory_saving}); either one passes")
+        verdict = "PASSED" if self.passed else "FAILED"
+        reasons = []
+        if not self.equivalent:
+            reasons.append("outputs differ")
+        if not self.fast_enough:
+            reasons.append("candidate is neither fast enough nor light enough")
+        lines.append(verdict + (f": {', '.join(reasons)}" if reasons else ""))
+        return "\n".join(lines)
+
+
+def run_gate(reference_dir, candidate_dir, corpus, template_path=DEFAULT_TEMPLATE, repeat=DEFAULT_REPEAT,
+             min_speedup=DEFAULT_MIN_SPEEDUP, min_memory_saving=DEFAULT_MIN_MEMORY_SAVING, output_dir=None):
+    """
+    Generate every corpus input with both engines and compare outputs, speed and memory.
+
+    Args:
+        reference_dir (str): Tree with the engine whose output is correct by definition
+        candidate_dir (str): Tree with the engine to adopt
+        corpus: Iterable of (kind, path) from corpus_items
+        template_path (str): Template used by both engines
+        repeat (int): Timed runs per input and engine
+        min_speedup (float): Candidate must be this many times faster, or None to not require it
+        min_memory_saving (float): Or use this many times less memory, or None
+        output_dir (str): Keep the generated documents here (default: a temporary directory)
+
+    Returns:
+        GateReport: Per-input results and the verdict
+    """
+    with tempfile.TemporaryDirectory(prefix="cybergen_gate_") as scratch:
+        output_dir = output_dir or scratch
+        os.makedirs(output_dir, exist_ok=True)
+        items = []
+        for index, (kind, source) in enumerate(corpus):
+            item = {"source": source, "kind": kind}
+            outputs = {}
+            for engine, engine_dir in (("reference", reference_dir), ("candidate", candidate_dir)):
+                outputs[engine] = os.path.join(output_dir, f"{index:03d}_{engine}.docx")
+                item[engine] = run_engine(engine_dir, kind, source, outputs[engine], template_path, repeat)
+            if item["reference"]["error"] or item["candidate"]["error"]:
+                item["equivalent"] = item["reference"]["error"] is not None and item["candidate"]["error"] is not None
+                item["diff"] = []
+            else:
+                item["diff"] = diff_documents(outputs["reference"], outputs["candidate"])
+                item["equivalent"] = not item["diff"]
+            items.append(item)
+    return GateReport(items, min_speedup, min_memory_saving)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Check that an optimized engine produces the same documents as the reference, and is faster")
+    parser.add_argument("corpus", nargs="*", default=list(DEFAULT_CORPUS),
+                        help="text (.txt/.md), Word and PDF inputs, or directories of them")
+    reference = parser.add_mutually_exclusive_group(required=True)
+    reference.add_argument("--reference-rev", help="git revision with the reference engine, e.g. the last release")
+    reference.add_argument("--reference-dir", help="source tree with the reference engine")
+    parser.add_argument("--candidate-dir", default=".", help="source tree with the optimized engine (default: this one)")
+    parser.add_argument("-t", "--template", default=DEFAULT_TEMPLATE, help="template used by both engines")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed runs per input")
+    parser.add_argument("--min-speedup", type=float, default=DEFAULT_MIN_SPEEDUP,
+                        help="required reference/candidate time ratio (0 to not require)")
+    parser.add_argument("--min-memory-saving", type=float, default=DEFAULT_MIN_MEMORY_SAVING,
+                        help="required reference/candidate peak memory ratio (0 to not require)")
+    parser.add_argument("--keep", help="keep the generated documents in this directory")
+    args = parser.parse_args()
+
+    corpus = corpus_items(args.corpus)
+    if not corpus:
+        parser.error("The corpus contains no text, Word or PDF inputs")
+
+    with tempfile.TemporaryDirectory(prefix="cybergen_reference_") as reference_tree:
+        reference_dir = args.reference_dir or export_revision(args.reference_rev, reference_tree)
+        report = run_gate(reference_dir, args.candidate_dir, corpus, args.template, args.repeat,
+                          args.min_speedup or None, args.min_memory_saving or None, args.keep)
+    print(report.summary())
+    sys.exit(0 if report.passed else 1)
@@ -5,9 +5,11 @@ from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.section import WD_SECTION
 import os
 import sys
-import re
 from datetime import datetime
-import PyPDF2  # For PDF text extraction
+
+from inline_markup import HEADER, iter_blocks
+from pdf_backends import choose_backend
+from source_io import open_source
 
 def extract_text_from_pdf(file_path):
     """
@@ -26,14 +28,16 @@ def extract_text_from_pdf(file_path):
         if not file_path.lower().endswith('.pdf'):
             raise ValueError("File must be a PDF")
         
-        text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n\n"
+        text = []
+        with open_source(file_path) as stream:
+            _, texts = choose_backend(file_path).iter_pages(stream)
+            try:
+                for page_text in texts:
+                    text.append(page_text + "\n\n")
+            finally:
+                texts.close()
         
-        return text.strip()
+        return "".join(text).strip()
     
     except Exception as e:
         print(f"Error extracting text from PDF: {str(e)}")
@@ -107,13 +111,6 @@ def create_document_from_template(input_text, output_filename="generated_documen
         date_run.bold = True  # Make date bold
         date_para.space_after = Pt(12)
         
-        # Process the input text
-        paragraphs = input_text.strip().split('\n')
-        
-        # Check if the document has content
-        if not paragraphs:
-            raise ValueError("Input text is empty. Please provide some content.")
-        
         # Add standard "TO WHOM IT MAY CONCERN" header
         concern_para = doc.add_paragraph()
         concern_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
@@ -123,34 +120,33 @@ def create_document_from_template(input_text, output_filename="generated_documen
         concern_run.font.size = Pt(14)
         concern_para.space_after = Pt(12)
         
-        # Extract and format header if it exists (enclosed in ** and with .underline)
-        header_pattern = r'\*\*\[(.*?)\]\{\.underline\}\*\*'
-        
-        for i, paragraph in enumerate(paragraphs):
-            # Check if this paragraph is a header
-            header_match = re.search(header_pattern, paragraph)
-            if header_match:
+        # Process the input text in a single pass: headers (**[text]{.underline}**)
+        # stay where they appear, other lines become body paragraphs whose
+        # bold/italic/underline spans are emitted as runs
+        for kind, content in iter_blocks(input_text):
+            if kind == HEADER:
                 # Add the header with proper formatting
-                header_text = header_match.group(1)
                 header = doc.add_paragraph()
-                header_run = header.add_run(header_text)
+                header_run = header.add_run(content)
                 header_run.bold = True
                 header_run.underline = WD_UNDERLINE.SINGLE
                 header_run.font.size = Pt(14)
                 header.alignment = WD_ALIGN_PARAGRAPH.CENTER
                 header.space_after = Pt(12)  # Add spacing after header
-                
-                # Remove this paragraph from the list so it's not processed again
-                paragraphs[i] = ""
-        
-        # Process remaining paragraphs as body text
-        for paragraph in paragraphs:
-            if paragraph.strip():  # Skip empty paragraphs
-                p = doc.add_paragraph()
-                p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY  # Change to justified alignment
-                p.space_after = Pt(6)  # Add spacing between paragraphs
-                run = p.add_run(paragraph)
+                continue
+            
+            p = doc.add_paragraph()
+            p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY  # Change to justified alignment
+            p.space_after = Pt(6)  # Add spacing between paragraphs
+            for inline in content:
+                run = p.add_run(inline.text)
                 run.font.size = Pt(12.5)
+                if inline.bold:
+                    run.bold = True
+                if inline.italic:
+                    run.italic = True
+                if inline.underline:
+                    run.underline = WD_UNDERLINE.SINGLE
         
         # Add signature section
         doc.add_paragraph().space_after = Pt(24)  # Add space before signature
@@ -238,14 +234,14 @@ def parse_document(file_path):
             return extract_text_from_pdf(file_path)
         elif file_ext in ('.docx', '.doc'):
             # Parse Word document
-        doc = docx.Document(file_path)
-        full_text = []
-        
-        for para in doc.paragraphs:
-            if para.text.strip():  # Only add non-empty paragraphs
-                full_text.append(para.text)
-        
-        return '\n'.join(full_text)
+            doc = docx.Document(file_path)
+            full_text = []
+            
+            for para in doc.paragraphs:
+                if para.text.strip():  # Only add non-empty paragraphs
+                    full_text.append(para.text)
+            
+            return '\n'.join(full_text)
         else:
             raise ValueError("File must be a Word document (.doc or .docx) or a PDF (.pdf)")
     
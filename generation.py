@@ -0,0 +1,324 @@
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from cybergen_template import build_document_from_text, build_document_from_source, build_merged_document, save_document
+from job_control import JobCancelled, DeadlineExceeded
+from profiling import profile_job, input_size
+from memory_budget import MemoryBudgetExceeded
+from source_io import source_extension
+from metrics import active_job, record_job
+
+DEFAULT_TEMPLATE = "cybergen-template.docx"
+
+
+class GenerationError(Exception):
+    """
+    A failed generation, with the stage it failed in and a coarse error kind.
+
+    Attributes:
+        stage (str): 'build' (reading sources and filling the template) or 'save'
+        kind (str): 'not_found', 'invalid_input', 'too_large', 'cancelled', 'deadline' or 'internal'
+        cause (Exception): The original exception
+    """
+
+    def __init__(self, message, stage, kind, cause=None):
+        super().__init__(message)
+        self.stage = stage
+        self.kind = kind
+        self.cause = cause
+
+    def __reduce__(self):
+        # Keep stage and kind when results cross process boundaries; the cause may not pickle
+        return (self.__class__, (str(self), self.stage, self.kind))
+
+    @classmethod
+    def from_exception(cls, exc, stage):
+        if isinstance(exc, MemoryBudgetExceeded):
+            kind = "too_large"
+        elif isinstance(exc, DeadlineExceeded):
+            kind = "deadline"
+        elif isinstance(exc, JobCancelled):
+            kind = "cancelled"
+        elif isinstance(exc, FileNotFoundError):
+            kind = "not_found"
+        elif isinstance(exc, ValueError):
+            kind = "invalid_input"
+        else:
+            kind = "internal"
+        return cls(str(exc), stage, kind, cause=exc)
+
+
+class GenerationResult:
+    """
+    Outcome of one generation job.
+
+    Attributes:
+        job_id (str): Unique identifier of the job
+        output_path (str): Absolute path of the created document, or None on failure
+        error (GenerationError): The failure, or None on success
+        elapsed (float): Wall-clock seconds spent on the job
+        profile_path (str): JSON profile report if the job was profiled, else None
+    """
+
+    __slots__ = ("job_id", "output_path", "error", "elapsed", "profile_path")
+
+    def __init__(self, job_id, output_path=None, error=None, elapsed=0.0, profile_path=None):
+        self.job_id = job_id
+        self.output_path = output_path
+        self.error = error
+        self.elapsed = elapsed
+        self.profile_path = profile_path
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def raise_for_error(self):
+        """Raise the job's GenerationError if it failed."""
+        if self.error is not None:
+            raise self.error
+
+    def __repr__(self):
+        status = "ok" if self.ok else f"error={self.error.kind}: {self.error}"
+        return f"GenerationResult({self.job_id}, {self.output_path!r}, {status}, {self.elapsed:.3f}s)"
+
+
+def _save_atomically(doc, output_path, output_dir, job_id, control=None, stats=None):
+    """
+    Save a document to its own file.
+
+    Without an explicit path a unique file is created in output_dir. The document is
+    written to a private temp file next to the target and renamed into place, so two
+    jobs writing the same path never interleave and readers never see a partial file.
+    If the save fails or is cancelled, nothing is left behind.
+    """
+    created_path = None
+    if output_path is None:
+        fd, output_path = tempfile.mkstemp(prefix=f"cybergen_{job_id}_", suffix=".docx", dir=output_dir)
+        os.close(fd)
+        created_path = output_path
+    output_path = os.path.abspath(output_path)
+    partial_path = f"{output_path}.{job_id}.part"
+    try:
+        save_document(doc, partial_path, control, stats)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        # The placeholder reserved by mkstemp is still empty; do not leave it behind
+        if created_path is not None and os.path.exists(created_path):
+            os.unlink(created_path)
+        raise
+    finally:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+    return output_path
+
+
+def _execute_job(job_id, build, output_path, output_dir, control, stats=None):
+    started = time.perf_counter()
+    try:
+        doc = build()
+    except Exception as e:
+        return GenerationResult(job_id, error=GenerationError.from_exception(e, "build"),
+                                elapsed=time.perf_counter() - started)
+    try:
+        path = _save_atomically(doc, output_path, output_dir, job_id, control, stats)
+    except Exception as e:
+        return GenerationResult(job_id, error=GenerationError.from_exception(e, "save"),
+                                elapsed=time.perf_counter() - started)
+    return GenerationResult(job_id, output_path=path, elapsed=time.perf_counter() - started)
+
+
+def _run_job(build, output_path, output_dir, control=None, profile=None, tags=None, stats=None,
+             source_type=None, size=None):
+    job_id = uuid.uuid4().hex[:12]
+    with active_job():
+        with profile_job(job_id, profile, **(tags or {})) as job_profile:
+            result = _execute_job(job_id, build, output_path, output_dir, control, stats)
+            if job_profile is not None:
+                job_profile.tag(ok=result.ok, error_kind=result.error.kind if result.error else None)
+                if stats is not None:
+                    job_profile.tag(stages=stats.as_dict())
+    if job_profile is not None:
+        result.profile_path = job_profile.report_path
+    record_job(source_type or (tags or {}).get("kind", "unknown"), size, result.elapsed,
+               result.error.kind if result.error else None)
+    return result
+
+
+def generate_from_text(input_text, template_path=DEFAULT_TEMPLATE, output_path=None, output_dir=None, control=None,
+                       profile=None):
+    """
+    Generate a formatted document from text. Thread-safe and never prints.
+
+    Args:
+        input_text (str): The text content to be inserted
+        template_path (str): Path to the template document
+        output_path (str): Where to save the document; a unique file is created if None
+        output_dir (str): Directory for the unique file (default: the system temp directory)
+        control (JobControl): Receives progress; its token or timeout stops the job, which then
+            fails with kind 'cancelled' or 'deadline' and leaves no output behind
+        profile (bool): Profile this job (True), never (False), or sample per CYBERGEN_PROFILE (None)
+
+    Returns:
+        GenerationResult: The output path on success, a GenerationError on failure
+    """
+    size = input_size(input_text)
+    return _run_job(lambda: build_document_from_text(input_text, template_path, control=control),
+                    output_path, output_dir, control, profile,
+                    tags={"kind": "text", "input_size": size, "template": template_path},
+                    source_type="text", size=size)
+
+
+def generate_from_document(source_file, template_path=DEFAULT_TEMPLATE, output_path=None, output_dir=None,
+                           source_name=None, control=None, profile=None, **import_options):
+    """
+    Generate a formatted document from a Word or PDF source. Thread-safe and never prints.
+
+    Args:
+        source_file: Path to the source document, or an in-memory buffer of it
+        template_path (str): Path to the template document
+        output_path (str): Where to save the document; a unique file is created if None
+        output_dir (str): Directory for the unique file (default: the system temp directory)
+        source_name (str): Original filename, used to detect the type of a buffer
+        control (JobControl): Receives progress; its token or timeout stops the job, which then
+            fails with kind 'cancelled' or 'deadline' and leaves no output behind
+        profile (bool): Profile this job (True), never (False), or sample per CYBERGEN_PROFILE (None)
+        **import_options: pages, paragraphs, start_heading, end_heading, page_texts, pipeline
+            or stats, as accepted by copy_document_to_template
+
+    Returns:
+        GenerationResult: The output path on success, a GenerationError on failure
+    """
+    size = input_size(source_file)
+    return _run_job(
+        lambda: build_document_from_source(source_file, template_path, source_name, control=control, **import_options),
+        output_path,
+        output_dir,
+        control,
+        profile,
+        stats=import_options.get("stats"),
+        source_type=source_extension(source_file, source_name).lstrip(".") or "unknown",
+        size=size,
+        tags={
+            "kind": "document",
+            "source": source_name or (source_file if isinstance(source_file, str) else None),
+            "input_size": size,
+            "template": template_path,
+            "import_options": {key: value for key, value in import_options.items()
+                               if key not in ("page_texts", "stats")},
+        },
+    )
+
+
+def generate_merged(parts, template_path=DEFAULT_TEMPLATE, output_path=None, output_dir=None, control=None,
+                    profile=None, page_breaks=True, stats=None):
+    """
+    Generate one formatted document from several sources in order. Thread-safe and never prints.
+
+    Args:
+        parts: Iterable of MergePart (text, Word or PDF sources), in document order; pass
+            an iterator so each source can be freed once it has been consumed
+        template_path (str): Path to the template document
+        output_path (str): Where to save the document; a unique file is created if None
+        output_dir (str): Directory for the unique file (default: the system temp directory)
+        control (JobControl): Receives progress; its token or timeout stops the job, which then
+            fails with kind 'cancelled' or 'deadline' and leaves no output behind
+        profile (bool): Profile this job (True), never (False), or sample per CYBERGEN_PROFILE (None)
+        page_breaks (bool): Start each part after the first on a new page
+        stats (PipelineStats): Receives the throughput of each stage
+
+    Returns:
+        GenerationResult: The output path on success, a GenerationError on failure
+    """
+    return _run_job(
+        lambda: build_merged_document(parts, template_path, control=control, page_breaks=page_breaks, stats=stats),
+        output_path,
+        output_dir,
+        control,
+        profile,
+        stats=stats,
+        tags={"kind": "merge", "template": template_path},
+        source_type="merge",
+    )
+
+
+def run_stress_test(jobs=64, workers=16, template_path=DEFAULT_TEMPLATE, source_file=None):
+    """
+    Run many generations concurrently and verify that none of them interfere.
+
+    Every text job embeds a unique marker; each output must exist, be distinct, and
+    contain its own marker and no other. Jobs are queued first and released together
+    to maximise contention.
+
+    Args:
+        jobs (int): Number of generations to run
+        workers (int): Thread pool size
+        template_path (str): Path to the template document
+        source_file (str): Optional Word/PDF file; every other job imports it
+
+    Returns:
+        list: Problems found (empty if the run was clean)
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    import docx
+
+    start = threading.Event()
+    output_dir = tempfile.mkdtemp(prefix="cybergen_stress_")
+
+    def job(index):
+        start.wait()
+        if source_file and index % 2:
+            return index, None, generate_from_document(source_file, template_path, output_dir=output_dir)
+        marker = f"STRESS MARKER {index:05d}"
+        text = f"{marker}:\nParagraph for job {index}.\n" * 3
+        return index, marker, generate_from_text(text, template_path, output_dir=output_dir)
+
+    problems = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(job, index) for index in range(jobs)]
+        start.set()
+        outcomes = [future.result() for future in futures]
+
+    seen_paths = set()
+    for index, marker, result in outcomes:
+        if not result.ok:
+            problems.append(f"job {index}: {result.error.stage}/{result.error.kind}: {result.error}")
+            continue
+        if result.output_path in seen_paths:
+            problems.append(f"job {index}: output path reused: {result.output_path}")
+        seen_paths.add(result.output_path)
+        if marker is None:
+            continue
+        texts = [p.text for p in docx.Document(result.output_path).paragraphs]
+        markers = {t.rstrip(":") for t in texts if t.startswith("STRESS MARKER")}
+        if markers != {marker}:
+            problems.append(f"job {index}: expected only {marker!r}, found {sorted(markers)}")
+
+    for path in seen_paths:
+        os.unlink(path)
+    os.rmdir(output_dir)
+    return problems
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Concurrency stress test for the generation API")
+    parser.add_argument("--jobs", type=int, default=64, help="number of generations")
+    parser.add_argument("--workers", type=int, default=16, help="thread pool size")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help="template document")
+    parser.add_argument("--source", help="Word or PDF file imported by every other job")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    problems = run_stress_test(args.jobs, args.workers, args.template, args.source)
+    elapsed = time.perf_counter() - started
+    for problem in problems:
+        print(problem)
+    print(f"{args.jobs} jobs on {args.workers} threads in {elapsed:.2f}s: "
+          f"{'FAILED with ' + str(len(problems)) + ' problem(s)' if problems else 'OK'}")
+    sys.exit(1 if problems else 0)
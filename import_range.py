@@ -0,0 +1,128 @@
+import re
+
+_RANGE_PART = re.compile(r"^\s*(\d+)\s*(?:(-)\s*(\d*)\s*)?$")
+
+
+def parse_range_spec(spec):
+    """
+    Parse a page or paragraph range specification such as "12-40, 45, 50-".
+
+    Numbers are 1-based and inclusive; an open end ("50-") runs to the end.
+
+    Args:
+        spec (str): The range specification
+
+    Returns:
+        list: (start, end) tuples, with end None for open-ended ranges
+
+    Raises:
+        ValueError: If the specification is malformed
+    """
+    ranges = []
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        match = _RANGE_PART.match(part)
+        if not match:
+            raise ValueError(f"Invalid range '{part.strip()}'. Use e.g. 12-40, 45 or 50-")
+        start = int(match.group(1))
+        if match.group(2) is None:
+            end = start
+        else:
+            end = int(match.group(3)) if match.group(3) else None
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"Invalid range '{part.strip()}'. Numbers start at 1 and must not decrease")
+        ranges.append((start, end))
+    if not ranges:
+        raise ValueError("Range specification is empty")
+    return ranges
+
+
+def _as_ranges(selection):
+    if isinstance(selection, str):
+        return parse_range_spec(selection)
+    return [(number, number) for number in selection]
+
+
+def resolve_page_range(pages, page_count):
+    """
+    Turn a page selection into the zero-based page numbers to extract.
+
+    Args:
+        pages: A range specification string, an iterable of 1-based page numbers, or None
+        page_count (int): Number of pages in the document
+
+    Returns:
+        list: Zero-based page numbers in document order, or None for every page
+    """
+    if pages is None:
+        return None
+    selected = set()
+    for start, end in _as_ranges(pages):
+        last = page_count if end is None else min(end, page_count)
+        selected.update(range(start - 1, last))
+    return sorted(selected)
+
+
+def _normalize_heading(text):
+    return " ".join(text.split()).casefold()
+
+
+def select_paragraphs(paragraphs, paragraph_range=None, start_heading=None, end_heading=None):
+    """
+    Filter a stream of paragraphs down to the requested part of the document.
+
+    Empty paragraphs are dropped and the remaining ones are numbered from 1.
+    Items without text that still carry content (a true `has_content`, e.g.
+    image-only paragraphs and tables) are not numbered; they go along with the
+    numbered paragraph before them. A
+    heading section starts at the paragraph matching `start_heading` (included) and
+    stops before the one matching `end_heading`; headings match case-insensitively.
+    Iteration stops as soon as nothing further can be selected, so the rest of a
+    streamed source is never read.
+
+    Args:
+        paragraphs: Iterable of paragraphs with a `text` attribute
+        paragraph_range: Range specification string or iterable of 1-based paragraph numbers
+        start_heading (str): Text of the heading where the selection begins
+        end_heading (str): Text of the heading where the selection ends
+
+    Yields:
+        The selected non-empty paragraphs, in document order
+    """
+    ranges = _as_ranges(paragraph_range) if paragraph_range is not None else None
+    last_wanted = None
+    if ranges and all(end is not None for _, end in ranges):
+        last_wanted = max(end for _, end in ranges)
+    start_key = _normalize_heading(start_heading) if start_heading else None
+    end_key = _normalize_heading(end_heading) if end_heading else None
+    in_section = start_key is None
+    # Whether untexted content (images, tables) at this point is selected
+    selected = in_section and (ranges is None or any(start <= 1 for start, _ in ranges))
+
+    number = 0
+    for para in paragraphs:
+        if not para.text.strip():
+            if selected and getattr(para, "has_content", False):
+                yield para
+            continue
+        selected = False
+        number += 1
+        if last_wanted is not None and number > last_wanted:
+            return
+
+        if start_key is not None or end_key is not None:
+            key = _normalize_heading(para.text)
+            if not in_section:
+                if key != start_key:
+                    continue
+                in_section = True
+            elif end_key is not None and key == end_key:
+                return
+
+        if ranges is not None and not any(
+            start <= number and (end is None or number <= end) for start, end in ranges
+        ):
+            continue
+        selected = True
+        yield para
@@ -0,0 +1,144 @@
+import re
+
+from text_stream import iter_stripped_pieces
+
+HEADER = "header"
+BODY = "body"
+
+# The header form, searched for anywhere in a line as it always has been; a line
+# containing one is the header alone
+HEADER_PATTERN = re.compile(r"\*\*\[(.*?)\]\{\.underline\}\*\*")
+# One compiled alternation, scanned left to right once per body line. Underline
+# text may not contain brackets, so a failed match stops at the next bracket and
+# no character is rescanned more than a constant number of times.
+TOKEN_PATTERN = re.compile(
+    r"\[(?P<underline>[^\[\]]*)\]\{\.underline\}"
+    r"|\\(?P<escaped>[^\w\s])"
+    r"|(?P<bold>\*\*)"
+    r"|(?P<italic>\*)"
+)
+
+
+class InlineRun:
+    """
+    A run of text with uniform formatting.
+
+    Attributes:
+        text (str): The run's text
+        bold (bool): Whether the run is bold
+        italic (bool): Whether the run is italic
+        underline (bool): Whether the run is underlined
+    """
+
+    __slots__ = ("text", "bold", "italic", "underline")
+
+    def __init__(self, text, bold=False, italic=False, underline=False):
+        self.text = text
+        self.bold = bold
+        self.italic = italic
+        self.underline = underline
+
+    def same_format(self, other):
+        return (self.bold, self.italic, self.underline) == (other.bold, other.italic, other.underline)
+
+    def __repr__(self):
+        flags = "".join(flag for flag, on in (("b", self.bold), ("i", self.italic), ("u", self.underline)) if on)
+        return f"InlineRun({self.text!r}{', ' + flags if flags else ''})"
+
+
+def _append(runs, run):
+    if not run.text:
+        return
+    if runs and runs[-1].same_format(run):
+        runs[-1].text += run.text
+    else:
+        runs.append(run)
+
+
+def tokenize_line(line):
+    """
+    Split one line of marked-up text into a header or formatted runs.
+
+    Recognises the `**[text]{.underline}**` header form, `**bold**`, `*italic*`,
+    `[text]{.underline}` and backslash escapes. A line containing a header is
+    the header alone, as before. As in Markdown, `*` and `**` only open before a
+    non-space character and only close after one, so `5 * 3` keeps its asterisk;
+    other markers, and markers left unclosed at the end of the line, are kept as
+    literal text.
+
+    Args:
+        line (str): One line of input
+
+    Returns:
+        tuple: (HEADER, header text) or (BODY, list of InlineRun)
+    """
+    header = HEADER_PATTERN.search(line)
+    if header:
+        return HEADER, header.group(1)
+
+    # Each entry is [text, bold, italic, underline]; opening markers are kept as
+    # entries too, so an unclosed one can be turned back into text at the end
+    pieces = []
+    bold_at = italic_at = None
+    position = 0
+    for match in TOKEN_PATTERN.finditer(line):
+        bold, italic = bold_at is not None, italic_at is not None
+        if match.start() > position:
+            pieces.append([line[position:match.start()], bold, italic, False])
+        position = match.end()
+        kind = match.lastgroup
+        if kind == "underline":
+            pieces.append([match.group("underline"), bold, italic, True])
+            continue
+        if kind == "escaped":
+            pieces.append([match.group("escaped"), bold, italic, False])
+            continue
+        can_open = match.end() < len(line) and not line[match.end()].isspace()
+        can_close = match.start() > 0 and not line[match.start() - 1].isspace()
+        if kind == "bold":
+            if bold and can_close:
+                pieces[bold_at][0] = ""
+                bold_at = None
+            elif not bold and can_open:
+                bold_at = len(pieces)
+                pieces.append(["**", bold, italic, False])
+            else:
+                pieces.append(["**", bold, italic, False])
+        elif italic and can_close:
+            pieces[italic_at][0] = ""
+            italic_at = None
+        elif not italic and can_open:
+            italic_at = len(pieces)
+            pieces.append(["*", bold, italic, False])
+        else:
+            pieces.append(["*", bold, italic, False])
+    if position < len(line):
+        pieces.append([line[position:], bold_at is not None, italic_at is not None, False])
+
+    # Undo markers that were never closed: everything after them lost that format
+    for opened_at, flag in ((bold_at, 1), (italic_at, 2)):
+        if opened_at is not None:
+            for piece in pieces[opened_at + 1:]:
+                piece[flag] = False
+
+    runs = []
+    for text, bold, italic, underline in pieces:
+        _append(runs, InlineRun(text, bold, italic, underline))
+    return BODY, runs
+
+
+def iter_blocks(input_text):
+    """
+    Tokenize marked-up text line by line, in order.
+
+    Blank lines are skipped and the text is stripped first, as
+    `input_text.strip().split('\\n')` would, without building the list of lines.
+
+    Args:
+        input_text (str): The marked-up text
+
+    Yields:
+        tuple: (HEADER, header text) or (BODY, list of InlineRun) for each non-blank line
+    """
+    for line in iter_stripped_pieces((input_text,), "\n"):
+        yield tokenize_line(line)
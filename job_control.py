@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+
+# Share of the progress bar each stage ends at; rendering and saving have no known total
+STAGE_PROGRESS = {
+    "starting": 0.0,
+    "loading": 0.05,
+    "extracting": 0.6,
+    "rendering": 0.9,
+    "saving": 0.99,
+    "done": 1.0,
+}
+
+
+class JobCancelled(Exception):
+    """Raised inside a generation when its cancellation token is set."""
+
+
+class DeadlineExceeded(JobCancelled):
+    """Raised inside a generation when it runs past its deadline."""
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation flag shared between a job and whoever may cancel it.
+
+    Wraps a threading.Event by default; pass a multiprocessing Event (e.g. from a
+    Manager) to cancel jobs running in other processes.
+    """
+
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        """Ask the job to stop at its next checkpoint."""
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class JobControl:
+    """
+    Progress reporting, cancellation and deadline for one generation job.
+
+    The generation code calls the reporting methods from its hot loops; each call
+    also checks the token and the deadline and raises JobCancelled (or
+    DeadlineExceeded) so the job unwinds promptly, releasing its document and
+    deleting any partially written output.
+
+    The progress callback receives a dict snapshot with the keys stage,
+    pages_extracted, pages_total, paragraphs_emitted, bytes_saved and elapsed.
+    Paragraph updates are throttled to at most one every `report_interval` seconds.
+    """
+
+    def __init__(self, progress=None, token=None, timeout=None, report_interval=0.2):
+        """
+        Args:
+            progress (callable): Called with a progress snapshot, or None
+            token (CancellationToken): Token that cancels the job, or None
+            timeout (float): Seconds the job may run before it is stopped, or None
+            report_interval (float): Minimum seconds between paragraph progress reports
+        """
+        self.progress = progress
+        self.token = token
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout if timeout is not None else None
+        self.report_interval = report_interval
+        self.stage = "starting"
+        self.pages_extracted = 0
+        self.pages_total = None
+        self.paragraphs_emitted = 0
+        self.bytes_saved = 0
+        self._last_report = 0.0
+
+    def __getstate__(self):
+        # Callbacks usually cannot cross process boundaries; the limits can
+        state = self.__dict__.copy()
+        state["progress"] = None
+        return state
+
+    def check(self):
+        """Raise if the job has been cancelled or has run out of time."""
+        if self.token is not None and self.token.cancelled:
+            raise JobCancelled("Job was cancelled")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise DeadlineExceeded(f"Job exceeded its deadline of {self.deadline - self.started:.1f}s")
+
+    def snapshot(self):
+        return {
+            "stage": self.stage,
+            "pages_extracted": self.pages_extracted,
+            "pages_total": self.pages_total,
+            "paragraphs_emitted": self.paragraphs_emitted,
+            "bytes_saved": self.bytes_saved,
+            "elapsed": time.monotonic() - self.started,
+        }
+
+    def _report(self, force=True):
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if force or now - self._last_report >= self.report_interval:
+            self._last_report = now
+            self.progress(self.snapshot())
+
+    def set_stage(self, stage, pages_total=None):
+        """Enter a new stage ('loading', 'extracting', 'rendering', 'saving', 'done')."""
+        self.check()
+        self.stage = stage
+        if pages_total is not None:
+            self.pages_total = pages_total
+        self._report()
+
+    def page_extracted(self):
+        """Record one extracted PDF page."""
+        self.pages_extracted += 1
+        self.check()
+        self._report()
+
+    def paragraph_emitted(self):
+        """Record one paragraph added to the output document."""
+        self.paragraphs_emitted += 1
+        self.check()
+        self._report(force=False)
+
+    def bytes_written(self, count):
+        """Record bytes of the output document written to disk."""
+        self.bytes_saved += count
+        self.check()
+        self._report(force=False)
+
+
+def default_timeout():
+    """
+    Per-job deadline configured with CYBERGEN_JOB_TIMEOUT (seconds), or None if unset.
+    """
+    value = os.environ.get("CYBERGEN_JOB_TIMEOUT", "").strip()
+    if not value:
+        return None
+    try:
+        timeout = float(value)
+    except ValueError:
+        return None
+    return timeout if timeout > 0 else None
+
+
+def describe_progress(snapshot):
+    """
+    Turn a progress snapshot into something a progress bar can show.
+
+    Args:
+        snapshot (dict): As passed to a JobControl progress callback
+
+    Returns:
+        tuple: (fraction between 0 and 1, short status text)
+    """
+    stages = list(STAGE_PROGRESS)
+    stage = snapshot["stage"]
+    end = STAGE_PROGRESS.get(stage, 0.0)
+    index = stages.index(stage) if stage in stages else 0
+    start = STAGE_PROGRESS[stages[index - 1]] if index else 0.0
+
+    if stage == "extracting" and snapshot["pages_total"]:
+        done = snapshot["pages_extracted"] / snapshot["pages_total"]
+        return start + (end - start) * min(done, 1.0), f"Extracting page {snapshot['pages_extracted']} of {snapshot['pages_total']}"
+    if stage == "rendering":
+        return start, f"Formatting paragraphs ({snapshot['paragraphs_emitted']} so far)"
+    if stage == "saving":
+        return start, f"Saving document ({snapshot['bytes_saved'] // 1024} KB written)"
+    if stage == "done":
+        return 1.0, "Done"
+    return start, "Loading template..."
+
+
+class ProgressWriter:
+    """
+    Binary file wrapper that reports bytes written to a JobControl and stops when it is cancelled.
+
+    Once the job is stopped, further writes are discarded (only the position is tracked):
+    python-docx leaves its zip writer open on errors, and it flushes its directory
+    whenever it is collected, long after the real file has been closed and deleted.
+    """
+
+    def __init__(self, file, control):
+        self._file = file
+        self._control = control
+        self._position = None
+
+    def write(self, data):
+        if self._position is not None:
+            self._position += len(data)
+            return len(data)
+        written = self._file.write(data)
+        try:
+            self._control.bytes_written(len(data) if written is None else written)
+        except JobCancelled:
+            self._position = self._file.tell()
+            raise
+        return written
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self._position is None:
+            return self._file.seek(offset, whence)
+        self._position = offset if whence == os.SEEK_SET else self._position + offset
+        return self._position
+
+    def tell(self):
+        return self._file.tell() if self._position is None else self._position
+
+    def flush(self):
+        if self._position is None:
+            self._file.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
@@ -0,0 +1,549 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from generation import DEFAULT_TEMPLATE, generate_from_text, generate_from_document
+from job_control import JobControl, default_timeout, describe_progress
+from metrics import tree_rss
+from scratch import ScratchQuotaExceeded, estimate_job_bytes, get_scratch
+
+JOB_KINDS = ("text", "docx", "pdf")
+DEFAULT_MIX = "text=6,docx=3,pdf=1"
+DEFAULT_DOCX = "ppt openai.docx"
+DEFAULT_PDF = "ppt openai.pdf"
+DEFAULT_SAMPLE_INTERVAL = 0.5
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+HTTP_TIMEOUT = 600
+
+
+def parse_mix(spec):
+    """
+    Parse a job mix such as "text=6,docx=3,pdf=1" into relative weights.
+
+    Args:
+        spec (str): Comma-separated kind=weight pairs; kinds are text, docx and pdf
+
+    Returns:
+        dict: Weight per job kind (kinds with weight 0 are left out)
+    """
+    mix = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        kind, _, weight = part.partition("=")
+        kind = kind.strip().lower()
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind!r} in mix {spec!r}; expected one of {', '.join(JOB_KINDS)}")
+        try:
+            value = float(weight) if weight.strip() else 1.0
+        except ValueError:
+            raise ValueError(f"Invalid weight {weight!r} for {kind} in mix {spec!r}")
+        if value < 0:
+            raise ValueError(f"Negative weight for {kind} in mix {spec!r}")
+        if value:
+            mix[kind] = value
+    if not mix:
+        raise ValueError(f"Job mix {spec!r} selects no jobs")
+    return mix
+
+
+def sample_text(paragraphs=40):
+    """Marked-up text like a pasted report: a header every few paragraphs."""
+    lines = []
+    for index in range(paragraphs):
+        if index % 8 == 0:
+            lines.append(f"SECTION {index // 8 + 1}:")
+        lines.append(f"Paragraph {index + 1} of the load-test document. " * 6)
+    return "\n".join(lines)
+
+
+def load_payloads(mix, text=None, docx_path=DEFAULT_DOCX, pdf_path=DEFAULT_PDF):
+    """
+    Read the inputs for the job kinds in the mix into memory, like uploads.
+
+    Returns:
+        dict: 'text' -> str; 'docx' and 'pdf' -> (file bytes, file name)
+    """
+    payloads = {}
+    if "text" in mix:
+        payloads["text"] = text if text is not None else sample_text()
+    for kind, path in (("docx", docx_path), ("pdf", pdf_path)):
+        if kind in mix:
+            with open(path, "rb") as file:
+                payloads[kind] = (file.read(), os.path.basename(path))
+    return payloads
+
+
+class JobSample:
+    """
+    One simulated request.
+
+    Attributes:
+        session (int): Simulated session that sent it
+        kind (str): 'text', 'docx' or 'pdf'
+        started (float): Seconds since the start of the run
+        latency (float): Seconds until the result came back
+        error (str): Error kind ('invalid_input', 'deadline', 'transport', ...), or None on success
+    """
+
+    __slots__ = ("session", "kind", "started", "latency", "error")
+
+    def __init__(self, session, kind, started, latency, error=None):
+        self.session = session
+        self.kind = kind
+        self.started = started
+        self.latency = latency
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+class LoadReport:
+    """
+    Results of a load test.
+
+    Attributes:
+        target (str): What was driven ('inprocess', 'pool' or the server URL)
+        sessions (int): Number of concurrent simulated sessions
+        samples (list): JobSample for every request, in completion order
+        rss (list): (seconds since start, server RSS in bytes) samples over the run
+        wall_time (float): Seconds from the first request to the last result
+    """
+
+    def __init__(self, target, sessions, samples, rss, wall_time):
+        self.target = target
+        self.sessions = sessions
+        self.samples = samples
+        self.rss = rss
+        self.wall_time = wall_time
+
+    def throughput(self, kind=None):
+        """Successful jobs per second."""
+        done = sum(1 for sample in self.samples if sample.ok and (kind is None or sample.kind == kind))
+        return done / self.wall_time if self.wall_time else 0.0
+
+    def error_rate(self, kind=None):
+        selected = [sample for sample in self.samples if kind is None or sample.kind == kind]
+        return sum(1 for sample in selected if not sample.ok) / len(selected) if selected else 0.0
+
+    def latencies(self, percentiles=DEFAULT_PERCENTILES, kind=None):
+        """
+        Latency percentiles of successful jobs.
+
+        Returns:
+            dict: Percentile -> seconds (None if there were no successful jobs)
+        """
+        values = [sample.latency for sample in self.samples if sample.ok and (kind is None or sample.kind == kind)]
+        return {p: percentile(values, p) for p in percentiles}
+
+    def errors(self):
+        """Number of failed jobs per error kind."""
+        counts = {}
+        for sample in self.samples:
+            if not sample.ok:
+                counts[sample.error] = counts.get(sample.error, 0) + 1
+        return counts
+
+    def peak_rss(self):
+        values = [rss for _, rss in self.rss if rss is not None]
+        return max(values) if values else None
+
+    def as_dict(self):
+        kinds = sorted({sample.kind for sample in self.samples})
+        return {
+            "target": self.target,
+            "sessions": self.sessions,
+            "wall_time": self.wall_time,
+            "jobs": len(self.samples),
+            "throughput": self.throughput(),
+            "error_rate": self.error_rate(),
+            "errors": self.errors(),
+            "latency": {str(p): value for p, value in self.latencies().items()},
+            "by_kind": {
+                kind: {
+                    "jobs": sum(1 for sample in self.samples if sample.kind == kind),
+                    "throughput": self.throughput(kind),
+                    "error_rate": self.error_rate(kind),
+                    "latency": {str(p): value for p, value in self.latencies(kind=kind).items()},
+                }
+                for kind in kinds
+            },
+            "peak_rss": self.peak_rss(),
+            "rss": self.rss,
+            "samples": [
+                {"session": s.session, "kind": s.kind, "started": s.started, "latency": s.latency, "error": s.error}
+                for s in self.samples
+            ],
+        }
+
+    def summary(self):
+        def ms(value):
+            return "-" if value is None else f"{value * 1000:.0f}ms"
+
+        def latency_line(latencies):
+            return " ".join(f"p{p}={ms(value)}" for p, value in latencies.items())
+
+        lines = [
+            f"{self.target}: {self.sessions} sessions, {len(self.samples)} jobs in {self.wall_time:.1f}s, "
+            f"{self.throughput():.2f} jobs/s, {self.error_rate():.1%} errors",
+            f"  latency {latency_line(self.latencies())}",
+        ]
+        for kind in sorted({sample.kind for sample in self.samples}):
+            jobs = sum(1 for sample in self.samples if sample.kind == kind)
+            lines.append(f"  {kind:<5} {jobs:5} jobs {self.throughput(kind):7.2f}/s "
+                         f"{self.error_rate(kind):6.1%} errors  {latency_line(self.latencies(kind=kind))}")
+        for error, count in sorted(self.errors().items()):
+            lines.append(f"  error {error}: {count}")
+        measured = [(at, rss) for at, rss in self.rss if rss is not None]
+        if measured:
+            mb = 1024 * 1024
+            lines.append(f"  server RSS: start {measured[0][1] / mb:.0f} MB, peak {self.peak_rss() / mb:.0f} MB, "
+                         f"end {measured[-1][1] / mb:.0f} MB")
+            # A coarse timeline, about ten points over the run
+            step = max(1, len(measured) // 10)
+            lines.append("  RSS over time: " + ", ".join(
+                f"{at:.0f}s {rss / mb:.0f}MB" for at, rss in measured[::step]))
+        return "\n".join(lines)
+
+
+class InProcessTarget:
+    """
+    Runs jobs on the calling thread, the way a Streamlit server runs each session's
+    script on its own thread: upload buffers go straight to the generation functions
+    with a JobControl driving a (discarded) progress bar and the configured deadline.
+    """
+
+    name = "inprocess"
+
+    def __init__(self, template_path=DEFAULT_TEMPLATE):
+        self.template_path = template_path
+
+    def start(self):
+        return self
+
+    def close(self):
+        pass
+
+    def server_rss(self):
+        return tree_rss()
+
+    def run(self, kind, payload):
+        """
+        Run one job.
+
+        Returns:
+            str: Error kind, or None on success
+        """
+        control = JobControl(progress=describe_progress, timeout=default_timeout())
+        try:
+            # Like the apps: a scratch directory per job, gone once the user has the document
+            size = len(payload) if kind == "text" else len(payload[0])
+            with get_scratch().job_dir(kind, estimate_job_bytes(self.template_path, size)) as job_dir:
+                if kind == "text":
+                    result = generate_from_text(payload, self.template_path, output_dir=job_dir, control=control)
+                else:
+                    data, name = payload
+                    result = generate_from_document(memoryview(data), self.template_path, output_dir=job_dir,
+                                                    source_name=name, control=control)
+        except ScratchQuotaExceeded:
+            return "scratch_full"
+        return None if result.ok else result.error.kind
+
+
+class PoolTarget(InProcessTarget):
+    """Runs jobs on a WorkerSupervisor process pool, as batch.py does."""
+
+    name = "pool"
+
+    def __init__(self, template_path=DEFAULT_TEMPLATE, workers=None):
+        super().__init__(template_path)
+        self.workers = workers
+        self.output_dir = None
+        self._supervisor = None
+
+    def start(self):
+        from worker_pool import WorkerSupervisor
+
+        # One scratch directory for the whole run, since the workers write the documents
+        self.output_dir = get_scratch().create_job_dir("load")
+        self._supervisor = WorkerSupervisor(workers=self.workers, template_paths=(self.template_path,)).start()
+        return self
+
+    def close(self):
+        if self._supervisor is not None:
+            self._supervisor.close()
+            self._supervisor = None
+        if self.output_dir is not None:
+            get_scratch().release(self.output_dir)
+            self.output_dir = None
+
+    def run(self, kind, payload):
+        if kind == "text":
+            pending = self._supervisor.submit_text(payload, self.template_path, output_dir=self.output_dir)
+        else:
+            data, name = payload
+            pending = self._supervisor.submit_document(data, self.template_path, output_dir=self.output_dir,
+                                                       source_name=name)
+        result = pending.get()
+        if not result.ok:
+            return result.error.kind
+        os.unlink(result.output_path)
+        return None
+
+
+class HttpTarget:
+    """Sends jobs to a server started with `python loadtest.py --serve PORT`, possibly on another machine."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.name = self.url
+
+    def start(self):
+        # Fail fast if nothing is listening
+        self.server_rss()
+        return self
+
+    def close(self):
+        pass
+
+    def server_rss(self):
+        with urllib.request.urlopen(f"{self.url}/health", timeout=HTTP_TIMEOUT) as response:
+            return json.load(response).get("rss")
+
+    def run(self, kind, payload):
+        if kind == "text":
+            request = urllib.request.Request(f"{self.url}/text", data=payload.encode("utf-8"), method="POST")
+        else:
+            data, name = payload
+            query = urllib.parse.urlencode({"name": name})
+            request = urllib.request.Request(f"{self.url}/document?{query}", data=data, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+                outcome = json.load(response)
+        except (OSError, ValueError):
+            return "transport"
+        return None if outcome.get("ok") else outcome.get("kind", "internal")
+
+
+def serve(port, template_path=DEFAULT_TEMPLATE, host="127.0.0.1"):
+    """
+    Serve the generation functions over HTTP for load tests against a separate process.
+
+    Each request runs on its own thread, like a Streamlit session. POST /text takes
+    the text as the body; POST /document?name=file.pdf takes the file as the body;
+    both answer with JSON {"ok", "kind", "error", "bytes"}. GET /health reports the
+    server's pid and RSS (including its worker processes).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    target = InProcessTarget(template_path).start()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply({"pid": os.getpid(), "rss": tree_rss()})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if url.path not in ("/text", "/document"):
+                self.send_error(404)
+                return
+            control = JobControl(progress=describe_progress, timeout=default_timeout())
+            try:
+                reserve = estimate_job_bytes(target.template_path, len(body))
+                with get_scratch().job_dir(url.path.lstrip("/"), reserve) as job_dir:
+                    if url.path == "/text":
+                        result = generate_from_text(body.decode("utf-8"), target.template_path,
+                                                    output_dir=job_dir, control=control)
+                    else:
+                        name = urllib.parse.parse_qs(url.query).get("name", ["upload.docx"])[0]
+                        result = generate_from_document(memoryview(body), target.template_path,
+                                                        output_dir=job_dir, source_name=name, control=control)
+                    size = os.path.getsize(result.output_path) if result.ok else None
+            except ScratchQuotaExceeded as exc:
+                self._reply({"ok": False, "kind": "scratch_full", "error": str(exc), "bytes": None})
+                return
+            self._reply({"ok": result.ok, "kind": result.error.kind if result.error else None,
+                         "error": str(result.error) if result.error else None, "bytes": size})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    print(f"Serving generation on http://{host}:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        target.close()
+
+
+def run_load_test(target, payloads, mix, sessions=8, duration=None, jobs_per_session=None, think_time=0.0,
+                  sample_interval=DEFAULT_SAMPLE_INTERVAL, seed=None):
+    """
+    Drive concurrent simulated sessions against a target and measure the results.
+
+    Each session repeatedly waits a random think time (exponentially distributed
+    around `think_time`), picks a job kind at random according to the mix, sends it
+    and waits for the result. Server RSS is sampled in the background throughout.
+
+    Args:
+        target: A started InProcessTarget, PoolTarget or HttpTarget
+        payloads (dict): Inputs per job kind, from load_payloads
+        mix (dict): Relative weight per job kind, from parse_mix
+        sessions (int): Number of concurrent sessions
+        duration (float): Stop sending new jobs after this many seconds
+        jobs_per_session (int): Stop each session after this many jobs (default 5 if no duration)
+        think_time (float): Mean pause between a session's jobs, in seconds
+        sample_interval (float): Seconds between RSS samples
+        seed (int): Seed for reproducible job sequences
+
+    Returns:
+        LoadReport: Per-job samples, RSS over time and the derived statistics
+    """
+    if duration is None and jobs_per_session is None:
+        jobs_per_session = 5
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    samples = []
+    samples_lock = threading.Lock()
+    rss = []
+    finished = threading.Event()
+    start = threading.Event()
+    started = None
+
+    def sample_rss():
+        while True:
+            try:
+                value = target.server_rss()
+            except Exception:
+                value = None
+            rss.append((time.perf_counter() - started, value))
+            if finished.wait(sample_interval):
+                return
+
+    def session(index):
+        rng = random.Random(None if seed is None else seed + index)
+        start.wait()
+        sent = 0
+        while jobs_per_session is None or sent < jobs_per_session:
+            if think_time > 0:
+                time.sleep(rng.expovariate(1 / think_time))
+            now = time.perf_counter() - started
+            if duration is not None and now >= duration:
+                return
+            kind = rng.choices(kinds, weights)[0]
+            job_started = time.perf_counter()
+            try:
+                error = target.run(kind, payloads[kind])
+            except Exception as e:
+                error = type(e).__name__
+            sample = JobSample(index, kind, job_started - started, time.perf_counter() - job_started, error)
+            with samples_lock:
+                samples.append(sample)
+            sent += 1
+
+    threads = [threading.Thread(target=session, args=(index,), name=f"load-session-{index}", daemon=True)
+               for index in range(sessions)]
+    for thread in threads:
+        thread.start()
+    sampler = threading.Thread(target=sample_rss, name="load-rss", daemon=True)
+    started = time.perf_counter()
+    sampler.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - started
+    finished.set()
+    sampler.join()
+    return LoadReport(target.name, sessions, samples, rss, wall_time)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load-test document generation with concurrent simulated sessions")
+    parser.add_argument("--target", default="inprocess",
+                        help="'inprocess' (threads, like Streamlit sessions), 'pool' (worker processes) "
+                             "or the URL of a --serve instance, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="run the HTTP generation server instead")
+    parser.add_argument("--host", default="127.0.0.1", help="address for --serve")
+    parser.add_argument("-s", "--sessions", type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument("-d", "--duration", type=float, help="seconds to keep sending jobs")
+    parser.add_argument("-n", "--jobs", type=int, help="jobs per session (default 5 without --duration)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"relative job weights (default {DEFAULT_MIX})")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a session's jobs, in seconds")
+    parser.add_argument("--text", help="text file to use for text jobs (default: generated)")
+    parser.add_argument("--docx", default=DEFAULT_DOCX, help="Word document for docx jobs")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="PDF for pdf jobs")
+    parser.add_argument("-t", "--template", default=DEFAULT_TEMPLATE, help="template document")
+    parser.add_argument("-w", "--workers", type=int, help="worker processes for --target pool")
+    parser.add_argument("--interval", type=float, default=DEFAULT_SAMPLE_INTERVAL, help="RSS sampling interval")
+    parser.add_argument("--seed", type=int, help="seed for reproducible job sequences")
+    parser.add_argument("--json", help="also write the full report, with every sample, to this file")
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args.serve, args.template, args.host)
+        sys.exit(0)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    text = None
+    if args.text:
+        with open(args.text, encoding="utf-8") as file:
+            text = file.read()
+    payloads = load_payloads(mix, text, args.docx, args.pdf)
+
+    if args.target == "inprocess":
+        target = InProcessTarget(args.template)
+    elif args.target == "pool":
+        target = PoolTarget(args.template, args.workers)
+    elif args.target.startswith(("http://", "https://")):
+        target = HttpTarget(args.target)
+    else:
+        parser.error(f"Unknown target {args.target!r}")
+
+    target.start()
+    try:
+        report = run_load_test(target, payloads, mix, args.sessions, args.duration, args.jobs, args.think,
+                               args.interval, args.seed)
+    finally:
+        target.close()
+    print(report.summary())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report.as_dict(), file, indent=2)
+    sys.exit(1 if report.error_rate() else 0)
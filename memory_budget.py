@@ -0,0 +1,209 @@
+import os
+import zipfile
+
+import PyPDF2
+
+from source_io import is_buffer_source, open_source, pdf_page_count
+from docx_stream import main_document_part
+from import_range import resolve_page_range
+
+# Rough memory costs, measured as process RSS growth while building documents.
+# The generated document dominates: python-docx holds every paragraph and run as
+# lxml nodes, about 24 bytes per character of text (and ~15 bytes per byte of a
+# Word source's document.xml, whose markup is mostly carried over).
+OUTPUT_BYTES_PER_CHAR = 24
+DOCX_OUTPUT_BYTES_PER_XML_BYTE = 15
+TEMPLATE_BYTES_PER_FILE_BYTE = 2
+# Extracted PDF text is bounded by the (decompressed) content streams, and by a dense page
+PDF_TEXT_PER_FILE_BYTE = 3
+PDF_MAX_TEXT_PER_PAGE = 12 * 1024
+# Zip folders holding the media a Word source can carry over
+MEDIA_DIRECTORIES = ("word/media/", "word/embeddings/")
+# Parsed cross-reference table, trailer and page objects
+PDF_READER_BYTES_PER_FILE_BYTE = 1
+# Copies of the extracted text held at once by the in-memory path: per-page text,
+# the joined text and its paragraph list (up to 4 bytes per character for non-Latin text)
+IN_MEMORY_TEXT_COPIES = 3 * 2
+
+
+class MemoryBudgetExceeded(ValueError):
+    """
+    Raised before a job starts when it would not fit in the per-job memory budget.
+
+    Attributes:
+        estimate (MemoryEstimate): The pre-flight estimate
+        budget (int): The budget in bytes
+    """
+
+    def __init__(self, estimate, budget):
+        super().__init__(
+            f"This document needs an estimated {_megabytes(estimate.streaming)} to import, more than "
+            f"the {_megabytes(budget)} allowed per job. Import a smaller page or paragraph range, "
+            f"or split the document."
+        )
+        self.estimate = estimate
+        self.budget = budget
+
+
+class MemoryEstimate:
+    """
+    Pre-flight estimate of a job's peak memory, worked out without parsing the source.
+
+    Attributes:
+        in_memory (int): Peak bytes when the whole extracted text is held at once
+        streaming (int): Peak bytes when the source is streamed piece by piece
+    """
+
+    __slots__ = ("in_memory", "streaming")
+
+    def __init__(self, in_memory, streaming):
+        self.in_memory = int(in_memory)
+        self.streaming = int(streaming)
+
+    def __repr__(self):
+        return f"MemoryEstimate(in_memory={_megabytes(self.in_memory)}, streaming={_megabytes(self.streaming)})"
+
+
+def _megabytes(size):
+    megabytes = size / (1024 * 1024)
+    return f"{megabytes:.1f} MB" if megabytes < 10 else f"{megabytes:.0f} MB"
+
+
+def job_memory_budget():
+    """
+    Per-job memory budget from CYBERGEN_JOB_MEMORY_MB. There is no budget unless it is
+    set; "off" or 0 disables it too.
+
+    Returns:
+        int: Budget in bytes, or None if unlimited
+    """
+    value = os.environ.get("CYBERGEN_JOB_MEMORY_MB", "").strip().lower()
+    if not value or value in ("off", "none", "false", "no"):
+        return None
+    try:
+        megabytes = float(value)
+    except ValueError:
+        return None
+    return int(megabytes * 1024 * 1024) if megabytes > 0 else None
+
+
+def _source_size(source_file):
+    if is_buffer_source(source_file):
+        return memoryview(source_file).nbytes
+    return os.path.getsize(source_file)
+
+
+def template_memory(template_path):
+    """Estimated bytes taken by a loaded template (0 if it cannot be read)."""
+    try:
+        return os.path.getsize(template_path) * TEMPLATE_BYTES_PER_FILE_BYTE
+    except OSError:
+        return 0
+
+
+def estimate_source_memory(source_file, file_ext, template_path=None, pages=None):
+    """
+    Estimate the memory needed to import a Word or PDF source.
+
+    Only the file size, the PDF page count (from the trailer) and the zip
+    directory of a Word file are read. An upload buffer counts in full, since it
+    is resident for the whole job.
+
+    Args:
+        source_file: Path to the source document, or an in-memory buffer of it
+        file_ext (str): The source's extension ('.pdf', '.docx' or '.doc')
+        template_path (str): Path to the template document
+        pages: PDF pages to import, as accepted by copy_document_to_template
+
+    Returns:
+        MemoryEstimate: Estimated peak memory of both ingestion paths
+    """
+    size = _source_size(source_file)
+    base = template_memory(template_path) if template_path else 0
+    if is_buffer_source(source_file):
+        base += size
+
+    if file_ext == '.pdf':
+        try:
+            with open_source(source_file) as stream:
+                page_count = pdf_page_count(PyPDF2.PdfReader(stream))
+            selected = resolve_page_range(pages, page_count)
+            selected_count = page_count if selected is None else len(selected)
+            fraction = selected_count / page_count if page_count else 1.0
+        except Exception:
+            # Let the import itself report unreadable PDFs
+            selected_count, fraction = None, 1.0
+        text = size * PDF_TEXT_PER_FILE_BYTE * fraction
+        if selected_count is not None:
+            text = min(text, selected_count * PDF_MAX_TEXT_PER_PAGE)
+        base += size * PDF_READER_BYTES_PER_FILE_BYTE + text * OUTPUT_BYTES_PER_CHAR
+        return MemoryEstimate(base + text * IN_MEMORY_TEXT_COPIES, base)
+
+    # Word sources are always streamed; the generated document is what takes memory,
+    # including the images and embedded objects it carries over as raw bytes
+    try:
+        with open_source(source_file) as stream, zipfile.ZipFile(stream) as package:
+            xml_size = package.getinfo(main_document_part(package)).file_size
+            media_size = sum(info.file_size for info in package.infolist()
+                             if info.filename.startswith(MEDIA_DIRECTORIES))
+    except Exception:
+        xml_size, media_size = size, 0
+    base += xml_size * DOCX_OUTPUT_BYTES_PER_XML_BYTE + media_size
+    return MemoryEstimate(base, base)
+
+
+def estimate_text_memory(input_text, template_path=None):
+    """
+    Estimate the memory needed to format pasted text.
+
+    Args:
+        input_text (str): The text content to be inserted
+        template_path (str): Path to the template document
+
+    Returns:
+        MemoryEstimate: Estimated peak memory
+    """
+    base = template_memory(template_path) if template_path else 0
+    base += len(input_text) * OUTPUT_BYTES_PER_CHAR
+    return MemoryEstimate(base, base)
+
+
+def plan_ingestion(estimate, budget=None):
+    """
+    Choose how to ingest a source given its estimate and the memory budget.
+
+    Args:
+        estimate (MemoryEstimate): The job's pre-flight estimate
+        budget (int): Budget in bytes; None reads CYBERGEN_JOB_MEMORY_MB, 0 means unlimited
+
+    Returns:
+        bool: True if the source must be streamed, False if it fits in memory
+
+    Raises:
+        MemoryBudgetExceeded: If even the streaming path would not fit
+    """
+    if budget is None:
+        budget = job_memory_budget()
+    if not budget or estimate.in_memory <= budget:
+        return False
+    if estimate.streaming <= budget:
+        return True
+    raise MemoryBudgetExceeded(estimate, budget)
+
+
+def plan_part_ingestion(estimate, built, budget=None):
+    """
+    Choose how to ingest one part of a merged document, on top of the output built so far.
+
+    Args:
+        estimate (MemoryEstimate): The part's estimate, without the template
+        built (int): Bytes already taken by the template and the parts before it
+        budget (int): Budget in bytes; None reads CYBERGEN_JOB_MEMORY_MB, 0 means unlimited
+
+    Returns:
+        bool: True if the part must be streamed, False if it fits in memory
+
+    Raises:
+        MemoryBudgetExceeded: If even streaming the part would not fit
+    """
+    return plan_ingestion(MemoryEstimate(built + estimate.in_memory, built + estimate.streaming), budget)
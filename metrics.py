@@ -0,0 +1,543 @@
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Generation latency buckets, in seconds
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Upper bounds (bytes) and labels of the input size buckets latency is broken down by
+SIZE_BUCKETS = (
+    (100 * 1024, "<100KB"),
+    (1024 * 1024, "100KB-1MB"),
+    (10 * 1024 * 1024, "1-10MB"),
+)
+LARGEST_SIZE_BUCKET = ">10MB"
+DEFAULT_EXPORT_INTERVAL = 15.0
+
+
+def size_bucket(size):
+    """
+    Label of the size bucket an input falls in.
+
+    Args:
+        size (int): Input size in bytes, or None if unknown
+
+    Returns:
+        str: e.g. "100KB-1MB", or "unknown"
+    """
+    if size is None:
+        return "unknown"
+    for limit, label in SIZE_BUCKETS:
+        if size < limit:
+            return label
+    return LARGEST_SIZE_BUCKET
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    """
+    A named metric with a fixed set of label names, holding one value per label combination.
+
+    Attributes:
+        name (str): Metric name, e.g. "cybergen_generation_jobs_total"
+        help (str): One-line description
+        label_names (tuple): Names of the labels every sample carries
+    """
+
+    type = "untyped"
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        """
+        Returns:
+            list: (suffix, labels as (name, value) pairs, value) for every sample
+        """
+        with self._lock:
+            items = list(self._values.items())
+        return [("", tuple(zip(self.label_names, key)), value) for key, value in sorted(items)]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    """A value that only goes up, such as the number of jobs run."""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """A value that goes up and down, such as the number of running jobs."""
+
+    type = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Observations counted into buckets, such as job latencies."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self, **labels):
+        """
+        Returns:
+            tuple: (per-bucket counts, not cumulative, in bucket order; sum; count)
+        """
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            if entry is None:
+                return [0] * len(self.buckets), 0.0, 0
+            return list(entry[0]), entry[1], entry[2]
+
+    def label_sets(self):
+        """Label combinations observed so far, as dicts."""
+        with self._lock:
+            keys = sorted(self._values)
+        return [dict(zip(self.label_names, key)) for key in keys]
+
+    def quantile(self, q, **labels):
+        """
+        Estimate a quantile by linear interpolation within its bucket, as Prometheus'
+        histogram_quantile does.
+
+        Returns:
+            float: The estimate, or None if nothing was observed
+        """
+        counts, _, total = self.snapshot(**labels)
+        if not total:
+            return None
+        rank = q * total
+        seen, lower = 0, 0.0
+        for bound, count in zip(self.buckets, counts):
+            if count and seen + count >= rank:
+                if bound == math.inf:
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            if bound != math.inf:
+                lower = bound
+        return lower
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in sorted(self._values.items())]
+        samples = []
+        for key, counts, total, count in items:
+            labels = tuple(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", labels + (("le", _format_value(float(bound))),), cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    In-process registry of metrics, read by the admin page and the Prometheus exporters.
+
+    Metrics are created once with counter(), gauge() or histogram() (asking again
+    for the same name returns the existing metric). Values that already live
+    elsewhere, such as cache counters, are read when the registry is collected
+    by collectors: callables returning metrics built on the spot.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, label_names, **options):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, label_names, **options)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, help, label_names=()):
+        return self._get_or_create(Counter, name, help, label_names)
+
+    def gauge(self, name, help, label_names=()):
+        return self._get_or_create(Gauge, name, help, label_names)
+
+    def histogram(self, name, help, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, help, label_names, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def register_collector(self, collector):
+        """
+        Add a callable returning a list of Metric objects, called on every collection.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def unregister_collector(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def collect(self):
+        """
+        Returns:
+            list: Every registered metric, then the metrics produced by the collectors
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                metrics.extend(collector())
+            except Exception:
+                # A broken source of metrics must not take the exporters down
+                continue
+        return metrics
+
+    def to_prometheus(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text
+        """
+        lines = []
+        for metric in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """Reset every metric (collectors are kept)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+_default_registry = MetricsRegistry()
+
+
+def get_registry():
+    """Return the process-wide metrics registry."""
+    return _default_registry
+
+
+GENERATION_SECONDS = _default_registry.histogram(
+    "cybergen_generation_seconds", "Time to generate a document, by source type and input size",
+    ("source_type", "size"))
+GENERATION_JOBS = _default_registry.counter(
+    "cybergen_generation_jobs_total", "Generation jobs finished, by source type and outcome",
+    ("source_type", "outcome"))
+JOBS_ACTIVE = _default_registry.gauge("cybergen_jobs_active", "Generation jobs running in this process")
+
+
+def record_job(source_type, size, seconds, error_kind=None):
+    """
+    Record a finished generation job.
+
+    Args:
+        source_type (str): 'text', 'pdf', 'docx', 'merge'...
+        size (int): Input size in bytes, or None if unknown
+        seconds (float): Time the job took
+        error_kind (str): GenerationError kind if the job failed, else None
+    """
+    GENERATION_SECONDS.observe(seconds, source_type=source_type, size=size_bucket(size))
+    GENERATION_JOBS.inc(source_type=source_type, outcome=error_kind or "ok")
+
+
+@contextmanager
+def active_job():
+    """Count a job as active for the duration of the block."""
+    JOBS_ACTIVE.inc()
+    try:
+        yield
+    finally:
+        JOBS_ACTIVE.dec()
+
+
+def _children(pid):
+    children = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return children
+    for task in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as file:
+                children.extend(int(child) for child in file.read().split())
+        except OSError:
+            continue
+    return children
+
+
+def process_rss(pid=None):
+    """
+    Resident set size of a process, in bytes.
+
+    Read from /proc where available; elsewhere only the current process can be
+    measured, and only its peak RSS.
+
+    Args:
+        pid (int): Process id (default: this process)
+
+    Returns:
+        int: RSS in bytes, or None if it cannot be read
+    """
+    pid = pid or os.getpid()
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if pid != os.getpid():
+        return None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def tree_rss(pid=None):
+    """
+    RSS of a process and all its descendants (worker pools, PDF extraction workers), in bytes.
+
+    Pages shared copy-on-write between a parent and its forked workers are counted
+    once per process, so this overstates the memory actually in use.
+
+    Returns:
+        int: RSS in bytes, or None if it cannot be read
+    """
+    pid = pid or os.getpid()
+    total = process_rss(pid)
+    if total is None:
+        return None
+    pending = _children(pid)
+    while pending:
+        child = pending.pop()
+        total += process_rss(child) or 0
+        pending.extend(_children(child))
+    return total
+
+
+def _cache_metrics(prefix, description, stats):
+    hits = Counter(f"{prefix}_hits_total", f"{description}: lookups served from the cache")
+    hits.inc(stats["hits"])
+    misses = Counter(f"{prefix}_misses_total", f"{description}: lookups that had to load or extract")
+    misses.inc(stats["misses"])
+    hit_rate = Gauge(f"{prefix}_hit_rate", f"{description}: share of lookups served from the cache")
+    hit_rate.set(stats["hit_rate"])
+    return [hits, misses, hit_rate]
+
+
+def _collect_process():
+    rss = Gauge("cybergen_process_resident_bytes", "Resident memory of this process")
+    rss.set(process_rss() or 0)
+    total = Gauge("cybergen_process_tree_resident_bytes", "Resident memory of this process and its workers")
+    total.set(tree_rss() or 0)
+    return [rss, total]
+
+
+def _collect_caches():
+    from template_cache import get_template_cache
+    from pdf_page_cache import get_default_page_cache
+
+    metrics = _cache_metrics("cybergen_template_cache", "Parsed template cache", get_template_cache().stats())
+    page_cache = get_default_page_cache()
+    if page_cache is not None:
+        metrics.extend(_cache_metrics("cybergen_pdf_page_cache", "PDF page text cache", page_cache.stats()))
+    return metrics
+
+
+_default_registry.register_collector(_collect_process)
+_default_registry.register_collector(_collect_caches)
+
+
+def write_prometheus_file(path, registry=None):
+    """
+    Write the metrics in Prometheus text format, e.g. for node_exporter's textfile collector.
+
+    The file is replaced atomically, so a scraper never reads half of it.
+
+    Args:
+        path (str): Output file, conventionally ending in .prom
+        registry (MetricsRegistry): Registry to export (default: the process-wide one)
+    """
+    text = (registry or _default_registry).to_prometheus()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=None):
+    """
+    Serve the metrics at http://host:port/metrics from a background thread.
+
+    Only one server per port is started per process, so calling this on every
+    Streamlit rerun is safe.
+
+    Returns:
+        The running http.server instance
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = registry or _default_registry
+    with _exporters_lock:
+        server = _exporters.get(("http", port))
+        if server is not None:
+            return server
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="cybergen-metrics-http", daemon=True).start()
+        _exporters[("http", port)] = server
+        return server
+
+
+def start_metrics_file_writer(path, interval=DEFAULT_EXPORT_INTERVAL, registry=None):
+    """
+    Rewrite a Prometheus text file every `interval` seconds from a background thread.
+
+    Only one writer per path is started per process.
+    """
+    with _exporters_lock:
+        if ("file", path) in _exporters:
+            return
+
+        def write_forever():
+            while True:
+                try:
+                    write_prometheus_file(path, registry)
+                except OSError:
+                    pass
+                time.sleep(interval)
+
+        thread = threading.Thread(target=write_forever, name="cybergen-metrics-file", daemon=True)
+        thread.start()
+        _exporters[("file", path)] = thread
+
+
+def start_exporters_from_environment():
+    """
+    Start the exporters configured in the environment.
+
+    CYBERGEN_METRICS_PORT serves /metrics on that port (CYBERGEN_METRICS_HOST, default
+    127.0.0.1, sets the address); CYBERGEN_METRICS_FILE is rewritten every
+    CYBERGEN_METRICS_INTERVAL seconds (default 15).
+    """
+    port = os.environ.get("CYBERGEN_METRICS_PORT", "").strip()
+    if port:
+        start_metrics_server(int(port), os.environ.get("CYBERGEN_METRICS_HOST", "127.0.0.1"))
+    path = os.environ.get("CYBERGEN_METRICS_FILE", "").strip()
+    if path:
+        interval = float(os.environ.get("CYBERGEN_METRICS_INTERVAL", DEFAULT_EXPORT_INTERVAL))
+        start_metrics_file_writer(path, interval)
+
+
+def admin_page_enabled():
+    """Whether the metrics page is shown in the Streamlit app (CYBERGEN_ADMIN_PAGE=on)."""
+    return os.environ.get("CYBERGEN_ADMIN_PAGE", "").strip().lower() in ("1", "on", "true", "yes")
+
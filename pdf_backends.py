@@ -0,0 +1,455 @@
+import abc
+import importlib
+import io
+import json
+import math
+import os
+import threading
+import time
+
+import PyPDF2
+
+from source_io import open_source, pdf_page_count, select_pdf_pages
+from import_range import resolve_page_range
+from pdf_page_cache import DEFAULT_CACHE_DIR, extract_page_text
+
+DEFAULT_BACKEND = "pypdf2"
+# Pages timed per backend when choosing one for a file: the first, middle and last
+BENCHMARK_SAMPLE_PAGES = 3
+# A backend must find at least this share of the text the most thorough backend
+# finds, so a fast backend that misses text never wins
+MIN_TEXT_SHARE = 0.8
+
+
+class ExtractionBackend(abc.ABC):
+    """
+    A PDF text-extraction library behind a common interface.
+
+    Subclasses implement iter_pages, or derive from DocumentBackend and implement
+    open, page_count and page_text; a subclass missing one of them cannot be
+    instantiated. The library is imported only when the backend is first used;
+    `modules` lists the module names to try, and a backend whose library is
+    missing is unavailable.
+    """
+
+    name = None
+    modules = ()
+
+    def __init__(self):
+        self._library = None
+        self._checked = False
+
+    @property
+    def library(self):
+        """The imported library module, or None if it is not installed."""
+        if not self._checked:
+            for module in self.modules:
+                try:
+                    self._library = importlib.import_module(module)
+                    break
+                except ImportError:
+                    continue
+            self._checked = True
+        return self._library
+
+    def available(self):
+        return not self.modules or self.library is not None
+
+    @abc.abstractmethod
+    def iter_pages(self, stream, pages=None, known=(), page_cache=None):
+        """
+        Select the pages to import and extract the ones still needed, lazily.
+
+        Args:
+            stream: Seekable binary stream over the PDF, open for as long as the pages are read
+            pages: Pages to import, as a range like "12-40" or 1-based page numbers; None for all
+            known: Zero-based numbers of pages whose text is already available
+            page_cache: PageTextCache for backends that support it (PyPDF2 only), or None
+
+        Returns:
+            tuple: (selected zero-based page numbers, generator of the text of the selected
+                pages not in `known`, in order). Close the generator before the stream.
+        """
+
+
+class DocumentBackend(ExtractionBackend):
+    """
+    A backend for a library that opens a document and reads its pages one at a time.
+
+    Subclasses implement open, page_count, page_text and (if needed) close.
+    """
+
+    @abc.abstractmethod
+    def open(self, stream):
+        """Open a document from a seekable binary stream (see source_io.open_source)."""
+
+    @abc.abstractmethod
+    def page_count(self, document):
+        """Number of pages in an open document."""
+
+    @abc.abstractmethod
+    def page_text(self, document, page_num):
+        """Text of a zero-based page."""
+
+    def close(self, document):
+        pass
+
+    def iter_pages(self, stream, pages=None, known=(), page_cache=None):
+        document = self.open(stream)
+        try:
+            page_numbers = resolve_page_range(pages, self.page_count(document))
+            if page_numbers is None:
+                page_numbers = range(self.page_count(document))
+        except BaseException:
+            self.close(document)
+            raise
+
+        missing = [page_num for page_num in page_numbers if page_num not in known]
+
+        def texts():
+            try:
+                for page_num in missing:
+                    yield self.page_text(document, page_num)
+            finally:
+                self.close(document)
+
+        return page_numbers, texts()
+
+
+class PyPDF2Backend(ExtractionBackend):
+    """PyPDF2, always installed: pages are resolved lazily and their text is cached."""
+
+    name = "pypdf2"
+
+    def iter_pages(self, stream, pages=None, known=(), page_cache=None):
+        page_numbers, resolved = select_pdf_pages(PyPDF2.PdfReader(stream), pages, known)
+        return page_numbers, (extract_page_text(page, page_cache) for _, page in resolved)
+
+
+class PyMuPDFBackend(DocumentBackend):
+    """PyMuPDF (MuPDF bindings), usually the fastest."""
+
+    name = "pymupdf"
+    modules = ("pymupdf", "fitz")
+
+    def open(self, stream):
+        data = stream.getbuffer() if hasattr(stream, "getbuffer") else stream.read()
+        return self.library.open(stream=data, filetype="pdf")
+
+    def page_count(self, document):
+        return document.page_count
+
+    def page_text(self, document, page_num):
+        return document.load_page(page_num).get_text()
+
+    def close(self, document):
+        document.close()
+
+
+class PypdfBackend(DocumentBackend):
+    """pypdf, PyPDF2's maintained successor."""
+
+    name = "pypdf"
+    modules = ("pypdf",)
+
+    def open(self, stream):
+        return self.library.PdfReader(stream)
+
+    def page_count(self, document):
+        return len(document.pages)
+
+    def page_text(self, document, page_num):
+        return document.pages[page_num].extract_text()
+
+
+class PdfminerBackend(ExtractionBackend):
+    """pdfminer.six: slow, but lays out multi-column text well."""
+
+    name = "pdfminer"
+    modules = ("pdfminer",)
+
+    def iter_pages(self, stream, pages=None, known=(), page_cache=None):
+        from pdfminer.converter import TextConverter
+        from pdfminer.layout import LAParams
+        from pdfminer.pdfdocument import PDFDocument
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+        from pdfminer.pdfparser import PDFParser
+        from pdfminer.pdftypes import resolve1
+
+        document = PDFDocument(PDFParser(stream))
+        page_count = int(resolve1(resolve1(document.catalog["Pages"])["Count"]))
+        page_numbers = resolve_page_range(pages, page_count)
+        if page_numbers is None:
+            page_numbers = range(page_count)
+        wanted = [page_num for page_num in page_numbers if page_num not in known]
+
+        def texts():
+            # Selections are in document order, the order pdfminer walks the page tree in
+            resources = PDFResourceManager()
+            remaining = iter(wanted)
+            target = next(remaining, None)
+            for index, page in enumerate(PDFPage.create_pages(document)):
+                if target is None:
+                    break
+                if index != target:
+                    continue
+                output = io.StringIO()
+                device = TextConverter(resources, output, laparams=LAParams())
+                try:
+                    PDFPageInterpreter(resources, device).process_page(page)
+                finally:
+                    device.close()
+                yield output.getvalue()
+                target = next(remaining, None)
+
+        return page_numbers, texts()
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+# File profile -> name of the fastest backend measured for it
+_winners = {}
+_winners_loaded = False
+
+
+def register_backend(backend):
+    """
+    Add an extraction backend to the registry (replacing one with the same name).
+
+    Args:
+        backend (ExtractionBackend): The backend instance
+
+    Raises:
+        TypeError: If the backend is not an ExtractionBackend or has no name
+    """
+    if not isinstance(backend, ExtractionBackend):
+        raise TypeError(f"{type(backend).__name__} is not an ExtractionBackend")
+    if not backend.name:
+        raise TypeError(f"{type(backend).__name__} has no name")
+    with _backends_lock:
+        _backends[backend.name] = backend
+        _winners.clear()
+
+
+def get_backend(name):
+    """
+    Args:
+        name (str): A registered backend's name
+
+    Returns:
+        ExtractionBackend: The backend, or None if no such backend is registered
+    """
+    return _backends.get(name)
+
+
+def available_backends():
+    """
+    Returns:
+        list: The registered backends whose library is installed, PyPDF2 first
+    """
+    return [backend for backend in _backends.values() if backend.available()]
+
+
+for _backend in (PyPDF2Backend(), PyMuPDFBackend(), PypdfBackend(), PdfminerBackend()):
+    register_backend(_backend)
+
+
+def file_profile(source_file):
+    """
+    Classify a PDF by what drives extraction speed: the software that produced it
+    and how much content each page carries.
+
+    Args:
+        source_file: Path to the PDF file, or an in-memory buffer of it
+
+    Returns:
+        str: A profile such as "microsoft|2^16" (producer, bytes per page rounded to a power of two)
+    """
+    with open_source(source_file) as stream:
+        size = stream.seek(0, io.SEEK_END)
+        reader = PyPDF2.PdfReader(stream)
+        page_count = max(pdf_page_count(reader), 1)
+        try:
+            info = reader.trailer.get("/Info")
+            producer = str(info.get_object().get("/Producer", "")) if info is not None else ""
+        except Exception:
+            producer = ""
+    words = "".join(char if char.isalnum() else " " for char in producer.lower()).split()
+    family = next((word for word in words if word.isalpha()), "unknown")
+    return f"{family}|2^{int(math.log2(max(size / page_count, 1)))}"
+
+
+class BenchmarkResult:
+    """
+    One backend's timing on a sample of a file's pages.
+
+    Attributes:
+        backend (str): Backend name
+        seconds (float): Time to open the file and extract the sample, or None if it failed
+        characters (int): Characters of text extracted
+        error (str): Why the backend failed, or None
+    """
+
+    __slots__ = ("backend", "seconds", "characters", "error")
+
+    def __init__(self, backend, seconds=None, characters=0, error=None):
+        self.backend = backend
+        self.seconds = seconds
+        self.characters = characters
+        self.error = error
+
+    def __repr__(self):
+        if self.error:
+            return f"BenchmarkResult({self.backend}, error={self.error!r})"
+        return f"BenchmarkResult({self.backend}, {self.seconds * 1000:.1f} ms, {self.characters} chars)"
+
+
+def _sample_pages(source_file, sample_pages):
+    with open_source(source_file) as stream:
+        page_count = pdf_page_count(PyPDF2.PdfReader(stream))
+    if page_count <= sample_pages:
+        return list(range(1, page_count + 1))
+    step = (page_count - 1) / (sample_pages - 1) if sample_pages > 1 else 0
+    return sorted({1 + round(index * step) for index in range(sample_pages)})
+
+
+def benchmark_backends(source_file, backends=None, sample_pages=BENCHMARK_SAMPLE_PAGES):
+    """
+    Time each backend extracting a sample of pages from a file, uncached.
+
+    Args:
+        source_file: Path to the PDF file, or an in-memory buffer of it
+        backends: Backends to compare (default: every available backend)
+        sample_pages (int): Pages to extract, spread across the document
+
+    Returns:
+        list: BenchmarkResult per backend, fastest first (failed backends last)
+    """
+    if backends is None:
+        backends = available_backends()
+    sample = _sample_pages(source_file, sample_pages)
+    results = []
+    for backend in backends:
+        try:
+            with open_source(source_file) as stream:
+                started = time.perf_counter()
+                _, texts = backend.iter_pages(stream, sample)
+                try:
+                    characters = sum(len(text or "") for text in texts)
+                finally:
+                    texts.close()
+                results.append(BenchmarkResult(backend.name, time.perf_counter() - started, characters))
+        except Exception as e:
+            results.append(BenchmarkResult(backend.name, error=f"{type(e).__name__}: {e}"))
+    results.sort(key=lambda result: (result.seconds is None, result.seconds or 0.0))
+    return results
+
+
+def _pick_winner(results):
+    measured = [result for result in results if result.seconds is not None]
+    if not measured:
+        return DEFAULT_BACKEND
+    most_text = max(result.characters for result in measured)
+    for result in measured:
+        if result.characters >= most_text * MIN_TEXT_SHARE:
+            return result.backend
+    return DEFAULT_BACKEND
+
+
+def _winners_path():
+    cache_dir = os.environ.get("CYBERGEN_PDF_CACHE_DIR", DEFAULT_CACHE_DIR)
+    return os.path.join(cache_dir, "pdf_backends.json")
+
+
+def _load_winners():
+    global _winners_loaded
+    if _winners_loaded:
+        return
+    _winners_loaded = True
+    try:
+        with open(_winners_path(), encoding="utf-8") as file:
+            saved = json.load(file)
+    except (OSError, ValueError):
+        return
+    installed = sorted(backend.name for backend in available_backends())
+    # Measurements only hold for the set of libraries they were taken with
+    if saved.get("backends") == installed:
+        for profile, name in saved.get("winners", {}).items():
+            _winners.setdefault(profile, name)
+
+
+def _save_winners():
+    path = _winners_path()
+    data = {"backends": sorted(backend.name for backend in available_backends()), "winners": dict(_winners)}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+
+
+def choose_backend(source_file, backend=None):
+    """
+    Pick the extraction backend for a file.
+
+    CYBERGEN_PDF_BACKEND (or `backend`) names a backend to always use, or is "auto"
+    (the default): with more than one library installed, the available backends are
+    benchmarked on a few pages the first time a file profile is seen, and the fastest
+    one that finds all the text wins for every file of that profile. Winners are kept
+    in pdf_backends.json next to the page cache. With only PyPDF2 installed, or if
+    anything goes wrong, PyPDF2 is used.
+
+    Args:
+        source_file: Path to the PDF file, or an in-memory buffer of it
+        backend (str): Backend name, "auto", or None to read CYBERGEN_PDF_BACKEND
+
+    Returns:
+        ExtractionBackend: The backend to extract the file with
+    """
+    fallback = _backends[DEFAULT_BACKEND]
+    name = (backend or os.environ.get("CYBERGEN_PDF_BACKEND", "") or "auto").strip().lower()
+    if name != "auto":
+        chosen = get_backend(name)
+        return chosen if chosen is not None and chosen.available() else fallback
+
+    candidates = available_backends()
+    if len(candidates) <= 1:
+        return fallback
+    try:
+        profile = file_profile(source_file)
+        with _backends_lock:
+            _load_winners()
+            winner = _winners.get(profile)
+        if winner is None:
+            winner = _pick_winner(benchmark_backends(source_file, candidates))
+            with _backends_lock:
+                _winners[profile] = winner
+                _save_winners()
+    except Exception:
+        # Unreadable files are reported by the import itself
+        return fallback
+    chosen = get_backend(winner)
+    return chosen if chosen is not None and chosen.available() else fallback
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the installed PDF text-extraction backends on a file")
+    parser.add_argument("source", help="PDF to benchmark")
+    parser.add_argument("--pages", type=int, default=BENCHMARK_SAMPLE_PAGES, help="pages to sample")
+    args = parser.parse_args()
+
+    print(f"profile: {file_profile(args.source)}")
+    print(f"installed: {', '.join(backend.name for backend in available_backends())}")
+    results = benchmark_backends(args.source, sample_pages=args.pages)
+    for result in results:
+        if result.error:
+            print(f"  {result.backend:<10} failed: {result.error}")
+        else:
+            print(f"  {result.backend:<10} {result.seconds * 1000:9.1f} ms  {result.characters:8} chars")
+    print(f"fastest complete backend: {_pick_winner(results)}")
@@ -0,0 +1,333 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from PyPDF2.generic import ArrayObject
+
+# Bump when extraction output or the key's inputs change so stale entries are never served
+CACHE_KEY_VERSION = b"pypdf2-3:2"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cybergen")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 100000
+
+
+def _raw_stream_bytes(obj):
+    """Return the undecoded bytes of a PDF stream object (no filter decoding)."""
+    obj = obj.get_object()
+    data = getattr(obj, "_data", None)
+    if data is None:
+        data = obj.get_data()
+    return data if isinstance(data, bytes) else str(data).encode("utf-8")
+
+
+def _hash_resources(digest, resources, seen):
+    """
+    Feed the fonts and Form XObjects of a resource dictionary into a digest.
+
+    Form XObjects are followed recursively, since PyPDF2 extracts the text they
+    draw through the `Do` operator; `seen` guards against cyclic references.
+    """
+    if resources is None:
+        return
+    resources = resources.get_object()
+
+    fonts = resources.get("/Font")
+    if fonts is not None:
+        fonts = fonts.get_object()
+        for name in sorted(fonts.keys()):
+            font = fonts[name].get_object()
+            digest.update(b"\x00font:" + name.encode("utf-8"))
+            digest.update(str(font.get("/BaseFont", "")).encode("utf-8"))
+            digest.update(str(font.get("/Encoding", "")).encode("utf-8"))
+            to_unicode = font.get("/ToUnicode")
+            if to_unicode is not None:
+                digest.update(_raw_stream_bytes(to_unicode))
+
+    xobjects = resources.get("/XObject")
+    if xobjects is not None:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects.keys()):
+            reference = xobjects[name]
+            xobject = reference.get_object()
+            digest.update(b"\x00xobject:" + name.encode("utf-8"))
+            if xobject.get("/Subtype") != "/Form":
+                # Images carry no extractable text
+                continue
+            identity = getattr(reference, "idnum", None)
+            if identity is not None:
+                identity = (identity, reference.generation)
+                if identity in seen:
+                    digest.update(b"\x00seen:" + str(identity).encode("ascii"))
+                    continue
+                seen.add(identity)
+            digest.update(b"\x00form:" + str(xobject.get("/Matrix", "")).encode("utf-8"))
+            digest.update(_raw_stream_bytes(xobject))
+            _hash_resources(digest, xobject.get("/Resources"), seen)
+            digest.update(b"\x00end-form")
+
+
+def page_cache_key(page):
+    """
+    Build the cache key for a PDF page from everything its extracted text depends on.
+
+    The raw (still compressed) content stream is hashed together with the font
+    resources, because the same drawing operators extract to different text when
+    the fonts carry different ToUnicode maps (e.g. subsetted fonts), and with the
+    Form XObjects the page draws, including their own fonts and nested forms.
+
+    Args:
+        page: A PyPDF2 PageObject
+
+    Returns:
+        str: Hex digest identifying the page's extractable text
+    """
+    digest = hashlib.sha256(CACHE_KEY_VERSION)
+
+    contents = page.get("/Contents")
+    if contents is not None:
+        contents = contents.get_object()
+        streams = contents if isinstance(contents, ArrayObject) else [contents]
+        for stream in streams:
+            digest.update(_raw_stream_bytes(stream))
+    digest.update(b"\x00rotate:" + str(page.get("/Rotate", 0)).encode("ascii"))
+
+    _hash_resources(digest, page.get("/Resources"), set())
+    return digest.hexdigest()
+
+
+class PageTextCache:
+    """
+    Persistent, size-bounded LRU cache of extracted PDF page text.
+
+    Entries live in a SQLite database so they survive restarts and can be shared
+    by several processes. The total text size and entry count are capped, and the
+    least recently used pages are evicted first.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+            path (str): Location of the cache database file
+            max_bytes (int): Maximum total size of cached text, in bytes
+            max_entries (int): Maximum number of cached pages
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        # Sent to extraction worker processes: the settings travel, the connection does not
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        state["_conn"] = None
+        state["_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # Connections must not be shared with forked children, so reopen per process
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        """
+        Look up cached text for a page key, marking the entry as recently used.
+
+        Args:
+            key (str): Key from page_cache_key()
+
+        Returns:
+            str: The cached text, or None on a miss
+        """
+        with self._lock:
+            try:
+                conn = self._connection()
+                row = conn.execute("SELECT text FROM pages WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE pages SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.hits += 1
+                return row[0]
+            except sqlite3.Error:
+                self.errors += 1
+                self.misses += 1
+                return None
+
+    def put(self, key, text):
+        """
+        Store extracted text for a page key, evicting old entries if over the limits.
+
+        Args:
+            key (str): Key from page_cache_key()
+            text (str): Extracted page text
+        """
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO pages (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, text, size, time.time()),
+                )
+                self._evict(conn)
+            except sqlite3.Error:
+                self.errors += 1
+
+    def _evict(self, conn):
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return
+        # Walk from the least recently used entry until both limits are satisfied
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM pages ORDER BY last_used"):
+            if entries <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            entries -= 1
+            total -= size
+        conn.executemany("DELETE FROM pages WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def clear(self):
+        """Remove every cached page and reset the counters."""
+        with self._lock:
+            self._connection().execute("DELETE FROM pages")
+            self.hits = self.misses = self.evictions = self.errors = 0
+
+    def counters(self):
+        """
+        Returns:
+            dict: The hits, misses, evictions and errors counted so far
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "errors": self.errors}
+
+    def add_counters(self, deltas):
+        """
+        Add counts made by another process, e.g. an extraction worker using a copy of this cache.
+
+        Args:
+            deltas (dict): Increments of 'hits', 'misses', 'evictions' and 'errors'
+        """
+        with self._lock:
+            self.hits += deltas.get("hits", 0)
+            self.misses += deltas.get("misses", 0)
+            self.evictions += deltas.get("evictions", 0)
+            self.errors += deltas.get("errors", 0)
+
+    def stats(self):
+        """
+        Report cache counters and current usage.
+
+        Returns:
+            dict: hits, misses, evictions, errors, hit_rate, entries and bytes
+        """
+        with self._lock:
+            try:
+                entries, total = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages"
+                ).fetchone()
+            except sqlite3.Error:
+                entries, total = None, None
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": total,
+            }
+
+    def close(self):
+        """Close the database connection of this process."""
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+def extract_page_text(page, cache=None):
+    """
+    Extract the text of a PDF page, consulting the page cache first.
+
+    Args:
+        page: A PyPDF2 PageObject
+        cache (PageTextCache): Cache to use, or None to always extract
+
+    Returns:
+        str: The page text
+    """
+    if cache is None:
+        return page.extract_text()
+
+    try:
+        key = page_cache_key(page)
+    except Exception:
+        # Pages we cannot fingerprint are simply not cached
+        return page.extract_text()
+
+    text = cache.get(key)
+    if text is None:
+        text = page.extract_text()
+        cache.put(key, text)
+    return text
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_page_cache():
+    """
+    Return the process-wide page cache configured from the environment.
+
+    CYBERGEN_PDF_CACHE_DIR sets the cache directory (default ~/.cache/cybergen),
+    CYBERGEN_PDF_CACHE_MAX_MB the size limit, and CYBERGEN_PDF_CACHE=off disables it.
+
+    Returns:
+        PageTextCache: The shared cache, or None if caching is disabled
+    """
+    global _default_cache
+    if os.environ.get("CYBERGEN_PDF_CACHE", "").lower() in ("0", "off", "false", "no"):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            cache_dir = os.environ.get("CYBERGEN_PDF_CACHE_DIR", DEFAULT_CACHE_DIR)
+            max_mb = float(os.environ.get("CYBERGEN_PDF_CACHE_MAX_MB", DEFAULT_MAX_BYTES / (1024 * 1024)))
+            _default_cache = PageTextCache(
+                os.path.join(cache_dir, "pdf_pages.sqlite3"),
+                max_bytes=int(max_mb * 1024 * 1024),
+            )
+        return _default_cache
@@ -0,0 +1,410 @@
+import gc
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+
+import PyPDF2
+
+from source_io import is_buffer_source, open_source, pdf_page_count
+from import_range import resolve_page_range
+from pdf_page_cache import get_default_page_cache
+from pdf_backends import DEFAULT_BACKEND, choose_backend, get_backend
+
+# Pages extracted ahead of rendering; bounds the text held in the queue
+DEFAULT_QUEUE_PAGES = 8
+# Below this many pages to extract, starting a worker process costs more than it saves
+MIN_PIPELINE_PAGES = 4
+# How often a consumer waiting for pages checks for cancellation and a dead worker
+POLL_INTERVAL = 0.25
+
+
+class StageStats:
+    """
+    Work done by one stage of an import.
+
+    Attributes:
+        name (str): Stage name ('extract', 'render' or 'save')
+        unit (str): What `items` counts ('pages' or 'bytes')
+        items (int): Items the stage processed
+        busy (float): Seconds the stage spent working
+        stalled (float): Seconds the stage spent waiting on its neighbour (an empty or full queue)
+    """
+
+    __slots__ = ("name", "unit", "items", "busy", "stalled")
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy = 0.0
+        self.stalled = 0.0
+
+    @property
+    def rate(self):
+        """Items per second of busy time, or None if the stage did no timed work."""
+        return self.items / self.busy if self.busy > 0 else None
+
+    def as_dict(self):
+        return {"unit": self.unit, "items": self.items, "busy": self.busy,
+                "stalled": self.stalled, "rate": self.rate}
+
+
+class PipelineStats:
+    """
+    Per-stage throughput of an import, for finding the bottleneck and sizing the stages.
+
+    Pass one to build_document_from_source or copy_document_to_template (as `stats`)
+    and read it afterwards. The stage with the most busy time is the bottleneck:
+    the others stall waiting on it.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def stage(self, name, unit):
+        """Return the stats of a stage, creating them on first use."""
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageStats(name, unit)
+        return stage
+
+    @property
+    def bottleneck(self):
+        """Name of the busiest stage, or None before anything was measured."""
+        busiest = max(self.stages.values(), key=lambda stage: stage.busy, default=None)
+        return busiest.name if busiest is not None and busiest.busy > 0 else None
+
+    def as_dict(self):
+        return {name: stage.as_dict() for name, stage in self.stages.items()}
+
+    def summary(self):
+        """Multi-line, human-readable report of every stage."""
+        lines = []
+        for stage in self.stages.values():
+            if stage.unit == "bytes":
+                amount = f"{stage.items / (1024 * 1024):.1f} MB"
+                rate = f"{stage.rate / (1024 * 1024):.1f} MB/s" if stage.rate else "-"
+            else:
+                amount = f"{stage.items} {stage.unit}"
+                rate = f"{stage.rate:.1f} {stage.unit}/s" if stage.rate else "-"
+            lines.append(f"{stage.name:<8} {amount:>12}  busy {stage.busy:7.2f}s  {rate:>14}  "
+                         f"stalled {stage.stalled:6.2f}s")
+        if self.bottleneck:
+            lines.append(f"bottleneck: {self.bottleneck}")
+        return "\n".join(lines)
+
+
+def timed_pages(page_stream, stats):
+    """
+    Time a page stream consumed on one thread.
+
+    Time spent producing each page counts as extraction, time between pages
+    (spent by the consumer) as rendering.
+
+    Args:
+        page_stream: Iterator of page texts, e.g. from iter_pdf_text
+        stats (PipelineStats): Receives the 'extract' and 'render' stages
+
+    Yields:
+        str: The text of each page
+    """
+    extract = stats.stage("extract", "pages")
+    render = stats.stage("render", "pages")
+    page_stream = iter(page_stream)
+    while True:
+        started = time.perf_counter()
+        try:
+            text = next(page_stream)
+        except StopIteration:
+            return
+        yielded = time.perf_counter()
+        extract.busy += yielded - started
+        extract.items += 1
+        yield text
+        render.busy += time.perf_counter() - yielded
+        render.items += 1
+
+
+def pages_to_extract(source_file, pages=None, page_texts=None):
+    """
+    Count the selected pages of a PDF that are not already extracted.
+
+    Args:
+        source_file: Path to the PDF file, or an in-memory buffer of it
+        pages: Pages to import, as a range like "12-40" or 1-based page numbers; None for all
+        page_texts (dict): Text already extracted, keyed by zero-based page number
+
+    Returns:
+        int: Number of pages left to extract
+    """
+    with open_source(source_file) as stream:
+        page_count = pdf_page_count(PyPDF2.PdfReader(stream))
+    page_numbers = resolve_page_range(pages, page_count)
+    if page_numbers is None:
+        page_numbers = range(page_count)
+    return sum(1 for page_num in page_numbers if page_num not in (page_texts or {}))
+
+
+def pipeline_enabled():
+    """False if CYBERGEN_PIPELINE is set to "off" (it is on by default)."""
+    return os.environ.get("CYBERGEN_PIPELINE", "").strip().lower() not in ("0", "off", "false", "no")
+
+
+def should_pipeline(source_file, pages=None, page_texts=None, pipeline=None):
+    """
+    Decide whether to extract a PDF's pages in a worker process.
+
+    In-memory buffers (e.g. uploads) are not pipelined unless forced: the worker
+    would need its own copy of the whole file, undoing the zero-copy read of the
+    upload and doubling the memory a job needs.
+
+    Args:
+        source_file: Path to the PDF file, or an in-memory buffer of it
+        pages: Pages to import
+        page_texts (dict): Text already extracted, keyed by zero-based page number
+        pipeline (bool): Force the pipeline on or off; None decides from CYBERGEN_PIPELINE,
+            the kind of source and the number of pages left to extract
+
+    Returns:
+        bool: True to pipeline the import
+    """
+    if pipeline is False:
+        return False
+    # Pool workers (e.g. batch.py's) are daemonic and may not start processes; the
+    # pool already keeps every core busy
+    if multiprocessing.current_process().daemon:
+        return False
+    if pipeline:
+        return True
+    if not pipeline_enabled() or is_buffer_source(source_file):
+        return False
+    try:
+        return pages_to_extract(source_file, pages, page_texts) >= MIN_PIPELINE_PAGES
+    except Exception:
+        # Let the import itself report unreadable PDFs
+        return False
+
+
+def _context():
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.active_count() == 1:
+        # With no other threads nothing can be holding a lock mid-update, so a plain
+        # fork is safe, starts instantly and shares the already imported modules
+        return multiprocessing.get_context("fork")
+    if "forkserver" in methods:
+        # Workers fork from a clean, single-threaded server that has already imported
+        # the PDF libraries, rather than from a (possibly threaded) web server
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["pipeline"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _portable(exc):
+    """The exception itself if it survives pickling, else a RuntimeError describing it."""
+    try:
+        pickle.loads(pickle.dumps(exc))
+        return exc
+    except Exception:
+        return RuntimeError(f"{type(exc).__name__}: {exc}")
+
+
+def _extract_pages(source_file, pages, known, page_cache, backend, pages_queue):
+    """
+    Worker process: extract the selected pages in order with the named backend and send
+    them to the consumer.
+
+    Messages are ('start', pages_total, pages_known), then ('page', page_num, text) for
+    every selected page (text is None for pages in `known`), then ('done', pages_extracted,
+    busy, stalled, cache_counts), or ('error', exception, cache_counts) if extraction fails.
+    cache_counts holds the page cache hits, misses, evictions and errors counted by this
+    worker, for the consumer to add to its own cache's counters.
+    """
+    # A forked worker inherits the parent's heap; keep the collector from walking
+    # (and un-sharing) it over and over while pages are extracted
+    gc.freeze()
+    busy = stalled = 0.0
+    extracted = 0
+    # The cache arrives as a copy carrying the parent's counts; only the increase is news
+    counted = page_cache.counters() if page_cache else {}
+
+    def cache_counts():
+        if not page_cache:
+            return {}
+        return {name: value - counted[name] for name, value in page_cache.counters().items()}
+
+    def put(message):
+        nonlocal stalled
+        started = time.perf_counter()
+        pages_queue.put(message)
+        stalled += time.perf_counter() - started
+
+    try:
+        started = time.perf_counter()
+        # A backend registered only in the parent is unknown to a spawned worker
+        extractor = get_backend(backend) or get_backend(DEFAULT_BACKEND)
+        with open_source(source_file) as stream:
+            page_numbers, texts = extractor.iter_pages(stream, pages, known, page_cache)
+            try:
+                busy += time.perf_counter() - started
+                put(("start", len(page_numbers), sum(1 for page_num in page_numbers if page_num in known)))
+                for page_num in page_numbers:
+                    if page_num in known:
+                        put(("page", page_num, None))
+                        continue
+                    started = time.perf_counter()
+                    text = next(texts)
+                    busy += time.perf_counter() - started
+                    extracted += 1
+                    put(("page", page_num, text))
+            finally:
+                texts.close()
+        put(("done", extracted, busy, stalled, cache_counts()))
+    except Exception as e:
+        put(("error", _portable(e), cache_counts()))
+
+
+def _next_message(pages_queue, worker, control):
+    """Wait for the worker's next message, checking for cancellation while waiting."""
+    while True:
+        try:
+            return pages_queue.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            pass
+        if control is not None:
+            control.check()
+        if not worker.is_alive():
+            # Anything it sent before exiting has been flushed to the pipe by now
+            try:
+                return pages_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                raise RuntimeError(f"PDF extraction worker exited unexpectedly (exit code {worker.exitcode})")
+
+
+def iter_pdf_text_pipelined(source_file, pages=None, page_cache=None, page_texts=None, control=None,
+                            keep=True, stats=None, queue_pages=DEFAULT_QUEUE_PAGES, backend=None):
+    """
+    Yield the text of each selected PDF page in order, extracted ahead in a worker process.
+
+    Extraction of the next pages overlaps with whatever the caller does with the
+    current one (classifying and rendering paragraphs). At most `queue_pages` pages
+    wait in the queue, so a slow consumer holds back extraction instead of piling
+    up text. Produces the same pages as cybergen_template.iter_pdf_text; closing the
+    generator early (or a cancelled control) stops the worker.
+
+    Args:
+        source_file: Path to the PDF file, or a bytes/memoryview/mmap buffer of it
+        pages: Pages to extract, as a range like "12-40" or 1-based page numbers; None for all
+        page_cache: PageTextCache to use, None for the default cache, False to disable
+        page_texts (dict): Text already extracted, keyed by zero-based page number; those
+            pages are reused
+        control (JobControl): Receives progress and may cancel the extraction
+        keep (bool): Add newly extracted pages to page_texts
+        stats (PipelineStats): Receives the 'extract' and 'render' stages
+        queue_pages (int): Pages extraction may run ahead of the consumer
+        backend (str): Extraction backend name, "auto", or None for CYBERGEN_PDF_BACKEND
+
+    Yields:
+        str: The text of each page
+    """
+    if not is_buffer_source(source_file):
+        if not os.path.exists(source_file):
+            raise FileNotFoundError(f"File not found: {source_file}")
+        if not source_file.lower().endswith('.pdf'):
+            raise ValueError("File must be a PDF")
+    # Chosen here, so the benchmark result is remembered by this process
+    backend = choose_backend(source_file, backend).name
+    # Memory maps and views cannot be sent to another process, so a buffer is copied;
+    # should_pipeline() therefore only pipelines buffers when asked to explicitly
+    source = bytes(memoryview(source_file)) if is_buffer_source(source_file) else source_file
+
+    if page_cache is None:
+        page_cache = get_default_page_cache()
+    if page_texts is None:
+        page_texts = {}
+    if stats is None:
+        stats = PipelineStats()
+    extract = stats.stage("extract", "pages")
+    render = stats.stage("render", "pages")
+
+    context = _context()
+    pages_queue = context.Queue(queue_pages)
+    worker = context.Process(target=_extract_pages, name="cybergen-pdf-extract", daemon=True,
+                             args=(source, pages, frozenset(page_texts), page_cache or None, backend,
+                                   pages_queue))
+    worker.start()
+    del source
+    try:
+        while True:
+            waited = time.perf_counter()
+            message = _next_message(pages_queue, worker, control)
+            render.stalled += time.perf_counter() - waited
+            kind = message[0]
+            if kind == "page":
+                _, page_num, text = message
+                if text is None:
+                    text = page_texts[page_num]
+                else:
+                    if keep:
+                        page_texts[page_num] = text
+                    if control is not None:
+                        control.page_extracted()
+                yielded = time.perf_counter()
+                yield text
+                render.busy += time.perf_counter() - yielded
+                render.items += 1
+            elif kind == "start":
+                _, pages_total, pages_known = message
+                if control is not None:
+                    control.set_stage("extracting", pages_total=pages_total)
+                    control.pages_extracted += pages_known
+            elif kind == "done":
+                _, extracted, busy, stalled, counts = message
+                extract.items += extracted
+                extract.busy += busy
+                extract.stalled += stalled
+                if page_cache:
+                    page_cache.add_counters(counts)
+                return
+            else:
+                _, error, counts = message
+                if page_cache:
+                    page_cache.add_counters(counts)
+                raise error
+    finally:
+        if worker.is_alive():
+            worker.terminate()
+        worker.join()
+        pages_queue.close()
+        pages_queue.cancel_join_thread()
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    from cybergen_template import build_document_from_source, save_document
+
+    parser = argparse.ArgumentParser(description="Compare sequential and pipelined PDF imports stage by stage")
+    parser.add_argument("source", help="PDF to import")
+    parser.add_argument("--pages", help='pages to import, e.g. "1-50"')
+    parser.add_argument("--template", default="cybergen-template.docx", help="template document")
+    parser.add_argument("--cache", action="store_true",
+                        help="use the PDF page cache (off by default, so every page is extracted)")
+    args = parser.parse_args()
+    if not args.cache:
+        os.environ["CYBERGEN_PDF_CACHE"] = "off"
+
+    with tempfile.TemporaryDirectory() as directory:
+        for label, pipeline in (("sequential", False), ("pipelined", True)):
+            stats = PipelineStats()
+            started = time.perf_counter()
+            doc = build_document_from_source(args.source, args.template, pages=args.pages,
+                                             pipeline=pipeline, stats=stats)
+            save_document(doc, os.path.join(directory, f"{label}.docx"), stats=stats)
+            elapsed = time.perf_counter() - started
+            print(f"{label}: {elapsed:.2f}s")
+            print("  " + stats.summary().replace("\n", "\n  "))
@@ -0,0 +1,109 @@
+import PyPDF2
+
+from source_io import source_extension, open_source, pdf_page_count
+from pdf_page_cache import get_default_page_cache
+from pdf_backends import choose_backend
+from docx_stream import iter_docx_paragraphs
+from import_range import select_paragraphs
+
+# Number of Word paragraphs shown per preview screen
+PARAGRAPHS_PER_SCREEN = 30
+
+
+class DocumentPreview:
+    """
+    Incremental preview of an uploaded document.
+
+    Nothing is extracted up front: each PDF page or screenful of Word paragraphs is
+    extracted the first time it is requested and kept, so paging back is free and the
+    PDF page text can be handed to copy_document_to_template(page_texts=...) to avoid
+    extracting those pages again when the document is generated.
+
+    The source buffer is passed to every call instead of being stored, so the preview
+    can live in the Streamlit session without pinning an old upload buffer.
+    PDF pages are extracted with the backend generation would choose for the file,
+    so the text handed over is the text generation would have extracted.
+    """
+
+    def __init__(self, source_name, page_cache=None):
+        """
+        Args:
+            source_name (str): Filename of the uploaded document
+            page_cache: PageTextCache to use, None for the default cache, False to disable
+        """
+        self.source_name = source_name
+        self.is_pdf = source_extension(source_name) == '.pdf'
+        self.page_texts = {}
+        self._page_cache = get_default_page_cache() if page_cache is None else page_cache
+        self._page_count = None
+        self._backend = None
+        self._screens = {}
+
+    def page_count(self, source):
+        """
+        Number of preview pages: PDF pages, or None for Word documents (unknown until read).
+
+        Args:
+            source: The document as a path or in-memory buffer
+        """
+        if not self.is_pdf:
+            return None
+        if self._page_count is None:
+            with open_source(source) as stream:
+                self._page_count = pdf_page_count(PyPDF2.PdfReader(stream))
+        return self._page_count
+
+    def get_page(self, source, page_number):
+        """
+        Text of one preview page, extracting it only if it has not been seen yet.
+
+        For PDFs a page is a PDF page; for Word documents it is a screenful of
+        PARAGRAPHS_PER_SCREEN non-empty paragraphs.
+
+        Args:
+            source: The document as a path or in-memory buffer
+            page_number (int): 1-based preview page number
+
+        Returns:
+            str: The page text ('' past the end of a Word document)
+        """
+        if self.is_pdf:
+            page_index = page_number - 1
+            if page_index not in self.page_texts:
+                if self._backend is None:
+                    self._backend = choose_backend(source)
+                with open_source(source) as stream:
+                    _, texts = self._backend.iter_pages(stream, [page_number], page_cache=self._page_cache or None)
+                    try:
+                        text = next(texts, None)
+                    finally:
+                        texts.close()
+                if text is None:
+                    raise IndexError(f"Page {page_index} is out of range")
+                self.page_texts[page_index] = text
+            return self.page_texts[page_index]
+
+        if page_number not in self._screens:
+            first = (page_number - 1) * PARAGRAPHS_PER_SCREEN + 1
+            last = first + PARAGRAPHS_PER_SCREEN - 1
+            # Streaming stops at the end of the requested screen
+            paragraphs = select_paragraphs(iter_docx_paragraphs(source), f"{first}-{last}")
+            self._screens[page_number] = '\n'.join(para.text for para in paragraphs)
+        return self._screens[page_number]
+
+    def has_page(self, source, page_number):
+        """
+        Check whether a preview page exists, reading at most that page.
+
+        Args:
+            source: The document as a path or in-memory buffer
+            page_number (int): 1-based preview page number
+
+        Returns:
+            bool: True if the page has content
+        """
+        if page_number < 1:
+            return False
+        if self.is_pdf:
+            return page_number <= self.page_count(source)
+        return bool(self.get_page(source, page_number))
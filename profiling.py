@@ -0,0 +1,212 @@
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cybergen", "profiles")
+DEFAULT_TOP_ALLOCATIONS = 25
+TRACEMALLOC_FRAMES = 5
+
+# cProfile can only profile one job at a time (from Python 3.12 a profiler is
+# process-wide); jobs sampled while another is being profiled skip the CPU profile
+_cpu_profile_lock = threading.Lock()
+
+# tracemalloc is process-wide too: it runs while at least one profiled job does
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started_here = False
+
+
+def sample_rate():
+    """
+    Fraction of jobs to profile, from CYBERGEN_PROFILE.
+
+    "on"/"1" profiles every job, a number between 0 and 1 profiles that fraction
+    of jobs at random, and unset/"off" profiles none.
+
+    Returns:
+        float: Sampling rate between 0 and 1
+    """
+    value = os.environ.get("CYBERGEN_PROFILE", "").strip().lower()
+    if value in ("", "0", "off", "false", "no"):
+        return 0.0
+    if value in ("on", "true", "yes", "all"):
+        return 1.0
+    try:
+        return min(max(float(value), 0.0), 1.0)
+    except ValueError:
+        return 0.0
+
+
+def should_profile(profile=None):
+    """
+    Decide whether to profile a job.
+
+    Args:
+        profile (bool): Force profiling on or off; None samples according to CYBERGEN_PROFILE
+
+    Returns:
+        bool: True if the job should be profiled
+    """
+    if profile is not None:
+        return bool(profile)
+    rate = sample_rate()
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+def input_size(source):
+    """
+    Size of a job's input in bytes, for tagging profiles.
+
+    Args:
+        source: Input text, a path to a source document, or an in-memory buffer
+
+    Returns:
+        int: Size in bytes, or None if it cannot be determined
+    """
+    try:
+        if isinstance(source, str) and os.path.exists(source):
+            return os.path.getsize(source)
+        if isinstance(source, str):
+            return len(source.encode("utf-8"))
+        return memoryview(source).nbytes
+    except (TypeError, ValueError, OSError):
+        return None
+
+
+def _start_tracing():
+    global _tracing_users, _tracing_started_here
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracing_started_here = True
+        _tracing_users += 1
+        # Peak is process-wide; with concurrent profiled jobs it covers all of them
+        tracemalloc.reset_peak()
+
+
+def _stop_tracing():
+    global _tracing_users, _tracing_started_here
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_started_here:
+            tracemalloc.stop()
+            _tracing_started_here = False
+
+
+class JobProfile:
+    """
+    CPU and memory profile of one job.
+
+    Attributes:
+        job_id (str): Identifier of the profiled job
+        stats_path (str): cProfile stats file (load with pstats or snakeviz), or None if skipped
+        report_path (str): JSON report with the tags, timings, peak memory and top allocations
+        tags (dict): Job metadata recorded in the report (input size, template, outcome, ...)
+    """
+
+    def __init__(self, job_id, profile_dir, tags):
+        self.job_id = job_id
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        prefix = os.path.join(profile_dir, f"{stamp}-{job_id}")
+        self.stats_path = prefix + ".prof"
+        self.report_path = prefix + ".json"
+        self.tags = dict(tags)
+
+    def tag(self, **tags):
+        """Add metadata to the report, e.g. the job's outcome."""
+        self.tags.update(tags)
+
+
+def _top_allocations(snapshot, limit):
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    return [
+        {
+            "size": stat.size,
+            "count": stat.count,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        }
+        for stat in snapshot.statistics("traceback")[:limit]
+    ]
+
+
+@contextmanager
+def profile_job(job_id=None, profile=None, profile_dir=None, **tags):
+    """
+    Capture a cProfile stats file and a tracemalloc snapshot for the enclosed job.
+
+    Profiling is opt-in: with profile=None the job is sampled according to
+    CYBERGEN_PROFILE. Files are written to profile_dir, CYBERGEN_PROFILE_DIR or
+    ~/.cache/cybergen/profiles, named after the job. The allocation snapshot is
+    taken as the job finishes, so it shows what the job still holds (e.g. the
+    built document); the report also records the peak traced memory.
+
+    Args:
+        job_id (str): Identifier used in the file names (generated if None)
+        profile (bool): Force profiling on or off; None samples
+        profile_dir (str): Directory for the profile files
+        **tags: Metadata recorded in the report, e.g. kind, input_size, template
+
+    Yields:
+        JobProfile: The job's profile, or None if the job is not profiled
+    """
+    if not should_profile(profile):
+        yield None
+        return
+
+    profile_dir = profile_dir or os.environ.get("CYBERGEN_PROFILE_DIR", DEFAULT_PROFILE_DIR)
+    os.makedirs(profile_dir, exist_ok=True)
+    job_profile = JobProfile(job_id or uuid.uuid4().hex[:12], profile_dir, tags)
+
+    profiler = None
+    if _cpu_profile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) is already active
+            profiler = None
+            _cpu_profile_lock.release()
+
+    _start_tracing()
+    started = time.perf_counter()
+    try:
+        yield job_profile
+    except BaseException as e:
+        job_profile.tag(ok=False, error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+            _cpu_profile_lock.release()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        _stop_tracing()
+
+        if profiler is not None:
+            profiler.dump_stats(job_profile.stats_path)
+        else:
+            job_profile.stats_path = None
+        top = int(os.environ.get("CYBERGEN_PROFILE_TOP", DEFAULT_TOP_ALLOCATIONS))
+        report = {
+            "job_id": job_profile.job_id,
+            "pid": os.getpid(),
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "elapsed": elapsed,
+            "tags": job_profile.tags,
+            "cpu_profile": job_profile.stats_path,
+            "peak_traced_bytes": peak,
+            "top_allocations": _top_allocations(snapshot, top),
+        }
+        with open(job_profile.report_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, default=str)
@@ -0,0 +1,365 @@
+import hashlib
+import os
+import re
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import Counter, Gauge, get_registry
+from profiling import input_size
+
+# Per user, so another local user cannot claim the default root first
+DEFAULT_ROOT = os.path.join(tempfile.gettempdir(),
+                            f"cybergen-scratch-{os.geteuid()}" if hasattr(os, "geteuid") else "cybergen-scratch")
+DEFAULT_QUOTA_MB = 1024
+# Entries unused for this long (seconds) are removed, e.g. job directories left behind by a crash
+DEFAULT_MAX_AGE = 3600.0
+JOB_PREFIX = "job-"
+FILE_PREFIX = "file-"
+
+
+class ScratchQuotaExceeded(OSError):
+    """
+    Raised when scratch space is needed but the quota is used up by entries still in use.
+
+    Attributes:
+        usage (int): Bytes in use in the scratch root
+        quota (int): The quota in bytes
+    """
+
+    def __init__(self, usage, quota):
+        super().__init__(
+            f"Scratch storage is full ({usage / (1024 * 1024):.0f} MB of {quota / (1024 * 1024):.0f} MB in use). "
+            f"Try again when the running jobs have finished."
+        )
+        self.usage = usage
+        self.quota = quota
+
+
+class ScratchRootError(OSError):
+    """Raised when the scratch root is a symlink, not a directory, or owned by another user."""
+
+
+def _private_root(root):
+    """Create the scratch root private to this user, or check that an existing one is."""
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    info = os.lstat(root)
+    if stat.S_ISLNK(info.st_mode):
+        raise ScratchRootError(f"Scratch root {root} is a symlink; refusing to use it")
+    if not stat.S_ISDIR(info.st_mode):
+        raise ScratchRootError(f"Scratch root {root} is not a directory")
+    if hasattr(os, "geteuid"):
+        if info.st_uid != os.geteuid():
+            raise ScratchRootError(f"Scratch root {root} is owned by another user; refusing to use it")
+        if info.st_mode & 0o077:
+            # Ours, e.g. created by an older version with the default mode: make it private
+            os.chmod(root, 0o700)
+
+
+def estimate_job_bytes(template_path, *inputs):
+    """
+    Estimate of the scratch space one generation writes, to reserve for it.
+
+    The output is the template plus the content carried over from the inputs, which
+    is usually smaller than the inputs themselves (PDF text and Word XML shrink,
+    media is copied as is).
+
+    Args:
+        template_path (str): Path to the template document
+        *inputs: Input sizes in bytes, or the inputs themselves (text, paths or buffers)
+
+    Returns:
+        int: Bytes to reserve
+    """
+    try:
+        total = os.path.getsize(template_path)
+    except (OSError, TypeError):
+        total = 0
+    for item in inputs:
+        size = item if isinstance(item, int) else input_size(item)
+        total += size or 0
+    return total
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        # os.kill cannot probe a process on Windows; assume it is running
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _job_owner(name):
+    """Pid of the process that created a job directory, or None if the entry is not one."""
+    if not name.startswith(JOB_PREFIX):
+        return None
+    pid = name[len(JOB_PREFIX):].split("-", 1)[0]
+    return int(pid) if pid.isdigit() else None
+
+
+def _entry_size(path):
+    """Bytes used by a file, or by all files under a directory."""
+    try:
+        if not os.path.isdir(path):
+            return os.lstat(path).st_size
+    except OSError:
+        return 0
+    total = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class ScratchStorage:
+    """
+    Scratch space for the web entry points, kept within a byte quota.
+
+    Each job gets its own directory under `root` (a tmpfs mount such as /dev/shm
+    works well), which is removed when the job ends, whether it succeeded, failed
+    or was cancelled. Uploads that must outlive a single job, such as a custom
+    template, are stored once per content hash and kept while they are used.
+
+    The root is created private to this user (mode 0700); a root that is a symlink
+    or belongs to another user is refused with ScratchRootError.
+
+    A job reserves the space it expects to write (see estimate_job_bytes) when its
+    directory is created. Until it is released, the job counts against the quota
+    as the larger of its reservation and what it has actually written, so
+    concurrent jobs cannot together overrun the quota by writing after admission.
+    The quota is enforced when space is handed out: a job that writes more than
+    it reserved is not stopped, but the excess counts against later requests.
+    Reservations of other processes sharing the root are not visible here; their
+    directories count with their current size.
+
+    Every time space is handed out, the root is swept: job directories left behind
+    by processes that have exited and entries unused for `max_age` are removed,
+    and while the root is over its quota the least recently used idle entries are
+    removed too. Job directories of running jobs, in this or another process
+    sharing the root, are never removed to make room. If that is not enough the
+    request fails with ScratchQuotaExceeded instead of filling the disk.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, quota_bytes=DEFAULT_QUOTA_MB * 1024 * 1024, max_age=DEFAULT_MAX_AGE):
+        """
+        Args:
+            root (str): Directory that holds the scratch entries; created if missing
+            quota_bytes (int): Most bytes the entries may use together
+            max_age (float): Seconds after their last use at which entries are removed
+
+        Raises:
+            ScratchRootError: If the root is a symlink or owned by another user
+        """
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.usage = 0
+        self.evictions = 0
+        self._active = set()
+        # Job directory -> bytes reserved for it until it is released
+        self._reserved = {}
+        self._lock = threading.Lock()
+        _private_root(root)
+
+    def _remove(self, path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _sweep(self, needed=0):
+        """Evict stale entries, then the oldest idle ones while over quota. Returns the bytes in use."""
+        now = time.time()
+        entries = []
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            _private_root(self.root)
+            names = []
+        pid = os.getpid()
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                last_used = os.lstat(path).st_mtime
+            except OSError:
+                continue
+            owner = _job_owner(name)
+            if path in self._active:
+                busy = True
+            elif owner is None:
+                busy = False
+            elif owner == pid or not _pid_alive(owner):
+                # Left behind by a job of ours that was never released, or by a process
+                # that died: treat it as expired
+                busy = False
+                last_used = 0
+            else:
+                busy = True
+            # Another process's job directory still expires, in case its pid was reused
+            if path not in self._active and now - last_used > self.max_age:
+                self._remove(path)
+                self.evictions += 1
+                continue
+            size = _entry_size(path)
+            if path in self._reserved:
+                size = max(size, self._reserved[path])
+            entries.append((last_used, path, size, busy))
+
+        usage = sum(size for _, _, size, _ in entries)
+        if usage + needed > self.quota_bytes:
+            for _, path, size, busy in sorted(entries):
+                if usage + needed <= self.quota_bytes:
+                    break
+                if busy:
+                    continue
+                self._remove(path)
+                self.evictions += 1
+                usage -= size
+        self.usage = usage
+        return usage
+
+    def _reserve(self, needed=0):
+        usage = self._sweep(needed)
+        if usage + needed > self.quota_bytes:
+            raise ScratchQuotaExceeded(usage, self.quota_bytes)
+
+    def create_job_dir(self, prefix="", reserve=0):
+        """
+        Create a directory for one job; pair with release(). job_dir() does both.
+
+        Args:
+            prefix (str): Readable tag for the directory name
+            reserve (int): Bytes the job expects to write, counted against the quota until release()
+
+        Returns:
+            str: Path of the new, empty directory
+
+        Raises:
+            ScratchQuotaExceeded: If the reservation does not fit next to the entries still in use
+        """
+        with self._lock:
+            self._reserve(reserve)
+            path = tempfile.mkdtemp(prefix=f"{JOB_PREFIX}{os.getpid()}-{prefix}", dir=self.root)
+            self._active.add(path)
+            self._reserved[path] = reserve
+            self.usage += reserve
+        return path
+
+    def release(self, path):
+        """Remove a job directory and everything in it, and free its reservation."""
+        with self._lock:
+            self._active.discard(path)
+            self._reserved.pop(path, None)
+        self._remove(path)
+
+    @contextmanager
+    def job_dir(self, prefix="", reserve=0):
+        """
+        A directory for one job, removed on the way out however the job ends.
+
+        Args:
+            prefix (str): Readable tag for the directory name
+            reserve (int): Bytes the job expects to write (see estimate_job_bytes)
+
+        Raises:
+            ScratchQuotaExceeded: If the quota is used up by entries still in use
+        """
+        path = self.create_job_dir(prefix, reserve)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def store(self, name, data):
+        """
+        Keep an upload that outlives a job, such as a custom template.
+
+        The same content is stored once however often it is uploaded. Each call marks
+        it as used, so it survives age eviction while a session keeps using it.
+
+        Args:
+            name (str): Original filename, kept at the end of the stored name
+            data (bytes): File content
+
+        Returns:
+            str: Path of the stored file
+
+        Raises:
+            ScratchQuotaExceeded: If the quota is used up by entries still in use
+        """
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        safe_name = re.sub(r"[^\w.-]", "_", os.path.basename(name))[-100:]
+        path = os.path.join(self.root, f"{FILE_PREFIX}{digest}-{safe_name}")
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+                return path
+            self._reserve(len(data))
+            fd, partial_path = tempfile.mkstemp(prefix=".partial-", dir=self.root)
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(data)
+                os.replace(partial_path, path)
+            except BaseException:
+                self._remove(partial_path)
+                raise
+        return path
+
+    def cleanup(self):
+        """Remove stale entries now; returns the bytes still in use."""
+        with self._lock:
+            return self._sweep()
+
+    def _collect_metrics(self):
+        usage = Gauge("cybergen_scratch_bytes", "Bytes used in the scratch root (at the last sweep)")
+        usage.set(self.usage)
+        quota = Gauge("cybergen_scratch_quota_bytes", "Scratch storage quota")
+        quota.set(self.quota_bytes)
+        active = Gauge("cybergen_scratch_active_jobs", "Job directories in use")
+        active.set(len(self._active))
+        reserved = Gauge("cybergen_scratch_reserved_bytes", "Bytes reserved by running jobs")
+        reserved.set(sum(self._reserved.values()))
+        evictions = Counter("cybergen_scratch_evictions_total", "Scratch entries removed for age or quota")
+        evictions.inc(self.evictions)
+        return [usage, quota, active, reserved, evictions]
+
+
+_default_scratch = None
+_default_scratch_lock = threading.Lock()
+
+
+def get_scratch():
+    """
+    Return the process-wide scratch storage configured from the environment.
+
+    CYBERGEN_SCRATCH_DIR sets the root (default: cybergen-scratch-<uid> in the system
+    temp directory; point it at a tmpfs such as /dev/shm/cybergen for speed),
+    CYBERGEN_SCRATCH_QUOTA_MB the quota and CYBERGEN_SCRATCH_MAX_AGE the age (seconds)
+    after which unused entries are removed.
+
+    Returns:
+        ScratchStorage: The shared scratch storage
+    """
+    global _default_scratch
+    with _default_scratch_lock:
+        if _default_scratch is None:
+            root = os.environ.get("CYBERGEN_SCRATCH_DIR", "").strip() or DEFAULT_ROOT
+            quota_mb = float(os.environ.get("CYBERGEN_SCRATCH_QUOTA_MB", DEFAULT_QUOTA_MB))
+            max_age = float(os.environ.get("CYBERGEN_SCRATCH_MAX_AGE", DEFAULT_MAX_AGE))
+            _default_scratch = ScratchStorage(root, int(quota_mb * 1024 * 1024), max_age)
+            get_registry().register_collector(_default_scratch._collect_metrics)
+        return _default_scratch
@@ -0,0 +1,257 @@
+import io
+import mmap
+import os
+from contextlib import contextmanager
+
+from PyPDF2 import PageObject
+from PyPDF2.generic import IndirectObject, NameObject
+
+from import_range import resolve_page_range
+
+# In-memory source types accepted everywhere a file path is accepted
+BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
+# Page attributes a /Page node inherits from its /Pages ancestors
+INHERITABLE_PAGE_ATTRIBUTES = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+def is_buffer_source(source):
+    """
+    Check whether a document source is an in-memory buffer rather than a path.
+
+    Args:
+        source: A file path or a bytes-like object
+
+    Returns:
+        bool: True if the source is a buffer (bytes, bytearray, memoryview or mmap)
+    """
+    return isinstance(source, BUFFER_TYPES)
+
+
+def source_extension(source, source_name=None):
+    """
+    Determine the lowercase file extension of a document source.
+
+    Args:
+        source: A file path or an in-memory buffer
+        source_name (str): Original filename, required to detect the type of a buffer
+
+    Returns:
+        str: The extension including the dot (e.g. '.pdf'), or '' if unknown
+    """
+    name = source_name if source_name else source
+    if not isinstance(name, str):
+        return ''
+    return os.path.splitext(name.lower())[1]
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Read-only, seekable binary stream over a buffer that never copies the whole buffer.
+
+    Readers such as PyPDF2 and zipfile only ever see the slices they ask for, so a
+    memoryview over an upload buffer or an mmap of a file can be parsed directly.
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        chunk = self._view[self._pos:self._pos + len(b)]
+        n = len(chunk)
+        b[:n] = chunk
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else self._pos + size
+        data = self._view[self._pos:end].tobytes()
+        self._pos += len(data)
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def getbuffer(self):
+        """The whole buffer, without copying; do not use it after closing the stream."""
+        return self._view
+
+    def close(self):
+        # Release our view so the underlying buffer (e.g. an mmap) can be closed
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+    @property
+    def mode(self):
+        return 'rb'
+
+
+@contextmanager
+def open_source(source):
+    """
+    Open a document source as a binary stream without copying it into memory.
+
+    Files are memory-mapped, buffers are wrapped in place.
+
+    Args:
+        source: A file path or an in-memory buffer
+
+    Yields:
+        A seekable binary stream over the source
+    """
+    if is_buffer_source(source):
+        stream = BufferReader(source)
+        try:
+            yield stream
+        finally:
+            stream.close()
+        return
+
+    with open(source, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # Empty files cannot be memory-mapped; let the reader report the error
+            yield file
+            return
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        stream = BufferReader(mapped)
+        try:
+            yield stream
+        finally:
+            stream.close()
+            mapped.close()
+
+
+def pdf_page_count(pdf_reader):
+    """
+    Read the page count from the PDF trailer without walking the page tree.
+
+    Args:
+        pdf_reader: A PyPDF2.PdfReader
+
+    Returns:
+        int: Number of pages in the document
+    """
+    try:
+        return int(pdf_reader.trailer["/Root"]["/Pages"]["/Count"])
+    except (KeyError, TypeError, ValueError):
+        # Broken or missing /Count, fall back to flattening the page tree
+        return len(pdf_reader.pages)
+
+
+def get_pdf_page(pdf_reader, page_index):
+    """
+    Resolve a single page by descending the page tree along its /Count entries.
+
+    Only the nodes on the path to the page (and their direct kids) are resolved, so
+    the rest of the document is never touched.
+
+    Args:
+        pdf_reader: A PyPDF2.PdfReader
+        page_index (int): Zero-based page number
+
+    Returns:
+        PageObject: The requested page
+    """
+    # Once PyPDF2 has flattened the tree there is nothing left to save
+    if pdf_reader.flattened_pages is not None:
+        return pdf_reader.pages[page_index]
+
+    try:
+        node = pdf_reader.trailer["/Root"]["/Pages"].get_object()
+        node_ref = None
+        inherit = {}
+        remaining = page_index
+        while node.get("/Type", "/Pages") == "/Pages":
+            for attr in INHERITABLE_PAGE_ATTRIBUTES:
+                if attr in node:
+                    inherit[attr] = node[attr]
+            for kid_ref in node["/Kids"]:
+                kid = kid_ref.get_object()
+                count = int(kid["/Count"]) if kid.get("/Type", "/Pages") == "/Pages" else 1
+                if remaining < count:
+                    node = kid
+                    node_ref = kid_ref if isinstance(kid_ref, IndirectObject) else None
+                    break
+                remaining -= count
+            else:
+                raise IndexError(f"Page {page_index} is out of range")
+    except (KeyError, TypeError, ValueError):
+        # Malformed page tree, let PyPDF2 work it out
+        return pdf_reader.pages[page_index]
+
+    for attr, value in inherit.items():
+        if attr not in node:
+            node[NameObject(attr)] = value
+    page = PageObject(pdf_reader, node_ref)
+    page.update(node)
+    return page
+
+
+def iter_pdf_pages(pdf_reader, page_numbers=None):
+    """
+    Lazily yield the pages of a PDF, resolving each one only when it is reached.
+
+    Args:
+        pdf_reader: A PyPDF2.PdfReader
+        page_numbers: Iterable of zero-based page numbers, or None for every page
+
+    Yields:
+        tuple: (page_index, PageObject)
+    """
+    if page_numbers is None:
+        # Every page is needed, so a single walk of the page tree is cheapest
+        for page_index, page in enumerate(pdf_reader.pages):
+            yield page_index, page
+        return
+    for page_index in page_numbers:
+        yield page_index, get_pdf_page(pdf_reader, page_index)
+
+
+def select_pdf_pages(pdf_reader, pages=None, known=()):
+    """
+    Work out which pages of a PDF to import, and resolve the ones still to be extracted.
+
+    Args:
+        pdf_reader: A PyPDF2.PdfReader
+        pages: Pages to import, as a range like "12-40" or 1-based page numbers; None for all
+        known: Zero-based numbers of pages whose text is already available
+
+    Returns:
+        tuple: (selected zero-based page numbers, iterator of (page_index, PageObject) over
+            the selected pages not in `known`, in the same order)
+    """
+    page_count = pdf_page_count(pdf_reader)
+    # Pages outside the requested range are never resolved or extracted
+    page_numbers = resolve_page_range(pages, page_count)
+    if page_numbers is None:
+        page_numbers = range(page_count)
+    missing = [page_num for page_num in page_numbers if page_num not in known]
+    # Walk the whole page tree once when every page is needed, otherwise resolve lazily
+    to_resolve = None if len(missing) == page_count else missing
+    return page_numbers, iter_pdf_pages(pdf_reader, to_resolve)
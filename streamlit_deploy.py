@@ -1,6 +1,5 @@
 import streamlit as st
 import os
-import tempfile
 from datetime import datetime
 import docx
 from docx.shared import Pt, Inches
@@ -24,10 +23,16 @@ try:
         add_space_after_paragraph,
         set_document_margins,
         add_current_date,
-        format_paragraph,
-        insert_text_into_template,
-        copy_document_to_template
+        format_paragraph
     )
+    from generation import generate_from_text, generate_from_document, generate_merged
+    from cybergen_template import MergePart
+    from template_cache import get_template_cache
+    from import_range import parse_range_spec
+    from preview import DocumentPreview
+    from job_control import JobControl, default_timeout, describe_progress
+    from metrics import get_registry, admin_page_enabled, start_exporters_from_environment
+    from scratch import ScratchQuotaExceeded, estimate_job_bytes, get_scratch
     import_success = True
 except ImportError as e:
     st.error(f"Error importing cybergen_template: {str(e)}")
@@ -126,6 +131,21 @@ if not os.path.exists(st.session_state.template_path) and not st.session_state.c
     if create_basic_template(st.session_state.template_path):
         st.success("Basic template created successfully!")
 
+# Warm the template cache from the precompiled artifact (compiled on first use),
+# so the first request does not pay for parsing the template
+if import_success and os.path.exists(st.session_state.template_path):
+    try:
+        get_template_cache().preload([st.session_state.template_path])
+    except Exception as e:
+        st.warning(f"Could not preload template: {str(e)}")
+
+# Serve or write Prometheus metrics if configured; started once per server process
+if import_success:
+    try:
+        start_exporters_from_environment()
+    except Exception as e:
+        st.warning(f"Could not start the metrics exporter: {str(e)}")
+
 # Template configuration section in sidebar
 with st.sidebar:
     st.header("Document Template")
@@ -139,24 +159,26 @@ with st.sidebar:
         help="This will be used as the base template for your document formatting"
     )
     
-    if uploaded_template:
-        # Create a temporary file for the uploaded template
-        temp_template_path = f"uploaded_template_{uploaded_template.name}"
-        with open(temp_template_path, "wb") as f:
-            f.write(uploaded_template.getvalue())
+    if uploaded_template and import_success:
+        # Keep the uploaded template in scratch storage, once per content however many
+        # sessions upload it; storing it again on every rerun keeps it from expiring
+        try:
+            temp_template_path = get_scratch().store(uploaded_template.name, uploaded_template.getvalue())
+        except ScratchQuotaExceeded as e:
+            st.error(f"Could not keep the uploaded template: {str(e)}")
+            temp_template_path = None
         
-        # Update session state
-        st.session_state.template_path = temp_template_path
-        st.session_state.custom_template_uploaded = True
-        st.session_state.template_info = f"Using custom template: {uploaded_template.name}"
-        
-        # Show template details
-        st.success(f"Custom template '{uploaded_template.name}' loaded successfully!")
+        if temp_template_path:
+            # Update session state
+            st.session_state.template_path = temp_template_path
+            st.session_state.custom_template_uploaded = True
+            st.session_state.template_info = f"Using custom template: {uploaded_template.name}"
+            
+            # Show template details
+            st.success(f"Custom template '{uploaded_template.name}' loaded successfully!")
         
         # Option to revert to default template
         if st.button("Use Default Template Instead"):
-            if os.path.exists(temp_template_path):
-                os.remove(temp_template_path)
             st.session_state.template_path = "cybergen-template.docx"
             st.session_state.custom_template_uploaded = False
             st.session_state.template_info = "Using default template"
@@ -183,55 +205,68 @@ if not import_success:
     st.stop()
 
 # Function to process document and create formatted output
-def process_document(input_type, input_content, template_path=st.session_state.template_path):
-    try:
-        # Create a temporary output file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as temp_output:
-            output_filename = temp_output.name
+def start_progress(key):
+    """Show a progress bar and return a JobControl that drives it (with the configured deadline)."""
+    progress_bar = st.progress(0.0, text="Starting...")
+    
+    def update(snapshot):
+        fraction, status = describe_progress(snapshot)
+        progress_bar.progress(fraction, text=status)
+    
+    # Pressing Cancel reruns the script, which interrupts the job at its next progress update;
+    # the partially written output is removed on the way out
+    st.button("Cancel", key=f"cancel_{key}")
+    return JobControl(progress=update, timeout=default_timeout())
+
+def process_document(input_type, input_content, output_dir, template_path=st.session_state.template_path, import_options=None, page_texts=None):
+    if input_type == "text":
+        # Each job writes to its own scratch directory, so concurrent sessions never collide
+        result = generate_from_text(input_content, template_path=template_path, output_dir=output_dir,
+                                    control=start_progress(input_type))
         
-        if input_type == "text":
-            # Process text using the existing function
-            result = insert_text_into_template(
-                input_content, 
-                template_path=template_path,
-                output_filename=output_filename
-            )
-            return result
-            
-        elif input_type == "file":
-            # Save temp file
-            temp_input = None
-            file_ext = os.path.splitext(input_content.name.lower())[1]
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-                temp_file.write(input_content.getvalue())
-                temp_input = temp_file.name
-            
-            # Check if PDF is supported
-            if file_ext == '.pdf' and not pdf_support:
-                st.error("PDF support is not available in this deployment.")
-                if temp_input and os.path.exists(temp_input):
-                    os.unlink(temp_input)
-                return None
-            
-            # Use the existing function to copy document to template
-            result = copy_document_to_template(
-                temp_input,
-                template_path=template_path,
-                output_filename=output_filename
-            )
-            
-            # Clean up temp input file
-            if temp_input and os.path.exists(temp_input):
-                os.unlink(temp_input)
-                
-            return result
+    elif input_type == "file":
+        file_ext = os.path.splitext(input_content.name.lower())[1]
+        
+        # Check if PDF is supported
+        if file_ext == '.pdf' and not pdf_support:
+            st.error("PDF support is not available in this deployment.")
+            return None
+        
+        # Hand the upload buffer straight to the parser, no temp copy needed
+        result = generate_from_document(
+            input_content.getbuffer(),
+            template_path=template_path,
+            output_dir=output_dir,
+            source_name=input_content.name,
+            page_texts=page_texts,
+            control=start_progress(input_type),
+            **(import_options or {})
+        )
     
-    except Exception as e:
-        st.error(f"Error processing document: {str(e)}")
-        import traceback
-        st.error(traceback.format_exc())
+    elif input_type == "merge":
+        cover_text, uploaded_files = input_content
+        if not pdf_support and any(f.name.lower().endswith('.pdf') for f in uploaded_files):
+            st.error("PDF support is not available in this deployment.")
+            return None
+        
+        # Parts are created only as the merge reaches them, so each upload buffer is
+        # handed over (and let go) one at a time; the template is loaded once
+        def parts():
+            if cover_text.strip():
+                yield MergePart.from_text(cover_text)
+            for uploaded_file in uploaded_files:
+                yield MergePart(uploaded_file.getbuffer(), source_name=uploaded_file.name)
+        
+        result = generate_merged(parts(), template_path=template_path, output_dir=output_dir,
+                                 control=start_progress(input_type))
+    
+    else:
+        return None
+    
+    if not result.ok:
+        st.error(f"Error processing document ({result.error.stage}): {str(result.error)}")
         return None
+    return result.output_path
 
 # Main UI
 st.markdown("<div class='info-box'>", unsafe_allow_html=True)
@@ -245,8 +280,11 @@ st.markdown("""
 """)
 st.markdown("</div>", unsafe_allow_html=True)
 
-# Create tabs for different input methods
-tab1, tab2 = st.tabs(["Enter Text", "Upload Document"])
+# Create tabs for different input methods (plus the operators' metrics page if enabled)
+tab_names = ["Enter Text", "Upload Document", "Merge Documents"]
+if admin_page_enabled():
+    tab_names.append("Metrics")
+tab1, tab2, tab3, *admin_tab = st.tabs(tab_names)
 
 with tab1:
     st.write("Enter your document text below:")
@@ -269,25 +307,25 @@ with tab1:
     if st.button("Generate Formatted Document", key="text_button"):
         if text_input:
             with st.spinner(f"Formatting document using {st.session_state.template_info}..."):
-                result = process_document("text", text_input)
-                
-                if result:
-                    with open(result, "rb") as file:
-                        # Provide download button
-                        st.download_button(
-                            label="Download Formatted Document",
-                            data=file,
-                            file_name=output_name,
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                        )
-                    
-                    # Clean up temp file after download offered
-                    try:
-                        os.unlink(result)
-                    except:
-                        pass
+                try:
+                    # The output is removed with its scratch directory once the download is offered
+                    with get_scratch().job_dir(
+                            "text", estimate_job_bytes(st.session_state.template_path, text_input)) as job_dir:
+                        result = process_document("text", text_input, job_dir)
                         
-                    st.success(f"Document formatted successfully using {st.session_state.template_info}!")
+                        if result:
+                            with open(result, "rb") as file:
+                                # Provide download button
+                                st.download_button(
+                                    label="Download Formatted Document",
+                                    data=file,
+                                    file_name=output_name,
+                                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                                )
+                            
+                            st.success(f"Document formatted successfully using {st.session_state.template_info}!")
+                except ScratchQuotaExceeded as e:
+                    st.error(str(e))
         else:
             st.warning("Please enter some text first")
 
@@ -312,6 +350,78 @@ with tab2:
         with col2:
             st.write("File size:", f"{uploaded_file.size / 1024:.1f} KB")
     
+    # Lazy preview: only the requested page is extracted and sent to the browser
+    preview = None
+    if uploaded_file is not None:
+        preview_key = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+        if st.session_state.get("preview_key") != preview_key:
+            st.session_state.preview_key = preview_key
+            st.session_state.preview = DocumentPreview(uploaded_file.name)
+        preview = st.session_state.preview
+        
+        if st.checkbox("Show document content preview", key="file_preview"):
+            try:
+                source_buffer = uploaded_file.getbuffer()
+                page_count = preview.page_count(source_buffer)
+                if page_count is not None:
+                    page_number = st.number_input(
+                        f"Preview page (of {page_count}):",
+                        min_value=1, max_value=max(page_count, 1), value=1, step=1,
+                        key="preview_page"
+                    )
+                else:
+                    page_number = st.number_input(
+                        "Preview screen:", min_value=1, value=1, step=1, key="preview_page",
+                        help="Each screen shows the next block of paragraphs"
+                    )
+                preview_text = preview.get_page(source_buffer, int(page_number))
+                if preview_text:
+                    st.text_area("Document content:", preview_text, height=200, disabled=True)
+                else:
+                    st.warning("No text found on this page.")
+            except Exception as e:
+                st.warning(f"Could not extract text from the document: {str(e)}")
+    
+    # Range-selective import: only the chosen pages/paragraphs are processed
+    import_options = {}
+    range_error = None
+    if uploaded_file is not None:
+        with st.expander("Import only part of the document"):
+            if uploaded_file.name.lower().endswith('.pdf'):
+                page_spec = st.text_input(
+                    "Pages to import:",
+                    key="import_pages",
+                    help="Page numbers or ranges, e.g. 12-40, 45 or 50- (leave blank for all pages)"
+                )
+                if page_spec.strip():
+                    import_options["pages"] = page_spec
+            else:
+                paragraph_spec = st.text_input(
+                    "Paragraphs to import:",
+                    key="import_paragraphs",
+                    help="Non-empty paragraph numbers or ranges, e.g. 5-20 (leave blank for all)"
+                )
+                col1, col2 = st.columns(2)
+                with col1:
+                    start_heading = st.text_input("Start at heading:", key="import_start_heading")
+                with col2:
+                    end_heading = st.text_input("Stop before heading:", key="import_end_heading")
+                if paragraph_spec.strip():
+                    import_options["paragraphs"] = paragraph_spec
+                if start_heading.strip():
+                    import_options["start_heading"] = start_heading
+                if end_heading.strip():
+                    import_options["end_heading"] = end_heading
+        
+        for key in ("pages", "paragraphs"):
+            if key in import_options:
+                try:
+                    parse_range_spec(import_options[key])
+                except ValueError as e:
+                    range_error = str(e)
+        if range_error:
+            st.error(range_error)
+    
     output_name = st.text_input(
         "Output filename:", 
         value="formatted_document.docx", 
@@ -324,30 +434,161 @@ with tab2:
         output_name += '.docx'
     
     if st.button("Generate Formatted Document", key="file_button"):
-        if uploaded_file is not None:
+        if uploaded_file is not None and range_error:
+            st.warning("Please fix the import range first")
+        elif uploaded_file is not None:
             with st.spinner(f"Formatting document using {st.session_state.template_info}..."):
-                result = process_document("file", uploaded_file)
-                
-                if result:
-                    with open(result, "rb") as file:
-                        # Provide download button
-                        st.download_button(
-                            label="Download Formatted Document",
-                            data=file,
-                            file_name=output_name,
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                        )
-                    
-                    # Clean up temp file after download offered
-                    try:
-                        os.unlink(result)
-                    except:
-                        pass
+                try:
+                    # The output is removed with its scratch directory once the download is offered
+                    with get_scratch().job_dir(
+                            "file", estimate_job_bytes(st.session_state.template_path, uploaded_file.size)) as job_dir:
+                        result = process_document("file", uploaded_file, job_dir, import_options=import_options, page_texts=preview.page_texts)
                         
-                    st.success(f"Document formatted successfully using {st.session_state.template_info}!")
+                        if result:
+                            with open(result, "rb") as file:
+                                # Provide download button
+                                st.download_button(
+                                    label="Download Formatted Document",
+                                    data=file,
+                                    file_name=output_name,
+                                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                                )
+                            
+                            st.success(f"Document formatted successfully using {st.session_state.template_info}!")
+                except ScratchQuotaExceeded as e:
+                    st.error(str(e))
         else:
             st.warning("Please upload a file first")
 
+with tab3:
+    st.markdown(f"**Template: {st.session_state.template_info}**")
+    st.write("Combine a cover letter, Word annexes and PDF appendices into one formatted document. "
+             "The text comes first, then the files in the order they were uploaded; each part starts on a new page.")
+    
+    merge_text = st.text_area(
+        "Cover letter text (optional):",
+        height=200,
+        key="merge_text",
+        help="Formatted with the same heading detection as the Enter Text tab"
+    )
+    merge_files = st.file_uploader(
+        "Choose the documents to append",
+        type=["docx", "pdf"] if pdf_support else ["docx"],
+        accept_multiple_files=True,
+        key="merge_files"
+    )
+    if merge_files:
+        for position, merge_file in enumerate(merge_files, start=1):
+            st.write(f"{position}. {merge_file.name} ({merge_file.size / 1024:.1f} KB)")
+    
+    merge_output_name = st.text_input(
+        "Output filename:",
+        value="merged_document.docx",
+        key="merge_output_name",
+        help="Name of the output document file (will be appended with .docx if not included)"
+    )
+    
+    # Ensure output filename has .docx extension
+    if not merge_output_name.lower().endswith('.docx'):
+        merge_output_name += '.docx'
+    
+    if st.button("Generate Merged Document", key="merge_button"):
+        if merge_text.strip() or merge_files:
+            with st.spinner(f"Merging documents using {st.session_state.template_info}..."):
+                try:
+                    # The output is removed with its scratch directory once the download is offered
+                    with get_scratch().job_dir("merge", estimate_job_bytes(
+                            st.session_state.template_path, merge_text, *(f.size for f in merge_files or []))) as job_dir:
+                        result = process_document("merge", (merge_text, merge_files or []), job_dir)
+                        
+                        if result:
+                            with open(result, "rb") as file:
+                                # Provide download button
+                                st.download_button(
+                                    label="Download Merged Document",
+                                    data=file,
+                                    file_name=merge_output_name,
+                                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                                )
+                            
+                            st.success(f"Documents merged successfully using {st.session_state.template_info}!")
+                except ScratchQuotaExceeded as e:
+                    st.error(str(e))
+        else:
+            st.warning("Please enter some text or upload at least one document first")
+
+def show_metrics_page():
+    """Live view of this server process's metrics registry."""
+    import pandas as pd
+    
+    registry = get_registry()
+    metrics = {metric.name: metric for metric in registry.collect()}
+    
+    def total(name):
+        metric = metrics.get(name)
+        return sum(value for _, _, value in metric.samples()) if metric is not None else 0
+    
+    def hit_rate(name):
+        metric = metrics.get(name)
+        return f"{total(name):.0%}" if metric is not None else "off"
+    
+    # Jobs run on the session threads of this process, or on the worker pool if one is running
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Active jobs", int(total("cybergen_jobs_active") + total("cybergen_pool_jobs_running")))
+    col2.metric("Queued jobs", int(total("cybergen_pool_jobs_queued")))
+    col3.metric("Process RSS", f"{total('cybergen_process_tree_resident_bytes') / (1024 * 1024):.0f} MB")
+    col4.metric("Template cache hits", hit_rate("cybergen_template_cache_hit_rate"))
+    col5.metric("PDF page cache hits", hit_rate("cybergen_pdf_page_cache_hit_rate"))
+    
+    st.subheader("Generation latency")
+    latency = metrics["cybergen_generation_seconds"]
+    label_sets = latency.label_sets()
+    if not label_sets:
+        st.info("No documents have been generated by this server process yet.")
+    else:
+        rows = []
+        for labels in label_sets:
+            _, seconds, count = latency.snapshot(**labels)
+            rows.append({
+                "Source type": labels["source_type"],
+                "Input size": labels["size"],
+                "Jobs": count,
+                "Mean (s)": round(seconds / count, 3),
+                "p50 (s)": round(latency.quantile(0.5, **labels), 3),
+                "p95 (s)": round(latency.quantile(0.95, **labels), 3),
+                "p99 (s)": round(latency.quantile(0.99, **labels), 3),
+            })
+        st.dataframe(pd.DataFrame(rows), hide_index=True)
+        
+        choice = st.selectbox(
+            "Histogram for",
+            range(len(label_sets)),
+            format_func=lambda index: f"{label_sets[index]['source_type']}, {label_sets[index]['size']}",
+            key="metrics_histogram"
+        )
+        counts, _, _ = latency.snapshot(**label_sets[choice])
+        bounds = [f"≤ {bound:g}s" for bound in latency.buckets[:-1]] + [f"> {latency.buckets[-2]:g}s"]
+        st.bar_chart(pd.DataFrame({"Jobs": counts}, index=pd.Index(bounds, name="Latency")))
+    
+    outcomes = metrics["cybergen_generation_jobs_total"]
+    outcome_rows = [dict(labels) | {"Jobs": value} for _, labels, value in outcomes.samples()]
+    if outcome_rows:
+        st.subheader("Jobs by outcome")
+        st.dataframe(pd.DataFrame(outcome_rows), hide_index=True)
+    
+    st.button("Refresh", key="metrics_refresh")
+    
+    with st.expander("Prometheus export"):
+        exposition = registry.to_prometheus()
+        st.download_button("Download metrics.prom", data=exposition, file_name="metrics.prom", mime="text/plain")
+        st.code(exposition, language="text")
+        st.caption("Set CYBERGEN_METRICS_PORT to serve /metrics, or CYBERGEN_METRICS_FILE to write this file "
+                   "periodically for node_exporter's textfile collector.")
+
+if admin_tab:
+    with admin_tab[0]:
+        show_metrics_page()
+
 # App footer
 st.markdown("---")
 st.markdown(
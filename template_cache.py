@@ -0,0 +1,114 @@
+import copy
+import os
+import threading
+
+import docx
+
+from template_compiler import load_compiled_template
+
+
+class TemplateCache:
+    """
+    Per-process cache of parsed template documents.
+
+    Each template is loaded once, from its precompiled artifact when
+    CYBERGEN_TEMPLATE_ARTIFACTS is not set to "off" (see template_compiler), or by
+    parsing the .docx. Callers get a deep copy of the loaded prototype,
+    which is several times cheaper than parsing the .docx again. An entry is
+    reloaded automatically when the template file's size or modification time
+    changes. Prototypes are only ever read, so copies can be taken from several
+    threads at once, and a cache populated before forking is shared copy-on-write
+    by the child processes.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _prototype(self, template_path):
+        key = os.path.abspath(template_path)
+        stat = os.stat(key)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # Load outside the lock so other templates are not held up
+        if os.environ.get("CYBERGEN_TEMPLATE_ARTIFACTS", "").lower() in ("0", "off", "false", "no"):
+            prototype = docx.Document(key)
+        else:
+            prototype = load_compiled_template(key)
+        with self._lock:
+            self._entries[key] = (signature, prototype)
+        return prototype
+
+    def load(self, template_path):
+        """
+        Return a fresh, independently modifiable copy of a template document.
+
+        Args:
+            template_path (str): Path to the template document
+
+        Returns:
+            docx.Document: A private copy of the parsed template
+        """
+        if not os.path.exists(template_path):
+            raise FileNotFoundError(f"Template file not found: {template_path}")
+        return copy.deepcopy(self._prototype(template_path))
+
+    def preload(self, template_paths):
+        """
+        Parse templates ahead of time, e.g. in a parent process before forking workers.
+
+        Args:
+            template_paths: Iterable of template paths
+        """
+        for template_path in template_paths:
+            self._prototype(template_path)
+
+    def clear(self):
+        """Drop every cached template and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """
+        Report cache counters.
+
+        Returns:
+            dict: hits, misses, hit_rate and the number of cached templates
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "templates": len(self._entries),
+            }
+
+
+_default_cache = TemplateCache()
+
+
+def get_template_cache():
+    """Return the process-wide template cache."""
+    return _default_cache
+
+
+def load_template(template_path):
+    """
+    Load a template through the process-wide cache.
+
+    Args:
+        template_path (str): Path to the template document
+
+    Returns:
+        docx.Document: A private copy of the parsed template
+    """
+    return _default_cache.load(template_path)
@@ -0,0 +1,281 @@
+import hashlib
+import hmac
+import io
+import os
+import pickle
+import secrets
+import sys
+import tempfile
+import threading
+
+import docx
+from docx.oxml import parse_xml
+from lxml import etree
+
+ARTIFACT_SUFFIX = ".cgt"
+ARTIFACT_FORMAT = 2
+ARTIFACT_MAGIC = b"CGT2"
+# Artifacts are pickles, so they live in a directory only this user can write and
+# carry an HMAC under a private per-install key, checked before anything is unpickled
+DEFAULT_ARTIFACT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cybergen", "templates")
+DEFAULT_KEY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "cybergen", "template-artifacts.key")
+KEY_BYTES = 32
+MAC_BYTES = hashlib.sha256().digest_size
+
+_key = None
+_key_lock = threading.Lock()
+
+
+class ArtifactKeyError(OSError):
+    """Raised when the artifact key is missing and cannot be created, or is not private."""
+
+
+class _TemplatePickler(pickle.Pickler):
+    """Pickler that stores each XML part as serialized bytes, re-parsed with python-docx's parser on load."""
+
+    def reducer_override(self, obj):
+        if isinstance(obj, etree._Element):
+            if obj.getparent() is not None:
+                # Only part roots may be referenced, otherwise identity would not survive the round trip
+                raise pickle.PicklingError("Template holds a reference to a non-root XML element")
+            return parse_xml, (etree.tostring(obj),)
+        return NotImplemented
+
+
+def prepare_template(doc):
+    """
+    Apply the page setup every generated document uses, so it is stored in the artifact.
+
+    Args:
+        doc: The parsed template document
+    """
+    # Imported here because cybergen_template depends on this module
+    from cybergen_template import set_document_margins
+    set_document_margins(doc, top=1.5, bottom=1.5)
+
+
+def artifact_key():
+    """
+    The per-install key that authenticates compiled artifacts, created on first use.
+
+    The key file (CYBERGEN_TEMPLATE_ARTIFACT_KEY, default ~/.cache/cybergen/template-artifacts.key)
+    is created with mode 0600 and must stay private to this user.
+
+    Returns:
+        bytes: The key
+
+    Raises:
+        ArtifactKeyError: If the key cannot be created or is readable or writable by others
+    """
+    global _key
+    with _key_lock:
+        if _key is not None:
+            return _key
+        path = os.environ.get("CYBERGEN_TEMPLATE_ARTIFACT_KEY") or DEFAULT_KEY_PATH
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                pass
+            else:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(secrets.token_bytes(KEY_BYTES))
+            stat = os.stat(path)
+            if os.name != "nt" and (stat.st_uid != os.geteuid() or stat.st_mode & 0o077):
+                raise ArtifactKeyError(f"{path} must be owned by this user and private to it (mode 0600)")
+            with open(path, "rb") as file:
+                key = file.read()
+        except ArtifactKeyError:
+            raise
+        except OSError as e:
+            raise ArtifactKeyError(f"Cannot use the template artifact key {path}: {e}")
+        if len(key) < KEY_BYTES:
+            raise ArtifactKeyError(f"{path} does not hold a valid key")
+        _key = key
+        return key
+
+
+def _mac(payload):
+    return hmac.new(artifact_key(), payload, hashlib.sha256).digest()
+
+
+def artifact_path_for(template_path):
+    """
+    Location of the compiled artifact for a template.
+
+    Artifacts are kept in a private cache directory (~/.cache/cybergen/templates, or
+    CYBERGEN_TEMPLATE_ARTIFACT_DIR), never next to the template, whose folder may be
+    writable by others (e.g. uploaded templates in scratch storage).
+
+    Args:
+        template_path (str): Path to the .docx template
+
+    Returns:
+        str: Path of the artifact file
+    """
+    artifact_dir = os.environ.get("CYBERGEN_TEMPLATE_ARTIFACT_DIR") or DEFAULT_ARTIFACT_DIR
+    source_id = hashlib.sha1(os.path.abspath(template_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(artifact_dir, f"{os.path.basename(template_path)}-{source_id}{ARTIFACT_SUFFIX}")
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _header_for(template_path, sha256=None):
+    stat = os.stat(template_path)
+    return {
+        "format": ARTIFACT_FORMAT,
+        "python": sys.version_info[:2],
+        "python_docx": getattr(docx, "__version__", None),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256 or _file_sha256(template_path),
+    }
+
+
+def compile_template(template_path, artifact_path=None):
+    """
+    Compile a .docx template into a preprocessed artifact.
+
+    The artifact holds the fully parsed package with the CyberGen margins already
+    applied, so loading it skips unzipping, content-type and relationship parsing
+    and the page setup. A header records the source's size, mtime and SHA-256 so a
+    changed template is detected and recompiled. The whole artifact is signed with
+    an HMAC under artifact_key(), so only artifacts written by this install load.
+
+    Args:
+        template_path (str): Path to the .docx template
+        artifact_path (str): Where to write the artifact (default: artifact_path_for(template_path))
+
+    Returns:
+        str: Path of the written artifact
+    """
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"Template file not found: {template_path}")
+    artifact_path = artifact_path or artifact_path_for(template_path)
+
+    header = _header_for(template_path)
+    doc = docx.Document(template_path)
+    prepare_template(doc)
+
+    buffer = io.BytesIO()
+    pickle.dump(header, buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    _TemplatePickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(doc)
+    payload = buffer.getvalue()
+    mac = _mac(payload)
+
+    directory = os.path.dirname(os.path.abspath(artifact_path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    fd, partial_path = tempfile.mkstemp(prefix=".cgt-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(ARTIFACT_MAGIC)
+            file.write(mac)
+            file.write(payload)
+        os.replace(partial_path, artifact_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+    return artifact_path
+
+
+def _artifact_is_current(header, template_path):
+    if (header.get("format") != ARTIFACT_FORMAT
+            or tuple(header.get("python", ())) != sys.version_info[:2]
+            or header.get("python_docx") != getattr(docx, "__version__", None)):
+        return False
+    stat = os.stat(template_path)
+    if header.get("size") != stat.st_size:
+        return False
+    if header.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    # Touched but possibly unchanged: compare contents before throwing the artifact away
+    return header.get("sha256") == _file_sha256(template_path)
+
+
+def _read_artifact(artifact_path):
+    """
+    Return the header and payload stream of an artifact whose HMAC checks out.
+
+    Nothing is unpickled before the signature is verified; a file that is not a
+    signed artifact of this install raises pickle.UnpicklingError.
+    """
+    with open(artifact_path, "rb") as file:
+        data = file.read()
+    prefix = len(ARTIFACT_MAGIC)
+    if data[:prefix] != ARTIFACT_MAGIC or len(data) < prefix + MAC_BYTES:
+        raise pickle.UnpicklingError("Not a compiled template artifact")
+    mac, payload = data[prefix:prefix + MAC_BYTES], data[prefix + MAC_BYTES:]
+    if not hmac.compare_digest(mac, _mac(payload)):
+        raise pickle.UnpicklingError("Compiled template artifact failed authentication")
+    stream = io.BytesIO(payload)
+    return pickle.load(stream), stream
+
+
+def load_compiled_template(template_path, artifact_path=None, auto_compile=True):
+    """
+    Load a template from its compiled artifact, (re)compiling it when missing or stale.
+
+    Falls back to parsing the .docx directly if no artifact can be read or written,
+    or if the artifact key is unusable. Artifacts are pickles: one that does not carry
+    a valid HMAC under this install's key is never unpickled, and is recompiled.
+
+    Args:
+        template_path (str): Path to the .docx template
+        artifact_path (str): Artifact location (default: artifact_path_for(template_path))
+        auto_compile (bool): Compile the artifact if it is missing or out of date
+
+    Returns:
+        docx.Document: The prepared template document
+    """
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"Template file not found: {template_path}")
+    artifact_path = artifact_path or artifact_path_for(template_path)
+
+    try:
+        header, stream = _read_artifact(artifact_path)
+        if _artifact_is_current(header, template_path):
+            return pickle.load(stream)
+    except ArtifactKeyError:
+        auto_compile = False
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError):
+        pass
+
+    if auto_compile:
+        try:
+            compile_template(template_path, artifact_path)
+            return pickle.load(_read_artifact(artifact_path)[1])
+        except (OSError, pickle.PicklingError, pickle.UnpicklingError):
+            pass
+
+    doc = docx.Document(template_path)
+    prepare_template(doc)
+    return doc
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Compile .docx templates into fast-loading artifacts")
+    parser.add_argument("templates", nargs="+", help="template documents to compile")
+    parser.add_argument("-o", "--output", help="artifact path (only with a single template)")
+    args = parser.parse_args()
+    if args.output and len(args.templates) > 1:
+        parser.error("--output can only be used with a single template")
+
+    for template in args.templates:
+        path = compile_template(template, args.output)
+        started = time.perf_counter()
+        load_compiled_template(template, path, auto_compile=False)
+        compiled_time = time.perf_counter() - started
+        started = time.perf_counter()
+        docx.Document(template)
+        parse_time = time.perf_counter() - started
+        print(f"{template} -> {path} (load {compiled_time * 1000:.1f} ms vs {parse_time * 1000:.1f} ms parsing the .docx)")
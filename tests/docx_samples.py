@@ -0,0 +1,35 @@
+"""Small images and Word documents built on the fly for the tests."""
+import io
+import struct
+import zlib
+
+import docx
+
+
+def png(rgb):
+    """A 1x1 PNG of one colour."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    pixels = zlib.compress(b"\x00" + bytes(rgb))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", pixels) + chunk(b"IEND", b""))
+
+
+def docx_bytes(document):
+    """Serialize a python-docx Document."""
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def word_source():
+    """A Word document with a paragraph, a table and an image."""
+    document = docx.Document()
+    document.add_paragraph("Opening paragraph")
+    table = document.add_table(rows=2, cols=2)
+    for row in range(2):
+        for col in range(2):
+            table.cell(row, col).text = f"cell {row}{col}"
+    document.add_paragraph().add_run().add_picture(io.BytesIO(png((0, 128, 0))))
+    document.add_paragraph("Closing paragraph")
+    return docx_bytes(document)
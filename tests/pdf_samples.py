@@ -0,0 +1,66 @@
+"""Minimal hand-built PDFs for the tests."""
+
+
+def build_pdf(objects):
+    """
+    Serialize numbered objects into a PDF with a valid cross-reference table.
+
+    Args:
+        objects (list): Object bodies (bytes) for objects 1..n; object 1 is the catalog
+
+    Returns:
+        bytes: The PDF file
+    """
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def stream(data, extra=b""):
+    return b"<< /Length %d %s>>\nstream\n" % (len(data), extra) + data + b"\nendstream"
+
+
+def text_pdf(pages):
+    """A PDF whose pages each show one line of text with Helvetica."""
+    count = len(pages)
+    kids = b" ".join(b"%d 0 R" % (4 + 2 * index) for index in range(count))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, count),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for index, text in enumerate(pages):
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % (5 + 2 * index))
+        objects.append(stream(b"BT /F1 12 Tf 72 700 Td (%s) Tj ET" % text.encode("latin-1")))
+    return build_pdf(objects)
+
+
+def form_xobject_pdf(first_text, second_text):
+    """
+    Two pages with the very same content stream (`/Fm0 Do`), each drawing a
+    different Form XObject that holds its text.
+    """
+    draw = b"BT /F1 12 Tf 72 700 Td (%s) Tj ET"
+    return build_pdf([
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 5 0 R "
+        b"/Resources << /XObject << /Fm0 6 0 R >> >> >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 5 0 R "
+        b"/Resources << /XObject << /Fm0 7 0 R >> >> >>",
+        stream(b"q /Fm0 Do Q"),
+        stream(draw % first_text.encode("latin-1"),
+               b"/Type /XObject /Subtype /Form /BBox [0 0 612 792] /Resources << /Font << /F1 8 0 R >> >> "),
+        stream(draw % second_text.encode("latin-1"),
+               b"/Type /XObject /Subtype /Form /BBox [0 0 612 792] /Resources << /Font << /F1 8 0 R >> >> "),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ])
@@ -0,0 +1,51 @@
+import os
+
+from batch import estimate_job_cost, run_batch, schedule_longest_first, simulate_makespan
+from pdf_samples import text_pdf
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cybergen-template.docx")
+
+
+def test_longest_first_assigns_each_job_to_the_least_loaded_worker():
+    order, loads, makespan = schedule_longest_first([5, 4, 3, 2, 1], 2)
+    assert order == [0, 1, 2, 3, 4]
+    assert loads == [8, 7] and makespan == 8
+
+    order, loads, makespan = schedule_longest_first([1, 1, 1, 1, 4], 2)
+    assert order[0] == 4
+    assert sorted(loads) == [4, 4] and makespan == 4
+
+
+def test_longest_first_beats_input_order_on_a_late_long_job():
+    costs = [1, 1, 1, 1, 4]
+    order, _, predicted = schedule_longest_first(costs, 2)
+    assert simulate_makespan(costs, order, 2) == predicted == 4
+    assert simulate_makespan(costs, list(range(len(costs))), 2) == 6
+    assert simulate_makespan([], [], 3) == 0
+
+
+def test_pdf_cost_grows_with_the_page_count(tmp_path):
+    short, long = tmp_path / "short.pdf", tmp_path / "long.pdf"
+    short.write_bytes(text_pdf(["ONE"]))
+    long.write_bytes(text_pdf([f"PAGE {number}" for number in range(20)]))
+    assert estimate_job_cost(str(long)) > estimate_job_cost(str(short))
+
+
+def test_batch_reports_pool_utilization_and_resumes(tmp_path):
+    sources = []
+    for number, pages in enumerate((1, 6, 3)):
+        path = tmp_path / f"source{number}.pdf"
+        path.write_bytes(text_pdf([f"SOURCE {number} PAGE {page}" for page in range(pages)]))
+        sources.append(str(path))
+    manifest = str(tmp_path / "manifest.jsonl")
+
+    report = run_batch(sources, str(tmp_path / "out"), TEMPLATE, workers=2, manifest_path=manifest)
+    assert all(result.ok for result in report.results)
+    assert [os.path.basename(result.output_path) for result in report.results] == [
+        "source0.docx", "source1.docx", "source2.docx"]
+    assert report.workers == 2
+    assert 0 < report.utilization() <= 1
+    assert "2 workers busy" in report.summary()
+
+    resumed = run_batch(sources, str(tmp_path / "out"), TEMPLATE, workers=2, manifest_path=manifest)
+    assert resumed.skipped == 3 and resumed.busy_time == 0
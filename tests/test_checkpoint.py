@@ -0,0 +1,51 @@
+import json
+
+from checkpoint import DONE, FAILED, CheckpointManifest
+
+ERROR = {"message": "boom", "stage": "import", "kind": "ValueError"}
+
+
+def test_torn_last_line_is_dropped_and_appends_start_clean(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    output = tmp_path / "a.docx"
+    output.write_bytes(b"done")
+    with CheckpointManifest(path) as manifest:
+        manifest.record("a.pdf", "hash-a", "tpl", str(output), DONE)
+        manifest.record("b.pdf", "hash-b", "tpl", str(tmp_path / "b.docx"), FAILED, ERROR)
+    intact = open(path, "rb").read()
+    # A crash mid-write leaves half a record without its newline
+    with open(path, "ab") as file:
+        file.write(b'{"source": "c.pdf", "hash": "hash-c", "tem')
+
+    with CheckpointManifest(path) as manifest:
+        assert manifest.is_done("hash-a", "tpl", str(output))
+        failed = manifest.entry("hash-b", "tpl", str(tmp_path / "b.docx"))
+        assert (failed.status, failed.failures, failed.error) == (FAILED, 1, ERROR)
+        assert manifest.entry("hash-c", "tpl", str(tmp_path / "c.docx")) is None
+        assert open(path, "rb").read() == intact
+        manifest.record("c.pdf", "hash-c", "tpl", str(tmp_path / "c.docx"), DONE)
+
+    lines = open(path, "rb").read().splitlines()
+    assert len(lines) == 3
+    assert [json.loads(line)["hash"] for line in lines] == ["hash-a", "hash-b", "hash-c"]
+    with CheckpointManifest(path) as manifest:
+        assert manifest.entry("hash-c", "tpl", str(tmp_path / "c.docx")).status == DONE
+
+
+def test_batched_fsyncs(tmp_path):
+    with CheckpointManifest(str(tmp_path / "manifest.jsonl"), sync_every=4, sync_interval=3600) as manifest:
+        for index in range(10):
+            manifest.record(f"{index}.pdf", f"hash-{index}", "tpl", str(tmp_path / f"{index}.docx"), DONE)
+        assert manifest.syncs == 2
+    assert manifest.syncs == 3
+
+
+def test_idle_sync_flushes_the_tail_of_a_burst(tmp_path):
+    with CheckpointManifest(str(tmp_path / "manifest.jsonl"), sync_every=100, sync_interval=3600) as manifest:
+        manifest.record("a.pdf", "hash-a", "tpl", str(tmp_path / "a.docx"), DONE)
+        assert manifest.syncs == 0
+        # What an owner does when nothing has finished for sync_interval seconds
+        manifest.sync()
+        assert manifest.syncs == 1
+        manifest.sync()
+        assert manifest.syncs == 1
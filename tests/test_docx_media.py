@@ -0,0 +1,45 @@
+import copy
+import io
+
+import docx
+
+from docx_media import WP_DOCPR, MediaTransfer
+from docx_samples import docx_bytes, png
+
+
+def _docpr_ids(element):
+    return [docpr.get("id") for docpr in element.iter(WP_DOCPR)]
+
+
+def test_imported_drawings_do_not_reuse_header_ids():
+    template = docx.Document()
+    template.sections[0].header.paragraphs[0].add_run().add_picture(io.BytesIO(png((255, 0, 0))))
+    header_ids = _docpr_ids(template.sections[0].header._element)
+    assert header_ids
+
+    source = docx.Document()
+    source.add_paragraph().add_run().add_picture(io.BytesIO(png((0, 0, 255))))
+    drawing = next(source.element.body.iter(WP_DOCPR)).getparent().getparent()
+
+    with MediaTransfer(template, docx_bytes(source)) as media:
+        imported = copy.deepcopy(drawing)
+        assert media.import_element(imported)
+        assert media.parts_added == 1
+
+    assert not set(_docpr_ids(imported)) & set(header_ids)
+
+
+def test_media_already_in_the_template_is_reused():
+    logo = png((0, 0, 255))
+    template = docx.Document()
+    template.sections[0].header.paragraphs[0].add_run().add_picture(io.BytesIO(logo))
+    parts_before = len(list(template.part.package.iter_parts()))
+    source = docx.Document()
+    source.add_paragraph().add_run().add_picture(io.BytesIO(logo))
+    drawing = next(source.element.body.iter(WP_DOCPR)).getparent().getparent()
+
+    with MediaTransfer(template, docx_bytes(source)) as media:
+        assert media.import_element(copy.deepcopy(drawing))
+
+    assert (media.parts_added, media.parts_reused) == (0, 1)
+    assert len(list(template.part.package.iter_parts())) == parts_before
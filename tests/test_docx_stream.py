@@ -0,0 +1,52 @@
+import io
+
+import docx
+from docx.enum.text import WD_BREAK, WD_UNDERLINE
+from docx.oxml import parse_xml
+
+from docx_stream import SourceTable, iter_docx_blocks, iter_docx_paragraphs
+
+
+def _sample_docx():
+    document = docx.Document()
+    document.add_heading("Title", level=1)
+    paragraph = document.add_paragraph("plain ")
+    paragraph.add_run("bold").bold = True
+    paragraph.add_run(" not bold").bold = False
+    paragraph.add_run(" italic").italic = True
+    paragraph.add_run(" double").underline = WD_UNDERLINE.DOUBLE
+    paragraph.add_run(" single").underline = True
+    run = paragraph.add_run("tab\tthen")
+    run.add_break()
+    run.add_text("wrapped")
+    run.add_break(WD_BREAK.PAGE)
+    run.add_text("after page break")
+    linked = document.add_paragraph("see ")
+    linked._p.append(parse_xml(
+        '<w:hyperlink xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        '<w:r><w:t>the link</w:t></w:r></w:hyperlink>'))
+    table = document.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "in a table"
+    document.add_paragraph("")
+    document.add_paragraph("last")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def _summary(paragraph):
+    return paragraph.text, [(run.text, run.bold, run.italic, run.underline) for run in paragraph.runs]
+
+
+def test_streamed_paragraphs_match_python_docx():
+    data = _sample_docx()
+    expected = [_summary(paragraph) for paragraph in docx.Document(io.BytesIO(data)).paragraphs]
+    streamed = [_summary(paragraph) for paragraph in iter_docx_paragraphs(data)]
+    assert streamed == expected
+    assert ("see the link", [("see ", None, None, None)]) in streamed
+
+
+def test_blocks_keep_tables_in_document_order():
+    blocks = list(iter_docx_blocks(_sample_docx()))
+    kinds = ["table" if isinstance(block, SourceTable) else block.text for block in blocks]
+    assert kinds[2:] == ["see the link", "table", "", "last"]
@@ -0,0 +1,76 @@
+import os
+
+import docx
+from docx.oxml import parse_xml
+
+from equivalence import GateReport, canonicalize_document, corpus_items, diff_documents, run_gate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def _save(path, *run_groups):
+    """A document with one paragraph per group of (text, bold) runs."""
+    document = docx.Document()
+    for runs in run_groups:
+        paragraph = document.add_paragraph()
+        for text, bold in runs:
+            paragraph.add_run(text).bold = bold
+    document.save(str(path))
+    return document
+
+
+def test_run_splitting_and_editing_noise_are_ignored(tmp_path):
+    _save(tmp_path / "one.docx", [("Hello world", True)], [("plain", None)])
+    document = docx.Document()
+    paragraph = document.add_paragraph()
+    paragraph.add_run("Hello ").bold = True
+    paragraph._p.append(parse_xml(f'<w:proofErr {W} w:type="spellStart"/>'))
+    paragraph.add_run("world").bold = True
+    paragraph._p.set("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rsidR", "00AB12CD")
+    document.add_paragraph("plain")
+    document.save(str(tmp_path / "split.docx"))
+
+    assert canonicalize_document(str(tmp_path / "one.docx")) == canonicalize_document(str(tmp_path / "split.docx"))
+    assert diff_documents(str(tmp_path / "one.docx"), str(tmp_path / "split.docx")) == []
+
+
+def test_text_and_formatting_changes_are_reported(tmp_path):
+    _save(tmp_path / "reference.docx", [("Hello world", True)])
+    _save(tmp_path / "text.docx", [("Hello there", True)])
+    _save(tmp_path / "format.docx", [("Hello world", None)])
+
+    text_diff = diff_documents(str(tmp_path / "reference.docx"), str(tmp_path / "text.docx"))
+    assert any(line.startswith("-") and "Hello world" in line for line in text_diff)
+    assert any(line.startswith("+") and "Hello there" in line for line in text_diff)
+    assert diff_documents(str(tmp_path / "reference.docx"), str(tmp_path / "format.docx"))
+
+
+def _item(equivalent, reference, candidate):
+    return {"source": "input", "kind": "text", "equivalent": equivalent, "diff": [],
+            "reference": {"seconds": reference[0], "memory": reference[1], "error": None},
+            "candidate": {"seconds": candidate[0], "memory": candidate[1], "error": None}}
+
+
+def test_gate_passes_when_faster_or_lighter():
+    faster = GateReport([_item(True, (2.0, 100), (1.0, 100))], 1.5, 1.5)
+    assert faster.speedup == 2.0 and faster.passed
+    lighter = GateReport([_item(True, (1.0, 300), (1.0, 100))], 1.5, 1.5)
+    assert lighter.memory_saving == 3.0 and lighter.passed
+    neither = GateReport([_item(True, (1.0, 100), (1.0, 100))], 1.5, 1.5)
+    assert not neither.passed and "neither fast enough" in neither.summary()
+    different = GateReport([_item(False, (2.0, 300), (1.0, 100))], 1.5, 1.5)
+    assert not different.passed and "outputs differ" in different.summary()
+
+
+def test_gate_on_the_same_engine(tmp_path):
+    source = tmp_path / "input.txt"
+    source.write_text("**[Heading]{.underline}**\nSome *body* text.\n", encoding="utf-8")
+    corpus = corpus_items([str(tmp_path)])
+    assert corpus == [("text", str(source))]
+
+    report = run_gate(ROOT, ROOT, corpus, os.path.join(ROOT, "cybergen-template.docx"), repeat=1,
+                      min_speedup=None, min_memory_saving=None)
+    item = report.items[0]
+    assert item["reference"]["error"] is None and item["candidate"]["error"] is None
+    assert report.equivalent and report.passed
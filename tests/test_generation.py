@@ -0,0 +1,80 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import docx
+
+from cybergen_template import MergePart
+from docx_media import WP_DOCPR
+from docx_samples import word_source
+from generation import generate_from_document, generate_from_text, generate_merged
+from job_control import CancellationToken, JobControl
+from pdf_samples import text_pdf
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cybergen-template.docx")
+
+
+def _text(path):
+    return "\n".join(paragraph.text for paragraph in docx.Document(path).paragraphs)
+
+
+def test_word_import_carries_tables_and_images(tmp_path):
+    result = generate_from_document(word_source(), TEMPLATE, output_dir=str(tmp_path), source_name="source.docx")
+    result.raise_for_error()
+
+    output = docx.Document(result.output_path)
+    text = _text(result.output_path)
+    assert "Opening paragraph" in text and "Closing paragraph" in text
+    assert [[cell.text for cell in row.cells] for row in output.tables[-1].rows] == [
+        ["cell 00", "cell 01"], ["cell 10", "cell 11"]]
+    assert any(part.partname.startswith("/word/media/") and part.blob.startswith(b"\x89PNG")
+               for part in output.part.package.iter_parts())
+    ids = [docpr.get("id") for part in output.part.package.iter_parts() if hasattr(part, "element")
+           for docpr in part.element.iter(WP_DOCPR)]
+    assert len(ids) == len(set(ids))
+
+
+def test_merge_keeps_parts_in_order(tmp_path):
+    parts = iter([MergePart.from_text("Introduction from text"),
+                  MergePart(text_pdf(["PDF PAGE ONE", "PDF PAGE TWO"]), "report.pdf"),
+                  MergePart(word_source(), "appendix.docx")])
+    result = generate_merged(parts, TEMPLATE, output_dir=str(tmp_path))
+    result.raise_for_error()
+
+    text = _text(result.output_path)
+    positions = [text.index(marker) for marker in
+                 ("Introduction from text", "PDF PAGE ONE", "PDF PAGE TWO", "Opening paragraph")]
+    assert positions == sorted(positions)
+    assert [[cell.text for cell in row.cells] for row in docx.Document(result.output_path).tables[-1].rows] == [
+        ["cell 00", "cell 01"], ["cell 10", "cell 11"]]
+
+
+def test_cancelled_and_late_jobs_leave_no_output(tmp_path):
+    token = CancellationToken()
+    token.cancel()
+    cancelled = generate_from_text("Some text", TEMPLATE, output_dir=str(tmp_path), control=JobControl(token=token))
+    late = generate_from_document(text_pdf(["A PAGE"]), TEMPLATE, output_dir=str(tmp_path), source_name="a.pdf",
+                                  control=JobControl(timeout=0))
+
+    assert (cancelled.ok, cancelled.error.kind) == (False, "cancelled")
+    assert (late.ok, late.error.kind) == (False, "deadline")
+    assert os.listdir(tmp_path) == []
+
+
+def test_concurrent_generations_do_not_mix(tmp_path):
+    start = threading.Event()
+
+    def job(index):
+        start.wait()
+        return generate_from_text(f"Marker {index:03d} paragraph", TEMPLATE, output_dir=str(tmp_path))
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(job, index) for index in range(8)]
+        start.set()
+        results = [future.result() for future in futures]
+
+    assert len({result.output_path for result in results}) == 8
+    for index, result in enumerate(results):
+        text = _text(result.output_path)
+        markers = [marker for marker in range(8) if f"Marker {marker:03d}" in text]
+        assert markers == [index]
@@ -0,0 +1,63 @@
+import pytest
+
+from import_range import parse_range_spec, resolve_page_range, select_paragraphs
+
+
+class Para:
+    def __init__(self, text, has_content=False):
+        self.text = text
+        self.has_content = has_content
+
+
+def _texts(paragraphs):
+    return [para.text for para in paragraphs]
+
+
+def test_parse_range_spec():
+    assert parse_range_spec("12-40, 45,50-") == [(12, 40), (45, 45), (50, None)]
+    assert parse_range_spec(" 3 - 3 ,, ") == [(3, 3)]
+
+
+@pytest.mark.parametrize("spec", ["", " , ", "0", "5-3", "a-b", "1-2-3", "-4"])
+def test_parse_range_spec_rejects_malformed_specs(spec):
+    with pytest.raises(ValueError):
+        parse_range_spec(spec)
+
+
+def test_resolve_page_range():
+    assert resolve_page_range(None, 10) is None
+    assert resolve_page_range("8-, 2-3, 3", 10) == [1, 2, 7, 8, 9]
+    # Pages past the end are ignored rather than failing
+    assert resolve_page_range("9-20", 10) == [8, 9]
+    assert resolve_page_range([4, 1, 4], 10) == [0, 3]
+
+
+def test_select_paragraphs_by_number_skips_blank_paragraphs():
+    paragraphs = [Para("one"), Para(""), Para("two"), Para("  "), Para("three"), Para("four")]
+    assert _texts(select_paragraphs(paragraphs, "2-3")) == ["two", "three"]
+    assert _texts(select_paragraphs(paragraphs, [1, 4])) == ["one", "four"]
+
+
+def test_select_paragraphs_by_heading():
+    paragraphs = [Para("Intro"), Para("  scope "), Para("in scope"), Para("SCOPE  END"), Para("after")]
+    assert _texts(select_paragraphs(paragraphs, start_heading="Scope", end_heading="scope end")) == [
+        "  scope ", "in scope"]
+    # Numbers count from the start of the document, not from the heading
+    assert _texts(select_paragraphs(paragraphs, "3-", start_heading="scope")) == ["in scope", "SCOPE  END", "after"]
+
+
+def test_untexted_content_follows_the_paragraph_before_it():
+    image = Para("", has_content=True)
+    paragraphs = [Para("one"), image, Para("two"), Para("", has_content=True), Para("three")]
+    assert list(select_paragraphs(paragraphs, "1")) == [paragraphs[0], image]
+    assert list(select_paragraphs(paragraphs, "3")) == [paragraphs[4]]
+
+
+def test_select_paragraphs_stops_reading_after_the_last_wanted():
+    def stream():
+        yield Para("one")
+        yield Para("two")
+        yield Para("three")
+        raise AssertionError("read past the selection")
+
+    assert _texts(select_paragraphs(stream(), "1-2")) == ["one", "two"]
@@ -0,0 +1,46 @@
+from inline_markup import BODY, HEADER, iter_blocks, tokenize_line
+
+
+def _runs(line):
+    kind, runs = tokenize_line(line)
+    assert kind == BODY
+    return [(run.text, run.bold, run.italic, run.underline) for run in runs]
+
+
+def test_headers_match_anywhere_in_the_line_as_before():
+    assert tokenize_line("**[Scope]{.underline}**") == (HEADER, "Scope")
+    assert tokenize_line("**[A [draft] title]{.underline}**") == (HEADER, "A [draft] title")
+    assert tokenize_line("***[Title]{.underline}**") == (HEADER, "Title")
+    assert tokenize_line("Intro **[Findings]{.underline}** trailing") == (HEADER, "Findings")
+
+
+def test_inline_formatting():
+    assert _runs("a **bold** and *it* [under]{.underline} \\*x") == [
+        ("a ", False, False, False),
+        ("bold", True, False, False),
+        (" and ", False, False, False),
+        ("it", False, True, False),
+        (" ", False, False, False),
+        ("under", False, False, True),
+        (" *x", False, False, False),
+    ]
+    assert _runs("**bold *and italic***") == [("bold ", True, False, False), ("and italic", True, True, False)]
+
+
+def test_asterisks_next_to_spaces_stay_literal():
+    assert _runs("5 * 3 * 2 = 30") == [("5 * 3 * 2 = 30", False, False, False)]
+    assert _runs("a ** b **") == [("a ** b **", False, False, False)]
+    assert _runs("*a *b*") == [("a *b", False, True, False)]
+    assert _runs("x**y**z") == [("x", False, False, False), ("y", True, False, False), ("z", False, False, False)]
+
+
+def test_unclosed_markers_are_text():
+    assert _runs("**open only") == [("**open only", False, False, False)]
+    assert _runs("*one **two") == [("*one **two", False, False, False)]
+
+
+def test_blocks_skip_blank_lines_and_keep_order():
+    blocks = list(iter_blocks("\n  first line\n\n**[Head]{.underline}**\nlast  \n"))
+    assert [kind for kind, _ in blocks] == [BODY, HEADER, BODY]
+    assert blocks[0][1][0].text == "first line"
+    assert blocks[2][1][0].text == "last"
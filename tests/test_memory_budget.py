@@ -0,0 +1,27 @@
+import pytest
+
+from memory_budget import MemoryBudgetExceeded, MemoryEstimate, job_memory_budget, plan_ingestion
+
+MB = 1024 * 1024
+
+
+def test_no_budget_unless_configured(monkeypatch):
+    monkeypatch.delenv("CYBERGEN_JOB_MEMORY_MB", raising=False)
+    assert job_memory_budget() is None
+    # A job of any size is accepted, and read in memory
+    assert plan_ingestion(MemoryEstimate(50_000 * MB, 40_000 * MB)) is False
+
+
+@pytest.mark.parametrize("value", ["off", "0", "nonsense"])
+def test_budget_disabled_values(monkeypatch, value):
+    monkeypatch.setenv("CYBERGEN_JOB_MEMORY_MB", value)
+    assert job_memory_budget() is None
+
+
+def test_configured_budget_streams_then_rejects(monkeypatch):
+    monkeypatch.setenv("CYBERGEN_JOB_MEMORY_MB", "512")
+    assert job_memory_budget() == 512 * MB
+    assert plan_ingestion(MemoryEstimate(100 * MB, 50 * MB)) is False
+    assert plan_ingestion(MemoryEstimate(900 * MB, 100 * MB)) is True
+    with pytest.raises(MemoryBudgetExceeded):
+        plan_ingestion(MemoryEstimate(2000 * MB, 1000 * MB))
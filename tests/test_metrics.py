@@ -0,0 +1,87 @@
+import pytest
+
+from metrics import Gauge, Histogram, MetricsRegistry, size_bucket
+
+
+def test_histogram_quantile_interpolates_within_buckets():
+    histogram = Histogram("latency_seconds", "Latency", buckets=(1, 2, 4))
+    assert histogram.quantile(0.5) is None
+    for value in (0.5, 0.5, 1.5, 1.5):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == pytest.approx(1.0)
+    assert histogram.quantile(0.75) == pytest.approx(1.5)
+    assert histogram.quantile(0.25) == pytest.approx(0.5)
+
+    # Empty buckets in between still move the lower bound
+    histogram.observe(3.0)
+    histogram.observe(100.0)
+    assert histogram.quantile(5 / 6) == pytest.approx(4.0)
+    # The +Inf bucket is reported as the largest finite bound
+    assert histogram.quantile(1.0) == pytest.approx(4.0)
+
+
+def test_histogram_quantile_per_label_set():
+    histogram = Histogram("latency_seconds", "Latency", ("kind",), buckets=(1, 10))
+    histogram.observe(0.5, kind="text")
+    histogram.observe(5, kind="pdf")
+    assert histogram.quantile(0.5, kind="text") == pytest.approx(0.5)
+    assert histogram.quantile(0.5, kind="pdf") == pytest.approx(5.5)
+    assert histogram.label_sets() == [{"kind": "pdf"}, {"kind": "text"}]
+    with pytest.raises(ValueError):
+        histogram.observe(1)
+
+
+def test_prometheus_rendering():
+    registry = MetricsRegistry()
+    jobs = registry.counter("jobs_total", "Jobs run", ("source_type", "outcome"))
+    jobs.inc(source_type="pdf", outcome="ok")
+    jobs.inc(2, source_type='we"ird\\type\n', outcome="ok")
+    latency = registry.histogram("job_seconds", "Job latency", buckets=(0.5, 1.0))
+    latency.observe(0.25)
+    latency.observe(0.75)
+    latency.observe(3)
+
+    def collector():
+        gauge = Gauge("queued", "Queued jobs")
+        gauge.set(1.5)
+        return [gauge]
+
+    def broken():
+        raise RuntimeError("source is down")
+
+    registry.register_collector(broken)
+    registry.register_collector(collector)
+
+    assert registry.to_prometheus() == "\n".join([
+        "# HELP jobs_total Jobs run",
+        "# TYPE jobs_total counter",
+        'jobs_total{source_type="pdf",outcome="ok"} 1',
+        'jobs_total{source_type="we\\"ird\\\\type\\n",outcome="ok"} 2',
+        "# HELP job_seconds Job latency",
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{le="0.5"} 1',
+        'job_seconds_bucket{le="1"} 2',
+        'job_seconds_bucket{le="+Inf"} 3',
+        "job_seconds_sum 4",
+        "job_seconds_count 3",
+        "# HELP queued Queued jobs",
+        "# TYPE queued gauge",
+        "queued 1.5",
+    ]) + "\n"
+
+    registry.unregister_collector(collector)
+    registry.clear()
+    assert registry.to_prometheus() == ("# HELP jobs_total Jobs run\n# TYPE jobs_total counter\n"
+                                        "# HELP job_seconds Job latency\n# TYPE job_seconds histogram\n")
+
+
+def test_registry_returns_existing_metrics():
+    registry = MetricsRegistry()
+    assert registry.counter("jobs_total", "Jobs") is registry.counter("jobs_total", "Jobs")
+    with pytest.raises(ValueError):
+        registry.gauge("jobs_total", "Jobs")
+
+
+def test_size_bucket():
+    assert [size_bucket(size) for size in (None, 0, 100 * 1024, 5 * 1024 * 1024, 50 * 1024 * 1024)] == [
+        "unknown", "<100KB", "100KB-1MB", "1-10MB", ">10MB"]
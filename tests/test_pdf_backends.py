@@ -0,0 +1,60 @@
+import io
+
+import pytest
+import PyPDF2
+
+import pdf_backends
+from pdf_backends import DocumentBackend, ExtractionBackend, get_backend, register_backend
+from pdf_samples import text_pdf
+
+
+class ReaderBackend(DocumentBackend):
+    """PyPDF2 read page by page, through the DocumentBackend interface."""
+
+    name = "test-reader"
+
+    def open(self, stream):
+        return PyPDF2.PdfReader(stream)
+
+    def page_count(self, document):
+        return len(document.pages)
+
+    def page_text(self, document, page_num):
+        return document.pages[page_num].extract_text()
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(pdf_backends, "_backends", dict(pdf_backends._backends))
+    monkeypatch.setattr(pdf_backends, "_winners", {})
+
+
+def test_backend_missing_a_method_cannot_be_registered(registry):
+    class NoPageText(DocumentBackend):
+        name = "incomplete"
+
+        def open(self, stream):
+            return PyPDF2.PdfReader(stream)
+
+        def page_count(self, document):
+            return len(document.pages)
+
+    with pytest.raises(TypeError, match="page_text"):
+        register_backend(NoPageText())
+    with pytest.raises(TypeError):
+        ExtractionBackend()
+    with pytest.raises(TypeError):
+        register_backend(object())
+    assert get_backend("incomplete") is None
+
+
+def test_document_backend_matches_pypdf2(registry):
+    register_backend(ReaderBackend())
+    data = text_pdf(["FIRST PAGE", "SECOND PAGE", "THIRD PAGE"])
+    results = {}
+    for name in ("pypdf2", "test-reader"):
+        page_numbers, texts = get_backend(name).iter_pages(io.BytesIO(data), "2-3", known={1})
+        results[name] = (list(page_numbers), list(texts))
+    assert results["test-reader"] == results["pypdf2"]
+    assert results["pypdf2"][0] == [1, 2]
+    assert len(results["pypdf2"][1]) == 1 and "THIRD PAGE" in results["pypdf2"][1][0]
@@ -0,0 +1,34 @@
+import io
+
+import PyPDF2
+
+from pdf_page_cache import PageTextCache, extract_page_text, page_cache_key
+from pdf_samples import form_xobject_pdf, text_pdf
+
+
+def _pages(data):
+    return PyPDF2.PdfReader(io.BytesIO(data)).pages
+
+
+def test_pages_sharing_a_content_stream_with_different_forms_get_different_keys(tmp_path):
+    pages = _pages(form_xobject_pdf("PAGE ONE TEXT", "PAGE TWO TEXT"))
+    assert page_cache_key(pages[0]) != page_cache_key(pages[1])
+
+    cache = PageTextCache(str(tmp_path / "pages.sqlite3"))
+    texts = [extract_page_text(page, cache) for page in pages]
+    assert "PAGE ONE TEXT" in texts[0]
+    assert "PAGE TWO TEXT" in texts[1]
+    assert "PAGE ONE TEXT" not in texts[1]
+
+
+def test_identical_pages_share_a_key_and_hit_the_cache(tmp_path):
+    pages = _pages(text_pdf(["SAME TEXT", "SAME TEXT", "OTHER TEXT"]))
+    assert page_cache_key(pages[0]) == page_cache_key(pages[1])
+    assert page_cache_key(pages[0]) != page_cache_key(pages[2])
+
+    cache = PageTextCache(str(tmp_path / "pages.sqlite3"))
+    texts = [extract_page_text(page, cache) for page in pages]
+    assert texts == [page.extract_text() for page in pages]
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
@@ -0,0 +1,43 @@
+from cybergen_template import iter_pdf_text
+from pdf_page_cache import PageTextCache
+from pipeline import iter_pdf_text_pipelined
+from pdf_samples import text_pdf
+
+PAGES = [f"PAGE {number} TEXT" for number in range(1, 7)]
+
+
+def _write_pdf(tmp_path):
+    path = tmp_path / "sample.pdf"
+    path.write_bytes(text_pdf(PAGES))
+    return str(path)
+
+
+def test_pipelined_pages_match_sequential_extraction(tmp_path):
+    path = _write_pdf(tmp_path)
+    sequential = list(iter_pdf_text(path, page_cache=False))
+    pipelined = list(iter_pdf_text_pipelined(path, page_cache=False))
+    assert pipelined == sequential
+    assert [text.strip() for text in pipelined] == PAGES
+
+
+def test_worker_cache_counters_reach_the_parent_cache(tmp_path):
+    path = _write_pdf(tmp_path)
+    cache = PageTextCache(str(tmp_path / "pages.sqlite3"))
+
+    list(iter_pdf_text_pipelined(path, page_cache=cache))
+    assert cache.counters()["misses"] == len(PAGES)
+    assert cache.counters()["hits"] == 0
+
+    list(iter_pdf_text_pipelined(path, page_cache=cache))
+    assert cache.counters()["hits"] == len(PAGES)
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_in_memory_uploads_are_not_pipelined_unless_forced(tmp_path):
+    from pipeline import should_pipeline
+
+    path = _write_pdf(tmp_path)
+    data = open(path, "rb").read()
+    assert should_pipeline(path)
+    assert not should_pipeline(memoryview(data))
+    assert should_pipeline(memoryview(data), pipeline=True)
@@ -0,0 +1,49 @@
+import docx
+import pytest
+
+import preview
+from docx_samples import docx_bytes
+from pdf_samples import text_pdf
+from preview import PARAGRAPHS_PER_SCREEN, DocumentPreview
+
+
+@pytest.fixture(autouse=True)
+def pypdf2_backend(monkeypatch):
+    monkeypatch.setenv("CYBERGEN_PDF_BACKEND", "pypdf2")
+
+
+def test_pdf_pages_are_extracted_once_on_demand(monkeypatch):
+    source = text_pdf(["PAGE ONE", "PAGE TWO", "PAGE THREE"])
+    document = DocumentPreview("report.pdf", page_cache=False)
+    assert document.page_count(source) == 3
+    assert document.page_texts == {}
+
+    assert "PAGE TWO" in document.get_page(source, 2)
+    assert list(document.page_texts) == [1]
+    # Pages seen before come from memory, without touching the source
+    monkeypatch.setattr(preview, "open_source", None)
+    assert "PAGE TWO" in document.get_page(source, 2)
+
+    assert document.has_page(source, 3) and not document.has_page(source, 4) and not document.has_page(source, 0)
+
+
+def test_pdf_page_past_the_end():
+    document = DocumentPreview("report.pdf", page_cache=False)
+    with pytest.raises(IndexError):
+        document.get_page(text_pdf(["ONLY PAGE"]), 2)
+
+
+def test_word_screens():
+    source = docx.Document()
+    for number in range(1, PARAGRAPHS_PER_SCREEN + 6):
+        source.add_paragraph(f"paragraph {number}")
+        source.add_paragraph("")
+    data = docx_bytes(source)
+    document = DocumentPreview("letter.docx")
+
+    assert document.page_count(data) is None
+    first = document.get_page(data, 1).split("\n")
+    assert first[0] == "paragraph 1" and len(first) == PARAGRAPHS_PER_SCREEN
+    assert document.get_page(data, 2).split("\n") == [f"paragraph {number}" for number in
+                                                      range(PARAGRAPHS_PER_SCREEN + 1, PARAGRAPHS_PER_SCREEN + 6)]
+    assert document.has_page(data, 2) and not document.has_page(data, 3)
@@ -0,0 +1,62 @@
+import json
+import pstats
+import tracemalloc
+
+import pytest
+
+from profiling import input_size, profile_job, sample_rate, should_profile
+
+
+@pytest.mark.parametrize("value, rate", [
+    ("", 0.0), ("off", 0.0), ("0", 0.0), ("on", 1.0), ("1", 1.0), ("0.25", 0.25), ("7", 1.0), ("-1", 0.0),
+    ("bogus", 0.0),
+])
+def test_sample_rate(monkeypatch, value, rate):
+    monkeypatch.setenv("CYBERGEN_PROFILE", value)
+    assert sample_rate() == rate
+
+
+def test_explicit_choice_overrides_sampling(monkeypatch):
+    monkeypatch.setenv("CYBERGEN_PROFILE", "off")
+    assert should_profile(True) and not should_profile(None)
+    monkeypatch.setenv("CYBERGEN_PROFILE", "on")
+    assert not should_profile(False) and should_profile(None)
+
+
+def test_input_size(tmp_path):
+    path = tmp_path / "source.pdf"
+    path.write_bytes(b"x" * 100)
+    assert input_size(str(path)) == 100
+    assert input_size("héllo") == 6
+    assert input_size(bytearray(42)) == 42
+    assert input_size(object()) is None
+
+
+def test_unprofiled_job_writes_nothing(tmp_path):
+    with profile_job("job", profile=False, profile_dir=str(tmp_path)) as job_profile:
+        assert job_profile is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiled_job_writes_stats_and_report(tmp_path):
+    was_tracing = tracemalloc.is_tracing()
+    with profile_job("job1", profile=True, profile_dir=str(tmp_path), kind="text") as job_profile:
+        held = [bytearray(1024) for _ in range(200)]
+        job_profile.tag(ok=True)
+    assert tracemalloc.is_tracing() == was_tracing
+
+    report = json.loads(open(job_profile.report_path, encoding="utf-8").read())
+    assert report["job_id"] == "job1"
+    assert report["tags"] == {"kind": "text", "ok": True}
+    assert report["peak_traced_bytes"] >= 200 * 1024
+    assert report["top_allocations"] and report["top_allocations"][0]["size"] >= 200 * 1024
+    assert pstats.Stats(job_profile.stats_path).total_calls > 0
+    del held
+
+
+def test_failed_job_is_tagged_and_reraised(tmp_path):
+    with pytest.raises(RuntimeError):
+        with profile_job("job2", profile=True, profile_dir=str(tmp_path)) as job_profile:
+            raise RuntimeError("boom")
+    report = json.loads(open(job_profile.report_path, encoding="utf-8").read())
+    assert report["tags"] == {"ok": False, "error": "RuntimeError: boom"}
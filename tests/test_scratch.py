@@ -0,0 +1,113 @@
+import os
+import time
+
+import pytest
+
+from scratch import ScratchQuotaExceeded, ScratchRootError, ScratchStorage, estimate_job_bytes
+
+
+def _age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_entries_unused_past_max_age_are_evicted(tmp_path):
+    scratch = ScratchStorage(str(tmp_path / "scratch"), quota_bytes=10_000, max_age=60)
+    old = scratch.store("old.docx", b"x" * 100)
+    fresh = scratch.store("fresh.docx", b"y" * 100)
+    _age(old, 120)
+
+    scratch.store("new.docx", b"z" * 100)
+    assert not os.path.exists(old)
+    assert os.path.exists(fresh)
+    assert scratch.evictions == 1
+
+
+def test_least_recently_used_idle_entries_make_room(tmp_path):
+    scratch = ScratchStorage(str(tmp_path / "scratch"), quota_bytes=250, max_age=3600)
+    first = scratch.store("first.docx", b"a" * 100)
+    second = scratch.store("second.docx", b"b" * 100)
+    _age(first, 20)
+    _age(second, 10)
+
+    third = scratch.store("third.docx", b"c" * 100)
+    assert not os.path.exists(first)
+    assert os.path.exists(second) and os.path.exists(third)
+
+
+def test_same_content_is_stored_once(tmp_path):
+    scratch = ScratchStorage(str(tmp_path / "scratch"), quota_bytes=10_000)
+    path = scratch.store("template.docx", b"content")
+    assert scratch.store("template.docx", b"content") == path
+    assert len(os.listdir(scratch.root)) == 1
+
+
+def test_busy_job_dirs_are_never_evicted(tmp_path):
+    scratch = ScratchStorage(str(tmp_path / "scratch"), quota_bytes=150, max_age=3600)
+    with scratch.job_dir("text") as job_dir:
+        with open(os.path.join(job_dir, "out.docx"), "wb") as file:
+            file.write(b"x" * 100)
+        _age(job_dir, 7200)
+
+        with pytest.raises(ScratchQuotaExceeded):
+            scratch.store("big.docx", b"y" * 100)
+        assert os.path.exists(job_dir)
+    assert not os.path.exists(job_dir)
+    scratch.store("big.docx", b"y" * 100)
+
+
+def test_reservations_count_until_release(tmp_path):
+    scratch = ScratchStorage(str(tmp_path / "scratch"), quota_bytes=1000)
+    first = scratch.create_job_dir("a", reserve=600)
+    # Nothing written yet, but the first job's reservation still holds its space
+    with pytest.raises(ScratchQuotaExceeded):
+        scratch.create_job_dir("b", reserve=600)
+    second = scratch.create_job_dir("b", reserve=400)
+
+    scratch.release(first)
+    third = scratch.create_job_dir("c", reserve=600)
+    scratch.release(second)
+    scratch.release(third)
+    assert os.listdir(scratch.root) == []
+
+
+def test_jobs_that_outgrow_their_reservation_count_what_they_wrote(tmp_path):
+    scratch = ScratchStorage(str(tmp_path / "scratch"), quota_bytes=1000)
+    job_dir = scratch.create_job_dir("a", reserve=100)
+    with open(os.path.join(job_dir, "out.docx"), "wb") as file:
+        file.write(b"x" * 800)
+    with pytest.raises(ScratchQuotaExceeded):
+        scratch.create_job_dir("b", reserve=300)
+    scratch.release(job_dir)
+
+
+def test_estimate_adds_template_and_inputs(tmp_path):
+    template = tmp_path / "template.docx"
+    template.write_bytes(b"t" * 50)
+    source = tmp_path / "source.pdf"
+    source.write_bytes(b"s" * 30)
+    assert estimate_job_bytes(str(template), "héllo", str(source), bytearray(20), 7, None) == 50 + 6 + 30 + 20 + 7
+    assert estimate_job_bytes(str(tmp_path / "missing.docx"), 10) == 10
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_root_is_created_private(tmp_path):
+    root = tmp_path / "scratch"
+    ScratchStorage(str(root))
+    assert root.stat().st_mode & 0o777 == 0o700
+
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    os.chmod(shared, 0o777)
+    ScratchStorage(str(shared))
+    assert shared.stat().st_mode & 0o777 == 0o700
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX symlinks")
+def test_symlinked_root_is_refused(tmp_path):
+    target = tmp_path / "elsewhere"
+    target.mkdir()
+    link = tmp_path / "scratch"
+    link.symlink_to(target)
+    with pytest.raises(ScratchRootError):
+        ScratchStorage(str(link))
@@ -0,0 +1,66 @@
+import os
+import pickle
+
+import pytest
+
+import template_compiler
+from template_compiler import artifact_path_for, compile_template, load_compiled_template
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cybergen-template.docx")
+
+
+class _Exploit:
+    def __reduce__(self):
+        return (os.system, ("touch pwned",))
+
+
+@pytest.fixture
+def private_dirs(tmp_path, monkeypatch):
+    monkeypatch.setenv("CYBERGEN_TEMPLATE_ARTIFACT_DIR", str(tmp_path / "artifacts"))
+    monkeypatch.setenv("CYBERGEN_TEMPLATE_ARTIFACT_KEY", str(tmp_path / "key" / "artifacts.key"))
+    monkeypatch.setattr(template_compiler, "_key", None)
+    return tmp_path
+
+
+def test_artifacts_are_not_written_next_to_the_template(private_dirs):
+    path = artifact_path_for(TEMPLATE)
+    assert os.path.dirname(path) == str(private_dirs / "artifacts")
+    assert not path.startswith(TEMPLATE)
+
+
+def test_compiled_template_round_trips(private_dirs):
+    path = compile_template(TEMPLATE)
+    doc = load_compiled_template(TEMPLATE, auto_compile=False)
+    assert os.path.exists(path)
+    assert len(doc.sections) >= 1
+
+
+def test_unsigned_artifact_is_never_unpickled(private_dirs, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = artifact_path_for(TEMPLATE)
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as file:
+        # A forged artifact: the right header followed by a malicious payload
+        header = template_compiler._header_for(TEMPLATE)
+        file.write(template_compiler.ARTIFACT_MAGIC + b"\0" * template_compiler.MAC_BYTES)
+        pickle.dump(header, file)
+        pickle.dump(_Exploit(), file)
+
+    doc = load_compiled_template(TEMPLATE)
+    assert not os.path.exists(tmp_path / "pwned")
+    assert len(doc.sections) >= 1
+    # The forgery was replaced by a signed artifact
+    template_compiler._read_artifact(path)
+
+
+def test_key_readable_by_others_is_refused(private_dirs):
+    if os.name == "nt":
+        pytest.skip("POSIX permissions only")
+    key_path = private_dirs / "key" / "artifacts.key"
+    template_compiler.artifact_key()
+    os.chmod(key_path, 0o644)
+    template_compiler._key = None
+    with pytest.raises(template_compiler.ArtifactKeyError):
+        template_compiler.artifact_key()
+    # Loading still works, straight from the .docx
+    assert len(load_compiled_template(TEMPLATE).sections) >= 1
@@ -0,0 +1,52 @@
+import io
+import itertools
+import random
+
+import pytest
+
+from text_stream import iter_stripped_pieces, iter_text_lines, join_chunks
+
+SAMPLES = [
+    "",
+    "   \n\n  ",
+    "one line",
+    "  first\nsecond  \n\n third \n",
+    "\n\npara one\nstill one\n\n\n\npara two\n\n  \n\npara three  ",
+    "a\n\nb\n\n",
+]
+
+
+def _chunkings(text, rng):
+    yield [text]
+    yield list(text)
+    for _ in range(20):
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 6))))
+        yield [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("separator", ["\n", "\n\n"])
+@pytest.mark.parametrize("text", SAMPLES)
+def test_pieces_match_strip_split_however_the_text_is_chunked(text, separator):
+    expected = [piece for piece in text.strip().split(separator) if piece.strip()]
+    rng = random.Random(text)
+    for chunks in _chunkings(text, rng):
+        assert list(iter_stripped_pieces(chunks, separator)) == expected, chunks
+
+
+def test_join_chunks():
+    assert "".join(join_chunks(["a", "b", "c"], "\n\n")) == "a\n\nb\n\nc"
+    assert list(join_chunks([], "\n")) == []
+
+
+def test_text_lines_from_strings_iterables_and_streams():
+    text = "  Title\n\nfirst line\nsecond line  \n"
+    expected = ["Title", "first line", "second line"]
+    assert list(iter_text_lines(text)) == expected
+    assert list(iter_text_lines(["  Title", "", "first line", "second line  "])) == expected
+    assert list(iter_text_lines(io.StringIO(text))) == expected
+
+
+def test_text_lines_are_produced_lazily():
+    # An endless source must still yield its first lines
+    stream = iter_text_lines(f"line {number}\n" for number in itertools.count())
+    assert list(itertools.islice(stream, 3)) == ["line 0", "line 1", "line 2"]
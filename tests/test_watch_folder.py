@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+
+import watch_folder
+from checkpoint import CheckpointManifest
+from docx_samples import word_source
+from pdf_samples import text_pdf
+from watch_folder import Debouncer, WatchFolderDaemon, is_candidate
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cybergen-template.docx")
+
+
+def _until(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def _daemon(tmp_path, **options):
+    return WatchFolderDaemon(str(tmp_path / "in"), str(tmp_path / "out"), TEMPLATE, workers=1, settle_time=0.1,
+                             poll=True, poll_interval=0.05, **options)
+
+
+def test_candidates():
+    assert is_candidate("Report.PDF") and is_candidate("letter.docx") and is_candidate("old.doc")
+    assert not any(is_candidate(name) for name in (
+        "notes.txt", ".hidden.pdf", "~$letter.docx", "report.pdf.part", "upload.crdownload", "a.pdf.tmp"))
+
+
+def test_debouncer_waits_until_a_file_stops_changing(tmp_path):
+    path = str(tmp_path / "a.pdf")
+    with open(path, "wb") as file:
+        file.write(b"half")
+    debouncer = Debouncer(settle_time=2.0)
+    debouncer.touch(path, now=0.0)
+    assert debouncer.settled(now=1.0) == [] and len(debouncer) == 1
+
+    # Still being written: the wait starts again from when the change was seen
+    with open(path, "ab") as file:
+        file.write(b" and the rest")
+    assert debouncer.settled(now=1.5) == []
+    assert debouncer.settled(now=3.0) == []
+    settled = debouncer.settled(now=3.5)
+    assert settled == [(path, (17, os.stat(path).st_mtime_ns))]
+    assert len(debouncer) == 0
+
+
+def test_debouncer_touch_without_a_change_keeps_the_clock(tmp_path):
+    path = str(tmp_path / "a.pdf")
+    with open(path, "wb") as file:
+        file.write(b"done")
+    debouncer = Debouncer(settle_time=2.0)
+    debouncer.touch(path, now=0.0)
+    debouncer.touch(path, now=1.5)
+    assert [item[0] for item in debouncer.settled(now=2.0)] == [path]
+
+
+def test_debouncer_forgets_deleted_files_and_offers_deferred_ones_again(tmp_path):
+    gone, kept = str(tmp_path / "gone.pdf"), str(tmp_path / "kept.pdf")
+    for path in (gone, kept):
+        with open(path, "wb") as file:
+            file.write(b"content")
+    debouncer = Debouncer(settle_time=2.0)
+    debouncer.touch(gone, now=0.0)
+    debouncer.touch(str(tmp_path / "never-existed.pdf"), now=0.0)
+    assert len(debouncer) == 1
+    os.unlink(gone)
+    assert debouncer.settled(now=5.0) == [] and len(debouncer) == 0
+
+    debouncer.touch(kept)
+    (ready,) = debouncer.settled(now=time.monotonic() + 2.0)
+    # A settled file the queue had no room for is offered again at the next check
+    debouncer.defer(*ready)
+    assert debouncer.settled() == [ready]
+
+
+class RecordsNeverSync(CheckpointManifest):
+    """A manifest whose records never fsync by themselves, so only sync() makes them durable."""
+
+    def __init__(self, path):
+        super().__init__(path, sync_every=1000, sync_interval=0.5)
+
+    def record(self, *args, **kwargs):
+        with self._lock:
+            self._last_sync = time.monotonic()
+        super().record(*args, **kwargs)
+
+
+def test_quiet_daemon_fsyncs_the_last_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(watch_folder, "CheckpointManifest", RecordsNeverSync)
+    (tmp_path / "in").mkdir()
+    for name in ("a", "b"):
+        (tmp_path / "in" / f"{name}.pdf").write_bytes(text_pdf([f"DOCUMENT {name}"]))
+
+    daemon = _daemon(tmp_path)
+    runner = threading.Thread(target=daemon.run)
+    runner.start()
+    try:
+        _until(lambda: daemon.formatted == 2)
+        _until(lambda: daemon._manifest._unsynced == 0, timeout=5.0)
+        assert runner.is_alive()
+    finally:
+        daemon.stop()
+        runner.join()
+
+
+def test_restart_keeps_output_names_when_a_namesake_arrives(tmp_path):
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "a.pdf").write_bytes(text_pdf(["FIRST SOURCE"]))
+    first = _daemon(tmp_path)
+    first.run(once=True)
+    assert (first.formatted, first.skipped) == (1, 0)
+
+    (tmp_path / "in" / "a.docx").write_bytes(word_source())
+    second = _daemon(tmp_path)
+    second.run(once=True)
+    # a.pdf keeps its output and is recognized from the manifest; only a.docx is new
+    assert (second.formatted, second.skipped) == (1, 1)
+    assert sorted(name for name in os.listdir(tmp_path / "out") if name.endswith(".docx")) == [
+        "a_docx.docx", "a_pdf.docx"]
@@ -0,0 +1,40 @@
+import gc
+import multiprocessing
+import time
+
+import pytest
+
+from metrics import get_registry
+from worker_pool import WorkerSupervisor
+
+
+def _pool_samples():
+    return [metric for metric in get_registry().collect() if metric.name.startswith("cybergen_pool_jobs_")]
+
+
+def test_two_pools_publish_each_metric_once():
+    with WorkerSupervisor(workers=1, template_paths=()) as first, \
+            WorkerSupervisor(workers=1, template_paths=()) as second:
+        jobs = [first.submit(time.sleep, 0.5), second.submit(time.sleep, 0.5)]
+        metrics = _pool_samples()
+        assert sorted(metric.name for metric in metrics) == ["cybergen_pool_jobs_queued",
+                                                             "cybergen_pool_jobs_running"]
+        # Each job is either queued or running until it finishes
+        assert sum(metric.value() for metric in metrics) == 2
+        for job in jobs:
+            job.get(timeout=30)
+        second.close()
+        assert len(_pool_samples()) == 2
+    assert _pool_samples() == []
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_heap_stays_frozen_while_any_pool_runs():
+    first = WorkerSupervisor(workers=1, template_paths=()).start()
+    second = WorkerSupervisor(workers=1, template_paths=()).start()
+    try:
+        second.close()
+        assert gc.get_freeze_count() > 0
+    finally:
+        first.terminate()
+    assert gc.get_freeze_count() == 0
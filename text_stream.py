@@ -0,0 +1,69 @@
+def iter_stripped_pieces(chunks, separator):
+    """
+    Split streamed text the way `"".join(chunks).strip().split(separator)` would, without joining it.
+
+    Only a single piece is held at a time. Whitespace-only pieces are skipped,
+    since every caller skips them anyway; the first piece yielded is lstripped and
+    the last rstripped, which is exactly what stripping the whole text changes
+    about the remaining pieces.
+
+    Args:
+        chunks: Iterable of text chunks, e.g. the pages of a document joined by `separator`
+        separator (str): Piece separator, e.g. "\\n\\n" for paragraphs or "\\n" for lines
+
+    Yields:
+        str: Each non-blank piece
+    """
+    pending = None  # the latest non-blank piece, held back in case it is the last one
+    first = True
+    carry = ""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parts = (carry + chunk).split(separator)
+        carry = parts.pop()
+        for part in parts:
+            if not part.strip():
+                continue
+            if pending is not None:
+                yield pending
+            pending = part.lstrip() if first else part
+            first = False
+    if carry.strip():
+        if pending is not None:
+            yield pending
+        pending = carry.lstrip() if first else carry
+    if pending is not None:
+        yield pending.rstrip()
+
+
+def join_chunks(chunks, separator):
+    """Yield `chunks` with `separator` between them, as `separator.join(chunks)` would produce."""
+    for index, chunk in enumerate(chunks):
+        if index:
+            yield separator
+        yield chunk
+
+
+def _without_newline(lines):
+    for line in lines:
+        yield line[:-1] if line.endswith("\n") else line
+
+
+def iter_text_lines(text):
+    """
+    Non-blank lines of text, as `text.strip().split('\\n')` would give them, one at a time.
+
+    Args:
+        text: A str, an iterable of lines (with or without their line endings), or a
+            text stream such as an open file or sys.stdin. An iterable is treated as
+            its lines joined by "\\n".
+
+    Yields:
+        str: Each non-blank line; only the line being yielded and the next one are held
+    """
+    if isinstance(text, str):
+        chunks = (text,)
+    else:
+        chunks = join_chunks(_without_newline(text), "\n")
+    return iter_stripped_pieces(chunks, "\n")
@@ -0,0 +1,501 @@
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+from generation import DEFAULT_TEMPLATE, GenerationError, GenerationResult, generate_from_document
+from worker_pool import WorkerSupervisor
+from checkpoint import DONE, FAILED, CheckpointManifest, file_digest
+from batch import DEFAULT_MAX_RETRIES, RETRYABLE_ERRORS, SUPPORTED_EXTENSIONS
+from profiling import input_size
+from metrics import record_job
+
+DEFAULT_MANIFEST_NAME = "watch-manifest.jsonl"
+# Seconds a file's size and modification time must stay unchanged before it is picked up
+DEFAULT_SETTLE_TIME = 2.0
+# Seconds between directory scans when inotify is unavailable
+DEFAULT_POLL_INTERVAL = 1.0
+# Seconds between full rescans even with inotify, to catch events it never delivers
+# (e.g. files written by another host on a network share) and to retry failures
+DEFAULT_RESCAN_INTERVAL = 60.0
+# Settled files waiting for a worker; beyond this, new arrivals wait on disk
+DEFAULT_QUEUE_SIZE = 64
+# Names of files that are still being written by common tools, or editor lock files
+PARTIAL_SUFFIXES = ('.tmp', '.part', '.partial', '.crdownload', '.download')
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+_libc = None
+if sys.platform.startswith("linux"):
+    try:
+        import ctypes
+        import ctypes.util
+
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _libc.inotify_init1  # noqa: B018  (raises AttributeError without inotify)
+    except (OSError, AttributeError):
+        _libc = None
+
+
+def is_candidate(name):
+    """True for names of supported source documents that are not temporary or lock files."""
+    lowered = name.lower()
+    if lowered.startswith(('.', '~$')) or lowered.endswith(PARTIAL_SUFFIXES):
+        return False
+    return lowered.endswith(SUPPORTED_EXTENSIONS)
+
+
+def _signature(path):
+    """Size and modification time of a regular file, or None if it is gone or not a file."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _scan(directory):
+    """Paths of the candidate files in a directory, with their signatures."""
+    found = {}
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return found
+    for entry in entries:
+        if is_candidate(entry.name):
+            signature = _signature(entry.path)
+            if signature is not None:
+                found[entry.path] = signature
+    return found
+
+
+class PollingWatcher:
+    """Detects changes in a directory by scanning it at a fixed interval."""
+
+    name = "polling"
+
+    def __init__(self, directory, interval=DEFAULT_POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._known = _scan(directory)
+
+    def wait(self, timeout):
+        """
+        Wait up to `timeout` seconds for changes.
+
+        Returns:
+            set: Paths of candidate files that appeared or changed
+        """
+        time.sleep(min(timeout, self.interval))
+        current = _scan(self.directory)
+        changed = {path for path, signature in current.items() if self._known.get(path) != signature}
+        self._known = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Detects changes in a directory through Linux inotify, without scanning it."""
+
+    name = "inotify"
+
+    def __init__(self, directory):
+        if _libc is None:
+            raise OSError("inotify is not available on this system")
+        self.directory = directory
+        self._fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_MODIFY | _IN_ATTRIB
+        if _libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"cannot watch {directory}")
+
+    def wait(self, timeout):
+        """
+        Wait up to `timeout` seconds for changes.
+
+        Returns:
+            set: Paths of candidate files with events, or None if events were lost and
+            the directory must be rescanned
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    return None
+                if name and is_candidate(name):
+                    changed.add(os.path.join(self.directory, name))
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(directory, poll=False, poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    Watch a directory with inotify where available, otherwise by polling.
+
+    Args:
+        directory (str): Directory to watch (not recursive)
+        poll (bool): Always poll, e.g. for network shares whose events inotify does not see
+        poll_interval (float): Seconds between scans when polling
+
+    Returns:
+        PollingWatcher or InotifyWatcher
+    """
+    if not poll:
+        try:
+            return InotifyWatcher(directory)
+        except OSError:
+            pass
+    return PollingWatcher(directory, poll_interval)
+
+
+class Debouncer:
+    """
+    Holds back files until they stop changing, so partially written files are not read.
+
+    A file is settled once its size and modification time have stayed the same for
+    `settle_time` seconds.
+    """
+
+    def __init__(self, settle_time=DEFAULT_SETTLE_TIME):
+        self.settle_time = settle_time
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def touch(self, path, now=None):
+        """Note that a file appeared or changed."""
+        now = time.monotonic() if now is None else now
+        signature = _signature(path)
+        if signature is None:
+            self._pending.pop(path, None)
+        elif path not in self._pending or self._pending[path][0] != signature:
+            self._pending[path] = (signature, now)
+
+    def defer(self, path, signature):
+        """Put back a settled file that could not be handled yet; it is offered again next time."""
+        self._pending[path] = (signature, time.monotonic() - self.settle_time)
+
+    def settled(self, now=None):
+        """
+        Returns:
+            list: (path, signature) of the files that stopped changing, which are no longer tracked
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        for path, (signature, since) in list(self._pending.items()):
+            current = _signature(path)
+            if current is None:
+                del self._pending[path]
+            elif current != signature:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle_time:
+                del self._pending[path]
+                ready.append((path, signature))
+        return ready
+
+
+def _format_file(source_file, template_path, output_path):
+    return generate_from_document(source_file, template_path, output_path=output_path)
+
+
+class WatchFolderDaemon:
+    """
+    Formats every Word/PDF document dropped into a folder, as it arrives.
+
+    New and changed files are picked up through inotify (or by polling), held back
+    until they stop changing, then queued for a warm WorkerSupervisor pool that has
+    the template preloaded. The queue is bounded and at most `workers` jobs are
+    handed to the pool at a time, so a burst of arrivals waits on disk instead of
+    piling up in memory. Each output is named after its source and written to the
+    output directory.
+
+    Outcomes are kept in a checkpoint manifest, so a restarted daemon skips documents
+    it already formatted and a document is formatted again only when its content
+    changes. Failed documents are tried again at the next rescan, up to
+    1 + max_retries attempts in total.
+    """
+
+    def __init__(self, input_dir, output_dir, template_path=DEFAULT_TEMPLATE, workers=None,
+                 queue_size=DEFAULT_QUEUE_SIZE, settle_time=DEFAULT_SETTLE_TIME, poll=False,
+                 poll_interval=DEFAULT_POLL_INTERVAL, rescan_interval=DEFAULT_RESCAN_INTERVAL,
+                 manifest_path=None, max_retries=DEFAULT_MAX_RETRIES, supervisor=None):
+        """
+        Args:
+            input_dir (str): Folder to watch
+            output_dir (str): Folder for the formatted documents; must differ from input_dir
+            template_path (str): Path to the template document
+            workers (int): Worker processes, and the most jobs run at once (default: CPU count)
+            queue_size (int): Settled files that may wait for a worker
+            settle_time (float): Seconds a file must stay unchanged before it is formatted
+            poll (bool): Poll instead of using inotify
+            poll_interval (float): Seconds between scans when polling
+            rescan_interval (float): Seconds between full rescans of the folder
+            manifest_path (str): Checkpoint manifest (default: watch-manifest.jsonl in output_dir)
+            max_retries (int): Retries per failed document, counted across restarts
+            supervisor (WorkerSupervisor): Running pool to use; a new one is started if None
+        """
+        if os.path.abspath(input_dir) == os.path.abspath(output_dir):
+            raise ValueError("The output folder must differ from the watched folder")
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.template_path = template_path
+        self.settle_time = settle_time
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.max_retries = max_retries
+        self.manifest_path = manifest_path or os.path.join(output_dir, DEFAULT_MANIFEST_NAME)
+        self.formatted = self.failed = self.skipped = 0
+
+        self._own_supervisor = supervisor is None
+        self._supervisor = supervisor or WorkerSupervisor(workers=workers, template_paths=(template_path,))
+        self._slots = threading.BoundedSemaphore(self._supervisor.workers)
+        self._queue = queue.Queue(queue_size)
+        self._debouncer = Debouncer(settle_time)
+        self._lock = threading.Lock()
+        # Files queued or being formatted, and the signature each file had when last handled
+        self._active = set()
+        self._handled = {}
+        self._stop = threading.Event()
+        self._manifest = None
+        self._template_hash = None
+
+    def stop(self):
+        """Ask run() to return; jobs already with a worker are finished first."""
+        self._stop.set()
+
+    def _output_path(self, source_file):
+        """
+        `<stem>_<ext>.docx`, e.g. report_pdf.docx for report.pdf.
+
+        The name depends on the source's name alone, never on which other files are
+        in the folder, so a restart maps a source to the output the manifest knows.
+        """
+        stem, extension = os.path.splitext(os.path.basename(source_file))
+        return os.path.join(self.output_dir, f"{stem}_{extension.lstrip('.').lower()}.docx")
+
+    def _offer(self, path, signature):
+        """Queue a settled file unless it is busy or unchanged since it was handled."""
+        with self._lock:
+            if path in self._active or self._handled.get(path) == signature:
+                return
+            try:
+                self._queue.put_nowait((path, signature))
+            except queue.Full:
+                self._debouncer.defer(path, signature)
+                return
+            self._active.add(path)
+
+    def _finish(self, path, signature, source_hash, output_path, result):
+        if result.ok:
+            self.formatted += 1
+            print(f"formatted: {path} -> {result.output_path} ({result.elapsed:.2f}s)", flush=True)
+        else:
+            self.failed += 1
+            print(f"FAILED: {path}: {result.error}", flush=True)
+        if source_hash is not None:
+            error = None if result.ok else {"message": str(result.error), "stage": result.error.stage,
+                                            "kind": result.error.kind}
+            self._manifest.record(path, source_hash, self._template_hash, output_path,
+                                  DONE if result.ok else FAILED, error)
+        with self._lock:
+            self._active.discard(path)
+            if result.ok or result.error.kind not in RETRYABLE_ERRORS:
+                self._handled[path] = signature
+            else:
+                # Offered again at the next rescan, if retries are left
+                self._handled.pop(path, None)
+
+    def _prepare(self, path, output_path):
+        """Check the manifest for a settled file; returns its hash, or False if there is nothing to do."""
+        try:
+            source_hash = file_digest(path)
+        except OSError:
+            # Let the job report why the file cannot be read
+            return None
+        if self._manifest.is_done(source_hash, self._template_hash, output_path):
+            self.skipped += 1
+            return False
+        entry = self._manifest.entry(source_hash, self._template_hash, output_path)
+        if entry is not None and entry.status == FAILED and entry.failures > self.max_retries:
+            print(f"skipped: {path} failed {entry.failures} times", flush=True)
+            self.skipped += 1
+            return False
+        return source_hash
+
+    def _dispatch(self):
+        """Feed queued files to the pool, never more at once than there are workers."""
+        while True:
+            item = self._queue.get()
+            if item is None or self._stop.is_set():
+                return
+            path, signature = item
+            output_path = self._output_path(path)
+            source_hash = self._prepare(path, output_path)
+            if source_hash is False:
+                with self._lock:
+                    self._active.discard(path)
+                    self._handled[path] = signature
+                continue
+            job = (path, signature, source_hash, output_path)
+            size = input_size(path)
+            self._slots.acquire()
+
+            def done(result, job=job, size=size):
+                try:
+                    record_job(os.path.splitext(job[0])[1].lstrip(".").lower(), size, result.elapsed,
+                               result.error.kind if result.error else None)
+                    self._finish(*job, result)
+                finally:
+                    self._slots.release()
+
+            def failed(exc, job=job):
+                try:
+                    self._finish(*job, GenerationResult(None, error=GenerationError.from_exception(exc, "build")))
+                finally:
+                    self._slots.release()
+
+            try:
+                self._supervisor.apply_async(_format_file, (path, self.template_path, output_path),
+                                             callback=done, error_callback=failed)
+            except Exception as exc:
+                failed(exc)
+
+    def idle(self):
+        """True when nothing is settling, queued or being formatted."""
+        with self._lock:
+            return not self._debouncer and not self._active
+
+    def run(self, once=False):
+        """
+        Watch and format until stop() is called (or, with once=True, until the files
+        already in the folder are done).
+
+        Args:
+            once (bool): Format what is in the folder, then return instead of watching
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._template_hash = file_digest(self.template_path)
+        self._manifest = CheckpointManifest(self.manifest_path)
+        watcher = create_watcher(self.input_dir, self.poll, self.poll_interval)
+        self._supervisor.start()
+        dispatcher = threading.Thread(target=self._dispatch, name="watch-folder-dispatch", daemon=True)
+        dispatcher.start()
+        print(f"Watching {self.input_dir} ({watcher.name}), writing to {self.output_dir}", flush=True)
+
+        try:
+            last_rescan = None
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if last_rescan is None or now - last_rescan >= self.rescan_interval:
+                    changed = _scan(self.input_dir)
+                    last_rescan = now
+                else:
+                    # Wake up in time to re-check files that are still settling, and
+                    # often enough to fsync the manifest records of finished jobs
+                    timeout = self.settle_time / 2 if self._debouncer else self.rescan_interval - (now - last_rescan)
+                    timeout = min(timeout, self._manifest.sync_interval)
+                    if once:
+                        # Notice promptly when the last job finishes
+                        timeout = min(timeout, 0.2)
+                    changed = watcher.wait(max(timeout, 0.05))
+                    if changed is None:
+                        last_rescan = None
+                        continue
+                    if not changed:
+                        # Quiet: make the records of jobs finished since the last fsync durable
+                        self._manifest.sync()
+                with self._lock:
+                    for path in changed:
+                        self._debouncer.touch(path)
+                    settled = self._debouncer.settled()
+                for path, signature in settled:
+                    self._offer(path, signature)
+                if once and self.idle():
+                    break
+        finally:
+            watcher.close()
+            # Files still queued are dropped; they are found again by the next start's first scan
+            self._stop.set()
+            self._queue.put(None)
+            dispatcher.join()
+            if self._own_supervisor:
+                self._supervisor.close()
+            self._manifest.close()
+
+    def summary(self):
+        return f"{self.formatted} formatted, {self.failed} failed, {self.skipped} already done"
+
+
+if __name__ == "__main__":
+    import argparse
+    import signal
+
+    from metrics import start_exporters_from_environment
+
+    parser = argparse.ArgumentParser(description="Format Word/PDF documents dropped into a folder")
+    parser.add_argument("input_dir", help="folder to watch")
+    parser.add_argument("-o", "--output-dir", default="formatted", help="folder for the formatted documents")
+    parser.add_argument("-t", "--template", default=DEFAULT_TEMPLATE, help="template document")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="worker processes, and the most documents formatted at once (default: CPU count)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f"documents that may wait for a worker (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_TIME,
+                        help=f"seconds a file must stay unchanged before it is formatted (default: {DEFAULT_SETTLE_TIME})")
+    parser.add_argument("--poll", action="store_true", help="poll the folder instead of using inotify")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f"seconds between scans when polling (default: {DEFAULT_POLL_INTERVAL})")
+    parser.add_argument("--rescan", type=float, default=DEFAULT_RESCAN_INTERVAL,
+                        help=f"seconds between full rescans (default: {DEFAULT_RESCAN_INTERVAL})")
+    parser.add_argument("--manifest", help=f"checkpoint manifest (default: {DEFAULT_MANIFEST_NAME} in the output folder)")
+    parser.add_argument("--retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help=f"retries per failed document, counted across restarts (default: {DEFAULT_MAX_RETRIES})")
+    parser.add_argument("--once", action="store_true", help="format the documents already in the folder and exit")
+    args = parser.parse_args()
+
+    start_exporters_from_environment()
+    daemon = WatchFolderDaemon(args.input_dir, args.output_dir, args.template, args.workers, args.queue_size,
+                               args.settle, args.poll, args.poll_interval, args.rescan, args.manifest, args.retries)
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.run(once=args.once)
+    except KeyboardInterrupt:
+        daemon.stop()
+    print(daemon.summary())
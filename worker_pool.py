@@ -0,0 +1,270 @@
+import gc
+import multiprocessing
+import os
+import threading
+
+import docx  # noqa: F401  (imported so forked workers inherit it)
+import PyPDF2  # noqa: F401
+
+from generation import DEFAULT_TEMPLATE, generate_from_text, generate_from_document
+from template_cache import get_template_cache
+from profiling import input_size
+from source_io import source_extension
+from metrics import Gauge, get_registry, record_job
+
+DEFAULT_MAX_JOBS_PER_WORKER = 200
+
+# Jobs submitted to the pool that no worker has picked up yet, shared with the workers
+_queued_jobs = None
+
+
+def _preload(template_paths):
+    """Parse templates into this process's template cache."""
+    get_template_cache().preload(template_paths)
+
+
+def _init_worker(queued_jobs, template_paths=None):
+    global _queued_jobs
+    _queued_jobs = queued_jobs
+    if template_paths:
+        _preload(template_paths)
+
+
+def _run_counted(func, args, kwargs):
+    with _queued_jobs.get_lock():
+        _queued_jobs.value -= 1
+    return func(*args, **kwargs)
+
+
+def _run_text_job(input_text, template_path, output_path, output_dir):
+    return generate_from_text(input_text, template_path, output_path, output_dir)
+
+
+def _run_document_job(source_file, template_path, output_path, output_dir, source_name, import_options):
+    return generate_from_document(source_file, template_path, output_path, output_dir,
+                                  source_name=source_name, **import_options)
+
+
+_live_supervisors = set()
+_live_supervisors_lock = threading.Lock()
+
+
+def _collect_pool_metrics():
+    """Queued and running jobs summed over every running supervisor, so the names appear once."""
+    with _live_supervisors_lock:
+        supervisors = list(_live_supervisors)
+    queued = running = 0
+    for supervisor in supervisors:
+        supervisor_queued = supervisor._queued.value if supervisor._queued is not None else 0
+        queued += supervisor_queued
+        running += max(supervisor._pending - supervisor_queued, 0)
+    queued_gauge = Gauge("cybergen_pool_jobs_queued", "Jobs waiting for a pool worker")
+    queued_gauge.set(queued)
+    running_gauge = Gauge("cybergen_pool_jobs_running", "Jobs running on pool workers")
+    running_gauge.set(running)
+    return [queued_gauge, running_gauge]
+
+
+def _add_live(supervisor):
+    with _live_supervisors_lock:
+        if not _live_supervisors:
+            get_registry().register_collector(_collect_pool_metrics)
+        _live_supervisors.add(supervisor)
+
+
+def _discard_live(supervisor):
+    """Forget a stopped supervisor; returns True if it was the last one running."""
+    with _live_supervisors_lock:
+        if supervisor not in _live_supervisors:
+            return False
+        _live_supervisors.discard(supervisor)
+        if _live_supervisors:
+            return False
+        get_registry().unregister_collector(_collect_pool_metrics)
+        return True
+
+
+def _record(result, source_type, size):
+    # Workers record jobs in their own registries; mirror them in the parent's
+    record_job(source_type, size, result.elapsed, result.error.kind if result.error else None)
+
+
+class WorkerSupervisor:
+    """
+    Process pool whose workers are forked from a parent that has already loaded everything.
+
+    The parent imports python-docx and PyPDF2 and parses the templates into the
+    template cache before forking, then freezes the garbage collector so those
+    objects are never touched again. Workers therefore start instantly and share
+    the preloaded pages copy-on-write instead of each holding its own copy.
+    Each worker is replaced after `max_jobs_per_worker` jobs to cap memory creep.
+
+    Where fork is unavailable (e.g. Windows) workers are spawned and preload the
+    templates themselves on start-up.
+
+    While the pool runs, the number of queued and running jobs is published in the
+    metrics registry (summed over all running pools), and generation jobs are
+    recorded there as they finish.
+    """
+
+    def __init__(self, workers=None, max_jobs_per_worker=DEFAULT_MAX_JOBS_PER_WORKER,
+                 template_paths=(DEFAULT_TEMPLATE,)):
+        """
+        Args:
+            workers (int): Number of worker processes (default: CPU count)
+            max_jobs_per_worker (int): Jobs a worker runs before it is recycled; None for never
+            template_paths: Templates to preload before the workers start
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.template_paths = tuple(template_paths)
+        self._pool = None
+        self._queued = None
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    def start(self):
+        """Preload the templates and start the workers."""
+        if self._pool is not None:
+            return self
+        if "fork" in multiprocessing.get_all_start_methods():
+            _preload(self.template_paths)
+            # Move everything loaded so far out of the collector's reach, so that
+            # collections in the workers do not write to (and un-share) those pages
+            gc.collect()
+            gc.freeze()
+            context = multiprocessing.get_context("fork")
+            self._queued = context.Value("i", 0)
+            self._pool = context.Pool(self.workers, initializer=_init_worker, initargs=(self._queued,),
+                                      maxtasksperchild=self.max_jobs_per_worker)
+        else:
+            context = multiprocessing.get_context("spawn")
+            self._queued = context.Value("i", 0)
+            self._pool = context.Pool(self.workers, initializer=_init_worker,
+                                      initargs=(self._queued, self.template_paths),
+                                      maxtasksperchild=self.max_jobs_per_worker)
+        _add_live(self)
+        return self
+
+    def _apply(self, func, args, kwargs=None, on_result=None, on_error=None):
+        with self._queued.get_lock():
+            self._queued.value += 1
+        with self._pending_lock:
+            self._pending += 1
+
+        def finished(value):
+            with self._pending_lock:
+                self._pending -= 1
+            if on_result is not None:
+                on_result(value)
+
+        def failed(exc):
+            with self._pending_lock:
+                self._pending -= 1
+            if on_error is not None:
+                on_error(exc)
+
+        return self._pool.apply_async(_run_counted, (func, args, kwargs or {}), callback=finished,
+                                      error_callback=failed)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue an arbitrary job. `func` must be a module-level (picklable) function.
+
+        Returns:
+            multiprocessing.pool.AsyncResult: Resolves to the function's return value
+        """
+        self.start()
+        return self._apply(func, args, kwargs)
+
+    def apply_async(self, func, args=(), kwargs=None, callback=None, error_callback=None):
+        """
+        Queue an arbitrary job and be called back when it finishes, as Pool.apply_async.
+
+        Callbacks run on the pool's result thread and should return quickly.
+
+        Args:
+            func: Module-level (picklable) function
+            args (tuple): Positional arguments
+            kwargs (dict): Keyword arguments
+            callback: Called with the return value
+            error_callback: Called with the exception if the job raised
+
+        Returns:
+            multiprocessing.pool.AsyncResult: Resolves to the function's return value
+        """
+        self.start()
+        return self._apply(func, args, kwargs, on_result=callback, on_error=error_callback)
+
+    def submit_text(self, input_text, template_path=DEFAULT_TEMPLATE, output_path=None, output_dir=None):
+        """
+        Queue a text generation job.
+
+        Returns:
+            multiprocessing.pool.AsyncResult: Resolves to a GenerationResult
+        """
+        self.start()
+        size = input_size(input_text)
+        return self._apply(_run_text_job, (input_text, template_path, output_path, output_dir),
+                           on_result=lambda result: _record(result, "text", size))
+
+    def submit_document(self, source_file, template_path=DEFAULT_TEMPLATE, output_path=None, output_dir=None,
+                        source_name=None, **import_options):
+        """
+        Queue a Word/PDF import job. The source must be a path or bytes, since it is sent to another process.
+
+        Returns:
+            multiprocessing.pool.AsyncResult: Resolves to a GenerationResult
+        """
+        self.start()
+        source_type = source_extension(source_file, source_name).lstrip(".") or "unknown"
+        size = input_size(source_file)
+        return self._apply(
+            _run_document_job,
+            (source_file, template_path, output_path, output_dir, source_name, import_options),
+            on_result=lambda result: _record(result, source_type, size),
+        )
+
+    def map_documents(self, source_files, template_path=DEFAULT_TEMPLATE, output_dir=None):
+        """
+        Import many sources and wait for all of them.
+
+        Args:
+            source_files: Iterable of source paths
+            template_path (str): Path to the template document
+            output_dir (str): Directory for the generated documents
+
+        Returns:
+            list: GenerationResult for each source, in input order
+        """
+        pending = [self.submit_document(source, template_path, output_dir=output_dir) for source in source_files]
+        return [result.get() for result in pending]
+
+    def close(self):
+        """Stop accepting jobs and wait for the queued ones to finish."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            # Other pools still fork replacement workers from the frozen heap
+            if _discard_live(self):
+                gc.unfreeze()
+
+    def terminate(self):
+        """Stop the workers immediately, abandoning queued jobs."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            # Other pools still fork replacement workers from the frozen heap
+            if _discard_live(self):
+                gc.unfreeze()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()